@@ -1,57 +1,141 @@
-from flask import Flask, request, jsonify, g, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, g, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
 import os
+import hmac
+import json
+import time
+import hashlib
 import logging
+from services import registry, metrics, cosmos_instrumentation
 from services.cosmos_service import CosmosService
 from services.blob_service import BlobService
+from services.stats_service import StatsService
 from services.auth_service import AuthService
 from services.admin_service import AdminService
 from services.logic_app_service import LogicAppService
+from services.upload_session_service import UploadSessionService, UploadSessionError
+from services.password_hasher import ServiceBusyError
 from middleware.auth_middleware import token_required, role_required, admin_required, teacher_or_admin_required
-
-# Azure Application Insights
-from opencensus.ext.azure.log_exporter import AzureLogHandler
-from opencensus.ext.azure.trace_exporter import AzureExporter
-from opencensus.ext.flask.flask_middleware import FlaskMiddleware
-from opencensus.trace.samplers import ProbabilitySampler
-
-app = Flask(__name__, static_folder='static', static_url_path='')
-CORS(app, origins=[
-    "http://localhost:4200",  # Development
-])
-
-# Configure Azure Application Insights
-INSTRUMENTATION_KEY = os.getenv('APPINSIGHTS_INSTRUMENTATION_KEY')
-if INSTRUMENTATION_KEY:
-    # Add telemetry middleware
-    middleware = FlaskMiddleware(
+from middleware.compression import compressed, matching_etag
+from middleware.json_stream import stream_ndjson, stream_json_array
+from middleware.media import MEDIA_CORS_HEADERS, MEDIA_MAX_AGE, media_headers, not_modified, select_range
+
+api = Blueprint('api', __name__)
+
+# Services are built on first use and shared process-wide, so importing the app
+# (and serving /health) needs no network round trips
+cosmos_service = registry.lazy('cosmos', CosmosService)
+stats_service = registry.lazy('stats', StatsService)
+blob_service = registry.lazy('blob', lambda: BlobService(stats_service=stats_service))
+auth_service = registry.lazy('auth', AuthService)
+admin_service = registry.lazy('admin', AdminService)
+logic_app_service = registry.lazy('logic_app', LogicAppService)
+upload_session_service = registry.lazy('upload_session', lambda: UploadSessionService(stats_service=stats_service))
+
+def create_app():
+    """Build the Flask application
+    
+    Set EAGER_SERVICES=true to construct every service up front (e.g. in a
+    preloading gunicorn master, so workers inherit warm clients). With
+    DEFER_TELEMETRY=true Application Insights is left for configure_telemetry()
+    to attach in each worker after the fork.
+    """
+    started = time.perf_counter()
+    app = Flask(__name__, static_folder='static', static_url_path='')
+    CORS(app, origins=[
+        "http://localhost:4200",  # Development
+    ])
+    
+    # Configure Azure Application Insights
+    if os.getenv('DEFER_TELEMETRY', 'false').lower() != 'true':
+        configure_telemetry(app)
+    
+    app.register_blueprint(api)
+    app.before_request(_start_request_metrics)
+    app.after_request(_record_request_metrics)
+    app.teardown_request(_clear_request_metrics)
+    
+    if os.getenv('EAGER_SERVICES', 'false').lower() == 'true':
+        services_started = time.perf_counter()
+        registry.warm_up()
+        registry.record_startup('services', services_started)
+    
+    elapsed_ms = registry.record_startup('createApp', started)
+    app.logger.info(f"App created in {elapsed_ms} ms: {registry.startup_report()}")
+    return app
+
+def configure_telemetry(app):
+    """Attach Application Insights when APPINSIGHTS_INSTRUMENTATION_KEY is set
+
+    The exporters run on background threads, so call this in the process that
+    serves requests (gunicorn's post_worker_init when the app is preloaded).
+    """
+    instrumentation_key = os.getenv('APPINSIGHTS_INSTRUMENTATION_KEY')
+    if not instrumentation_key:
+        return
+    telemetry_started = time.perf_counter()
+    _configure_telemetry(app, instrumentation_key)
+    registry.record_startup('telemetry', telemetry_started)
+
+def _configure_telemetry(app, instrumentation_key):
+    """Attach Application Insights tracing and logging; imported here so cold starts without it skip opencensus"""
+    from opencensus.ext.azure.log_exporter import AzureLogHandler
+    from opencensus.ext.azure.trace_exporter import AzureExporter
+    from services import telemetry
+    
+    # Add telemetry middleware; requests are sampled per the TRACE_* settings and
+    # spans are exported in batches off the request thread
+    telemetry.instrument_flask(
         app,
-        exporter=AzureExporter(connection_string=f"InstrumentationKey={INSTRUMENTATION_KEY}"),
-        sampler=ProbabilitySampler(rate=1.0)
+        AzureExporter(connection_string=f"InstrumentationKey={instrumentation_key}"),
+        route_fn=_request_route
     )
     
     # Configure logging to Application Insights
     logger = logging.getLogger(__name__)
-    logger.addHandler(AzureLogHandler(connection_string=f"InstrumentationKey={INSTRUMENTATION_KEY}"))
+    logger.addHandler(AzureLogHandler(connection_string=f"InstrumentationKey={instrumentation_key}"))
     logger.setLevel(logging.INFO)
     
     app.logger.info("Application Insights configured successfully")
 
-# Initialize services
-cosmos_service = CosmosService()
-blob_service = BlobService()
-auth_service = AuthService()
-admin_service = AdminService()
-logic_app_service = LogicAppService()
+# REQUEST METRICS
+request_duration = metrics.histogram(
+    'peerview_http_request_duration_seconds', 'Time to produce a response, by route and status',
+    ('route', 'status'),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+def _request_route():
+    """The current request's method and URL rule, e.g. GET /v1/questions/<question_id>"""
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    return f"{request.method} {rule}"
+
+def _start_request_metrics():
+    """Label everything this request does (including Cosmos calls) with its route"""
+    g.request_started = time.perf_counter()
+    metrics.set_route(_request_route())
+
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        request_duration.observe(time.perf_counter() - started, metrics.current_route(), str(response.status_code))
+    return response
+
+def _clear_request_metrics(exc):
+    metrics.set_route(None)
 
 # HEALTH CHECK
-@app.route('/health', methods=['GET'])
+@api.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'service': 'PeerView API', 'version': '1.0'}), 200
 
 # AUTHENTICATION ENDPOINTS
-@app.route('/v1/auth/register', methods=['POST'])
+def _service_busy(e):
+    """503 with a Retry-After hint for work shed by a saturated pool"""
+    return jsonify({'error': str(e)}), 503, {'Retry-After': str(e.retry_after)}
+
+@api.route('/v1/auth/register', methods=['POST'])
 def register():
     """Register a new user account (student or teacher)"""
     try:
@@ -76,10 +160,12 @@ def register():
             'token': token
         }), 201
         
+    except ServiceBusyError as e:
+        return _service_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
-@app.route('/v1/auth/login', methods=['POST'])
+@api.route('/v1/auth/login', methods=['POST'])
 def login():
     """Authenticate user and return JWT token"""
     try:
@@ -97,10 +183,12 @@ def login():
             'token': token
         }), 200
         
+    except ServiceBusyError as e:
+        return _service_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 401
 
-@app.route('/v1/users/me', methods=['GET'])
+@api.route('/v1/users/me', methods=['GET'])
 @token_required
 def get_current_user():
     """Get current user's profile"""
@@ -115,7 +203,7 @@ def get_current_user():
         return jsonify({'error': str(e)}), 500
 
 # MEDIA ENDPOINTS
-@app.route('/v1/media/upload-url', methods=['POST'])
+@api.route('/v1/media/upload-url', methods=['POST'])
 @token_required
 def generate_upload_url():
     """Generate SAS URL for direct upload to Azure Blob Storage"""
@@ -133,56 +221,210 @@ def generate_upload_url():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# RESUMABLE UPLOAD ENDPOINTS
+@api.route('/v1/uploads', methods=['POST'])
+@token_required
+def create_upload_session():
+    """Start a resumable upload for a large media file"""
+    try:
+        data = request.json
+        file_name = data.get('fileName')
+        size = data.get('size')
+        
+        if not file_name or not isinstance(size, int):
+            return jsonify({'error': 'fileName and size required'}), 400
+        
+        upload = upload_session_service.create_session(g.current_user_id, file_name, size)
+        return jsonify(upload), 201
+        
+    except UploadSessionError as e:
+        return _upload_error(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/v1/uploads/<upload_id>', methods=['GET'])
+@token_required
+def get_upload_session(upload_id):
+    """Get the offset an interrupted upload should resume from"""
+    try:
+        upload = upload_session_service.get_session(upload_id, g.current_user_id)
+        return jsonify(upload), 200
+        
+    except UploadSessionError as e:
+        return _upload_error(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/v1/uploads/<upload_id>', methods=['PUT'])
+@token_required
+def put_upload_chunk(upload_id):
+    """Upload the next chunk; the raw body starts at the Upload-Offset header (or ?offset=)"""
+    try:
+        offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+        if offset is None or not offset.isdigit():
+            return jsonify({'error': 'Upload-Offset header required'}), 400
+        
+        # Only read bodies of a known, bounded size
+        if request.content_length is None:
+            return jsonify({'error': 'Content-Length header required'}), 411
+        if request.content_length > upload_session_service.max_chunk_size:
+            return jsonify({'error': f'Chunk exceeds {upload_session_service.max_chunk_size} bytes'}), 413
+        
+        upload = upload_session_service.put_chunk(upload_id, g.current_user_id, int(offset), request.get_data())
+        return jsonify(upload), 200
+        
+    except UploadSessionError as e:
+        return _upload_error(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/v1/uploads/<upload_id>/complete', methods=['POST'])
+@token_required
+def complete_upload(upload_id):
+    """Assemble the uploaded chunks into the final media file"""
+    try:
+        result = upload_session_service.complete(upload_id, g.current_user_id)
+        return jsonify(result), 200
+        
+    except UploadSessionError as e:
+        return _upload_error(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _upload_error(e):
+    body = {'error': str(e)}
+    if e.offset is not None:
+        body['offset'] = e.offset
+    return jsonify(body), e.status_code
+
 # QUESTIONS ENDPOINTS
-@app.route('/v1/questions', methods=['GET'])
+@api.route('/v1/questions', methods=['GET'])
+@compressed
 @token_required
 def get_questions():
-    """Get questions feed with pagination"""
+    """Get questions feed with pagination
+    
+    Passing a `cursor` query parameter (empty for the first page) switches to
+    keyset pagination and returns {items, nextCursor}; `page`/`limit` keep the
+    original array response for older clients.
+    """
     try:
-        page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 20))
         
-        questions = cosmos_service.get_questions_paginated(page, limit)
-        return jsonify(questions), 200
+        if 'cursor' in request.args:
+            if limit < 1 or limit > 100:
+                return jsonify({'error': 'limit must be between 1 and 100'}), 400
+            questions, next_cursor = cosmos_service.get_questions_by_cursor(request.args.get('cursor') or None, limit)
+            questions = _expand_requested(questions)
+            return _conditional_json({'items': questions, 'nextCursor': next_cursor}, questions)
+        
+        page = int(request.args.get('page', 1))
+        questions = _expand_requested(cosmos_service.get_questions_paginated(page, limit))
+        return _conditional_json(questions, questions)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Legacy endpoint for backward compatibility
-@app.route('/api/feed', methods=['GET'])
+@api.route('/api/feed', methods=['GET'])
+@compressed
 def get_feed():
-    """Get all questions with embedded answers for the feed (legacy)"""
+    """Get all questions with embedded answers for the feed (legacy)
+    
+    `?stream=ndjson` (or `Accept: application/x-ndjson`) streams one question per
+    line and `?stream=json` streams a chunked JSON array, pulling Cosmos pages
+    lazily so server memory stays flat regardless of feed size.
+    """
     try:
-        questions = cosmos_service.get_questions()
-        return jsonify(questions), 200
+        stream_mode = request.args.get('stream')
+        if not stream_mode and request.accept_mimetypes.best == 'application/x-ndjson':
+            stream_mode = 'ndjson'
+        if stream_mode == 'ndjson':
+            return Response(stream_with_context(stream_ndjson(cosmos_service.iter_questions())),
+                            mimetype='application/x-ndjson')
+        if stream_mode == 'json':
+            return Response(stream_with_context(stream_json_array(cosmos_service.iter_questions())),
+                            mimetype='application/json')
+        
+        questions = _expand_requested(cosmos_service.get_questions())
+        return _conditional_json(questions, questions, private=False)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/questions/<question_id>', methods=['GET'])
+def _conditional_json(payload, documents, private=True):
+    """JSON response with a strong ETag for documents, or 304 when If-None-Match already has it
+    
+    Feeds are polled constantly and rarely change, so `no-cache` lets browsers keep
+    the body and revalidate each time instead of downloading it again.
+    """
+    etag = _documents_etag(documents, request.full_path)
+    matched = matching_etag(etag)
+    response = Response(status=304) if matched else jsonify(payload)
+    response.set_etag(matched or etag)
+    response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return response
+
+def _documents_etag(documents, *variant):
+    """Digest of the documents' Cosmos _etags, any expanded author names and the variant (e.g. query string)"""
+    digest = hashlib.sha256()
+    for part in variant:
+        digest.update(f"{part}\0".encode('utf-8'))
+    for document in documents:
+        digest.update(f"{document.get('_etag') or json.dumps(document, sort_keys=True, default=str)}\0".encode('utf-8'))
+        # Author names come from the Users container, so a rename changes the representation too
+        for item in [document] + (document.get('answers') or []):
+            if 'authorName' in item:
+                digest.update(f"{item['authorName']}\0".encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+def _expand_requested(questions):
+    """Apply `?expand=authors`, attaching author display names with one batched user lookup"""
+    if 'authors' not in request.args.get('expand', '').split(','):
+        return questions
+    
+    user_ids = []
+    for question in questions:
+        user_ids.append(question.get('userId'))
+        user_ids.extend(answer.get('userId') for answer in question.get('answers') or [])
+    users = auth_service.get_users_by_ids(user_ids)
+    
+    for question in questions:
+        for item in [question] + (question.get('answers') or []):
+            author = users.get(item.get('userId'))
+            item['authorName'] = author.full_name if author else None
+    return questions
+
+@api.route('/v1/questions/<question_id>', methods=['GET'])
+@compressed
 @token_required
 def get_question_v1(question_id):
     """Get a specific question by ID"""
     try:
         question = cosmos_service.get_question(question_id)
         if question:
-            return jsonify(question), 200
+            question = _expand_requested([question])[0]
+            return _conditional_json(question, [question])
         return jsonify({'error': 'Question not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Legacy endpoint
-@app.route('/api/questions/<question_id>', methods=['GET'])
+@api.route('/api/questions/<question_id>', methods=['GET'])
+@compressed
 def get_question(question_id):
     """Get a specific question by ID (legacy)"""
     try:
         question = cosmos_service.get_question(question_id)
         if question:
-            return jsonify(question), 200
+            question = _expand_requested([question])[0]
+            return _conditional_json(question, [question], private=False)
         return jsonify({'error': 'Question not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/questions', methods=['POST'])
+@api.route('/v1/questions', methods=['POST'])
 @token_required
 @role_required(['student', 'teacher', 'admin'])
 def create_question_v1():
@@ -209,7 +451,7 @@ def create_question_v1():
         return jsonify({'error': str(e)}), 500
 
 # Legacy endpoint
-@app.route('/api/questions', methods=['POST'])
+@api.route('/api/questions', methods=['POST'])
 def create_question():
     """Create a new question (legacy)"""
     try:
@@ -228,7 +470,7 @@ def create_question():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/questions/<question_id>/answers', methods=['POST'])
+@api.route('/v1/questions/<question_id>/answers', methods=['POST'])
 @token_required
 @teacher_or_admin_required
 def create_answer_v1(question_id):
@@ -253,7 +495,7 @@ def create_answer_v1(question_id):
         return jsonify({'error': str(e)}), 500
 
 # Legacy endpoint
-@app.route('/api/questions/<question_id>/answers', methods=['POST'])
+@api.route('/api/questions/<question_id>/answers', methods=['POST'])
 def create_answer(question_id):
     """Add an answer to a question (legacy)"""
     try:
@@ -273,7 +515,7 @@ def create_answer(question_id):
         return jsonify({'error': str(e)}), 500
 
 # QUESTION MANAGEMENT
-@app.route('/v1/questions/<question_id>', methods=['PUT'])
+@api.route('/v1/questions/<question_id>', methods=['PUT'])
 @token_required
 def update_question(question_id):
     """Update a question (Users can update own; Admins can update any)"""
@@ -295,7 +537,7 @@ def update_question(question_id):
         if not all([title, caption]):
             return jsonify({'error': 'Title and caption are required'}), 400
         
-        updated_question = cosmos_service.update_question(question_id, title, caption, media_url, media_type)
+        updated_question = cosmos_service.update_question(question_id, title, caption, media_url, media_type, question=question)
         if updated_question:
             return jsonify(updated_question), 200
         return jsonify({'error': 'Failed to update question'}), 500
@@ -303,7 +545,7 @@ def update_question(question_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/questions/<question_id>', methods=['DELETE'])
+@api.route('/v1/questions/<question_id>', methods=['DELETE'])
 @token_required
 def delete_question(question_id):
     """Delete a question (Students can delete own; Admins can delete any)"""
@@ -316,7 +558,7 @@ def delete_question(question_id):
         if g.current_user_role != 'admin' and question['userId'] != g.current_user_id:
             return jsonify({'error': 'Permission denied'}), 403
         
-        success = cosmos_service.delete_question(question_id)
+        success = cosmos_service.delete_question(question_id, question=question)
         if success:
             return jsonify({'message': 'Question deleted successfully'}), 200
         return jsonify({'error': 'Failed to delete question'}), 500
@@ -325,7 +567,7 @@ def delete_question(question_id):
         return jsonify({'error': str(e)}), 500
 
 # ANSWER MANAGEMENT
-@app.route('/v1/answers/<answer_id>', methods=['PUT'])
+@api.route('/v1/answers/<answer_id>', methods=['PUT'])
 @token_required
 @teacher_or_admin_required
 def update_answer(answer_id):
@@ -346,7 +588,7 @@ def update_answer(answer_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/answers/<answer_id>', methods=['DELETE'])
+@api.route('/v1/answers/<answer_id>', methods=['DELETE'])
 @token_required
 @teacher_or_admin_required
 def delete_answer(answer_id):
@@ -361,7 +603,7 @@ def delete_answer(answer_id):
         return jsonify({'error': str(e)}), 500
 
 # ADMINISTRATION ENDPOINTS
-@app.route('/v1/admin/stats', methods=['GET'])
+@api.route('/v1/admin/stats', methods=['GET'])
 @token_required
 @admin_required
 def get_admin_stats():
@@ -370,10 +612,60 @@ def get_admin_stats():
         stats = admin_service.get_system_stats()
         return jsonify(stats), 200
         
+    except ServiceBusyError as e:
+        return _service_busy(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/v1/admin/stats/reconcile', methods=['POST'])
+@token_required
+@admin_required
+def reconcile_admin_stats():
+    """Recompute system statistics from source data (Admin only)"""
+    try:
+        admin_service.reconcile_stats()
+        stats = admin_service.get_system_stats()
+        return jsonify(stats), 200
+        
+    except ServiceBusyError as e:
+        return _service_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/admin/moderation', methods=['POST'])
+@api.route('/v1/admin/runtime', methods=['GET'])
+@token_required
+@admin_required
+def get_runtime_stats():
+    """Get in-process cache and worker statistics for this instance (Admin only)"""
+    try:
+        return jsonify({
+            'startup': registry.startup_report(),
+            'questionCache': cosmos_service.question_cache.stats(),
+            'jwtCache': auth_service.token_cache.stats(),
+            'userCache': auth_service.user_cache.stats(),
+            'passwordHasher': auth_service.password_hasher.stats(),
+            'mediaCache': blob_service.media_cache.stats() if blob_service.media_cache else None,
+            'logicAppDispatcher': logic_app_service.get_dispatcher_stats(),
+            'slowCosmosOperations': cosmos_instrumentation.slow_operations(),
+            'telemetry': current_app.extensions['telemetry'].stats() if 'telemetry' in current_app.extensions else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for the server (every worker, see METRICS_DIR): request latency, and Cosmos RU, latency and pages per route and query"""
+    metrics_token = os.getenv('METRICS_TOKEN')
+    # Off unless a token is configured: the series expose per-route and per-query costs
+    if not metrics_token:
+        return jsonify({'error': 'Not found'}), 404
+    authorization = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(authorization.encode('utf-8'), f'Bearer {metrics_token}'.encode('utf-8')):
+        return jsonify({'error': 'Invalid metrics token'}), 401
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/v1/admin/moderation', methods=['POST'])
 @token_required
 @admin_required
 def moderate_content():
@@ -393,7 +685,7 @@ def moderate_content():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/admin/flagged-content', methods=['GET'])
+@api.route('/v1/admin/flagged-content', methods=['GET'])
 @token_required
 @admin_required
 def get_flagged_content():
@@ -402,10 +694,12 @@ def get_flagged_content():
         flagged_content = admin_service.get_flagged_content()
         return jsonify(flagged_content), 200
         
+    except ServiceBusyError as e:
+        return _service_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/admin/users', methods=['GET'])
+@api.route('/v1/admin/users', methods=['GET'])
 @token_required
 @admin_required
 def get_all_users():
@@ -420,7 +714,31 @@ def get_all_users():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/v1/admin/users/<user_id>/activity', methods=['GET'])
+@api.route('/v1/admin/users/email-index', methods=['POST'])
+@token_required
+@admin_required
+def backfill_email_index():
+    """Index the email of every existing user for point-read logins (Admin only)"""
+    try:
+        indexed = auth_service.backfill_email_index()
+        return jsonify({'indexed': indexed}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/v1/admin/uploads/sweep', methods=['POST'])
+@token_required
+@admin_required
+def sweep_upload_sessions():
+    """Delete expired resumable upload sessions and their staged chunks (Admin only)"""
+    try:
+        removed = upload_session_service.sweep_expired()
+        return jsonify({'removed': removed}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/v1/admin/users/<user_id>/activity', methods=['GET'])
 @token_required
 @admin_required
 def get_user_activity(user_id):
@@ -429,11 +747,13 @@ def get_user_activity(user_id):
         activity = admin_service.get_user_activity(user_id)
         return jsonify(activity), 200
         
+    except ServiceBusyError as e:
+        return _service_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Legacy upload endpoint
-@app.route('/api/upload', methods=['POST'])
+@api.route('/api/upload', methods=['POST'])
 def upload_media():
     """Upload media file to Azure Blob Storage (legacy)"""
     try:
@@ -450,32 +770,74 @@ def upload_media():
         return jsonify({'error': str(e)}), 500
 
 # Media proxy endpoint
-@app.route('/api/media/<blob_name>', methods=['GET'])
+@api.route('/api/media/<blob_name>', methods=['GET'])
 def serve_media(blob_name):
-    """Serve media files from Azure Blob Storage"""
+    """Serve media files from Azure Blob Storage
+    
+    Blobs are served from the local disk cache when present (sendfile, with Range
+    and conditional GET handled by send_file). Otherwise single byte ranges (and
+    If-Range) get 206 responses backed by ranged blob downloads and the body is
+    streamed instead of buffered. A response covering the whole blob is teed into
+    the cache as it streams; a partial range warms it with a background fill.
+    """
+    cached = blob_service.get_cached_media(blob_name)
+    if cached:
+        try:
+            response = send_file(
+                cached['path'],
+                mimetype=cached['content_type'],
+                conditional=True,
+                etag=cached['etag'].strip('"'),
+                last_modified=cached['last_modified'],
+                max_age=MEDIA_MAX_AGE
+            )
+            response.headers.update(MEDIA_CORS_HEADERS)
+            return response
+        except OSError:
+            # Evicted by another worker since the lookup; serve it from storage instead
+            pass
+    
     try:
-        blob_data = blob_service.get_blob_data(blob_name)
-        
-        from flask import Response
-        return Response(
-            blob_data['data'],
-            mimetype=blob_data['content_type'],
-            headers={
-                'Content-Length': blob_data['content_length'],
-                'Cache-Control': 'public, max-age=31536000',  # Cache for 1 year
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            }
-        )
-        
+        media = blob_service.get_media_properties(blob_name)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+    
+    headers = media_headers(media)
+    if not_modified(request, media):
+        return Response(status=304, headers=headers)
+    
+    selected = select_range(request, media, headers)
+    if selected is None:
+        return Response(status=416, headers=headers)
+    start, stop, status = selected
+    
+    whole_blob = start == 0 and stop == media['content_length']
+    if not whole_blob:
+        # A partial range cannot fill the cache on its way through
+        blob_service.cache_media(blob_name, media)
+    if stop == start or request.method == 'HEAD':
+        return Response(status=status, mimetype=media['content_type'], headers=headers)
+    
+    try:
+        length = None if status == 200 else stop - start
+        chunks = blob_service.download_range(blob_name, start, length, etag=media['etag'])
     except Exception as e:
         return jsonify({'error': str(e)}), 404
+    if whole_blob:
+        chunks = blob_service.tee_media(blob_name, media, chunks)
+    
+    return Response(
+        stream_with_context(chunks),
+        status=status,
+        mimetype=media['content_type'],
+        headers=headers,
+        direct_passthrough=True
+    )
 
 
 
 # Debug endpoint to check media URLs
-@app.route('/api/debug/media-urls', methods=['GET'])
+@api.route('/api/debug/media-urls', methods=['GET'])
 def debug_media_urls():
     """Debug endpoint to check all media URLs in questions"""
     try:
@@ -501,12 +863,12 @@ def debug_media_urls():
         return jsonify({'error': str(e)}), 500
 
 # ANGULAR FRONTEND ROUTES (MUST BE LAST)
-@app.route('/')
+@api.route('/')
 def serve_index():
     """Serve Angular index.html at root"""
-    return app.send_static_file('index.html')
+    return current_app.send_static_file('index.html')
 
-@app.route('/<path:path>')
+@api.route('/<path:path>')
 def serve_angular(path):
     """Serve Angular frontend for all non-API routes"""
     # API routes should return 404 if not found
@@ -515,10 +877,12 @@ def serve_angular(path):
     
     # Try to serve static file if it exists (JS, CSS, images)
     try:
-        return app.send_static_file(path)
+        return current_app.send_static_file(path)
     except:
         # Otherwise serve index.html for Angular routing
-        return app.send_static_file('index.html')
+        return current_app.send_static_file('index.html')
+
+app = create_app()
 
 if __name__ == '__main__':
     # For local development
@@ -0,0 +1,211 @@
+"""
+Async (ASGI) variant of the read-heavy PeerView API
+Serves the feed, question detail, media proxy and admin stats on an event loop
+with the aio Cosmos and Blob SDKs, so one worker can hold thousands of requests
+in flight while they wait on Azure. Everything else stays on the Flask app in
+app.py; both read the same containers and, on one host, the same on-disk media
+cache (MEDIA_CACHE_DIR).
+
+This is a separate process, so writes made through app.py never invalidate its
+question cache: a question read here can be up to
+ASYNC_QUESTION_CACHE_TTL_SECONDS (default 5) behind.
+
+Run with: hypercorn async_app:app --bind 0.0.0.0:8001
+"""
+
+import os
+import asyncio
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+from services.admin_service import AdminService
+from services.async_blob_service import AsyncBlobService
+from services.async_clients import close_transports
+from services.async_cosmos_service import AsyncCosmosService
+from services.password_hasher import ServiceBusyError
+from middleware.async_auth_middleware import token_required, admin_required
+from middleware.json_stream import astream_ndjson, astream_json_array
+from middleware.media import media_headers, not_modified, select_range
+
+app = Quart(__name__)
+app = cors(app, allow_origin=[
+    "http://localhost:4200",  # Development
+])
+
+cosmos_service = AsyncCosmosService()
+blob_service = AsyncBlobService()
+
+# Reconciling stats fans out to many queries; it is rare enough to run on a
+# thread with the synchronous service, built on first use
+_admin_service = None
+
+@app.before_serving
+async def open_clients():
+    await cosmos_service.open()
+    await blob_service.open()
+
+@app.after_serving
+async def close_clients():
+    await cosmos_service.close()
+    await blob_service.close()
+    await close_transports()
+
+# HEALTH CHECK
+@app.route('/health', methods=['GET'])
+async def health_check():
+    return jsonify({'status': 'healthy', 'service': 'PeerView API (async)', 'version': '1.0'}), 200
+
+# QUESTION ENDPOINTS
+@app.route('/v1/questions', methods=['GET'])
+@token_required
+async def get_questions():
+    """Get questions feed with pagination (`cursor` switches to keyset pagination)"""
+    try:
+        limit = int(request.args.get('limit', 20))
+
+        if 'cursor' in request.args:
+            if limit < 1 or limit > 100:
+                return jsonify({'error': 'limit must be between 1 and 100'}), 400
+            questions, next_cursor = await cosmos_service.get_questions_by_cursor(request.args.get('cursor') or None, limit)
+            return jsonify({'items': questions, 'nextCursor': next_cursor}), 200
+
+        page = int(request.args.get('page', 1))
+        questions = await cosmos_service.get_questions_paginated(page, limit)
+        return jsonify(questions), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/feed', methods=['GET'])
+async def get_feed():
+    """Get all questions with embedded answers for the feed (legacy), optionally streamed"""
+    try:
+        stream_mode = request.args.get('stream')
+        if not stream_mode and request.accept_mimetypes.best == 'application/x-ndjson':
+            stream_mode = 'ndjson'
+        if stream_mode == 'ndjson':
+            return Response(astream_ndjson(cosmos_service.iter_questions()), mimetype='application/x-ndjson')
+        if stream_mode == 'json':
+            return Response(astream_json_array(cosmos_service.iter_questions()), mimetype='application/json')
+
+        questions = await cosmos_service.get_questions()
+        return jsonify(questions), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/v1/questions/<question_id>', methods=['GET'])
+@token_required
+async def get_question_v1(question_id):
+    """Get a specific question by ID"""
+    return await _get_question(question_id)
+
+@app.route('/api/questions/<question_id>', methods=['GET'])
+async def get_question(question_id):
+    """Get a specific question by ID (legacy)"""
+    return await _get_question(question_id)
+
+async def _get_question(question_id):
+    try:
+        question = await cosmos_service.get_question(question_id)
+        if question:
+            return jsonify(question), 200
+        return jsonify({'error': 'Question not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ADMIN ENDPOINTS
+@app.route('/v1/admin/stats', methods=['GET'])
+@token_required
+@admin_required
+async def get_admin_stats():
+    """Get system statistics (Admin only)"""
+    try:
+        stats = await cosmos_service.get_stats()
+        if stats is None:
+            stats = await asyncio.to_thread(_reconcile_stats)
+        return jsonify(AdminService.format_system_stats(stats)), 200
+
+    except ServiceBusyError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(e.retry_after)}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _reconcile_stats():
+    global _admin_service
+    if _admin_service is None:
+        _admin_service = AdminService()
+    return _admin_service.reconcile_stats()
+
+# MEDIA ENDPOINTS
+@app.route('/api/media/<blob_name>', methods=['GET'])
+async def serve_media(blob_name):
+    """Serve media files from Azure Blob Storage, with the same caching and Range rules as app.py
+    
+    Cached copies are read from local disk on a worker thread so the event loop
+    never blocks on file I/O.
+    """
+    cached = blob_service.get_cached_media(blob_name)
+    media = cached
+    if not media:
+        try:
+            media = await blob_service.get_media_properties(blob_name)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 404
+
+    headers = media_headers(media)
+    if not_modified(request, media):
+        return _headers_only(304, headers)
+
+    if not cached:
+        blob_service.cache_media(blob_name, media)
+
+    selected = select_range(request, media, headers)
+    if selected is None:
+        return _headers_only(416, headers)
+    start, stop, status = selected
+
+    if stop == start or request.method == 'HEAD':
+        return _headers_only(status, headers, media['content_type'])
+
+    chunks = None
+    if cached:
+        try:
+            chunks = _read_file(await asyncio.to_thread(open, cached['path'], 'rb'), start, stop)
+        except OSError:
+            # Evicted by another worker since the lookup; serve it from storage instead
+            pass
+    if chunks is None:
+        try:
+            length = None if status == 200 else stop - start
+            chunks = await blob_service.download_range(blob_name, start, length, etag=media['etag'])
+        except Exception as e:
+            return jsonify({'error': str(e)}), 404
+
+    return Response(chunks, status=status, mimetype=media['content_type'], headers=headers)
+
+MEDIA_FILE_CHUNK_SIZE = 256 * 1024
+
+async def _read_file(f, start, stop):
+    """Yield bytes [start, stop) of an open file, reading off the event loop"""
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = stop - start
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(MEDIA_FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+def _headers_only(status, headers, mimetype=None):
+    """Bodyless response that keeps the Content-Length we computed for the entity"""
+    response = Response(b'', status=status, mimetype=mimetype)
+    response.headers.update(headers)
+    return response
+
+if __name__ == '__main__':
+    # For local development
+    app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5002)))
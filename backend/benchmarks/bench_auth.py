@@ -0,0 +1,64 @@
+"""
+Per-request JWT verification cost, uncached vs. the verified-token cache
+
+Usage (from backend/): python -m benchmarks.bench_auth [--requests N] [--tokens N]
+
+Replays N requests spread over a pool of distinct tokens, the way a handful of
+users polling the feed would, and reports the mean and p99 cost of the auth step.
+"""
+
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import jwt
+
+from services.auth_service import TokenService, token_cache
+
+
+def make_tokens(service: TokenService, count: int) -> list:
+    expires = datetime.utcnow() + timedelta(hours=service.jwt_expiration_hours)
+    return [
+        jwt.encode(
+            {'user_id': f'user-{i}', 'email': f'user{i}@example.com', 'role': 'student', 'exp': expires},
+            service.jwt_secret,
+            algorithm=service.jwt_algorithm
+        )
+        for i in range(count)
+    ]
+
+
+def run(verify, tokens: list, requests: int) -> list:
+    timings = []
+    for i in range(requests):
+        token = tokens[i % len(tokens)]
+        start = time.perf_counter()
+        verify(token)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label: str, timings: list) -> None:
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{label:<10} mean {statistics.mean(timings) * 1e6:8.2f} us   p99 {p99 * 1e6:8.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--tokens', type=int, default=50)
+    args = parser.parse_args()
+
+    service = TokenService()
+    tokens = make_tokens(service, args.tokens)
+
+    report('uncached', run(service.verify_jwt_token, tokens, args.requests))
+    token_cache.clear()
+    report('cached', run(service.verify_jwt_token_cached, tokens, args.requests))
+    print(f"cache      {token_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
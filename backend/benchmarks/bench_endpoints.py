@@ -0,0 +1,397 @@
+"""
+Endpoint load benchmark for app.py against in-memory Cosmos and Blob stand-ins
+
+Usage (from backend/):
+    python -m benchmarks.bench_endpoints
+    python -m benchmarks.bench_endpoints --questions 2000 --cosmos-latency-ms 8 --concurrency 32
+    python -m benchmarks.bench_endpoints --endpoint feed --endpoint login --json before.json
+
+Seeds --questions questions with --answers answers each, --users-per-role users
+per role and --media-files blobs of --media-bytes, then serves the real Flask app on a local
+threaded server with the Azure clients replaced by the stand-ins in
+benchmarks.fakes, which sleep for the configured latency on every call. Logic
+App events go to a local stub with the same latency. Each endpoint gets
+--requests requests from --concurrency client threads, and p50/p95/p99 latency,
+throughput, non-2xx responses, Cosmos RU per request (from the stand-ins' approximate
+charges) and the process's peak RSS are reported per endpoint.
+
+--telemetry traces requests the way app.py does with Application Insights, with
+a stub exporter that costs --telemetry-latency-ms per export call: "inline" is
+the old every-request synchronous export, the other modes use services.telemetry
+sampling and background batching. Compare against "off" to measure overhead.
+
+The load generator shares the process (and GIL) with the server, so absolute
+numbers understate a real deployment; compare runs made on the same machine.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import tempfile
+import argparse
+import threading
+import resource
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from benchmarks.fakes import Latency, FakeCosmosClient, FakeBlobServiceClient, StubTraceExporter
+
+ENDPOINTS = ('feed', 'questions', 'question', 'answer', 'media', 'stats', 'login')
+TELEMETRY_MODES = ('off', 'inline', 'probability', 'rate_limited', 'tail')
+PASSWORD = 'benchmark-password'
+DATABASE_NAME = 'peerview-bench'
+QUESTIONS_CONTAINER = 'Questions'
+BLOB_CONTAINER = 'media'
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def current_rss_bytes() -> int:
+    """Resident set size now, or the peak so far where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    """Tracks the highest RSS seen while a block runs"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_bytes())
+
+
+def configure_environment(args) -> None:
+    """Settings that services read at import time, so this runs before app is imported"""
+    workdir = tempfile.mkdtemp(prefix='peerview-bench-')
+    os.environ.update({
+        'AZURE_COSMOS_DB_NAME': DATABASE_NAME,
+        'AZURE_COSMOS_CONTAINER_NAME': QUESTIONS_CONTAINER,
+        'AZURE_BLOB_CONTAINER_NAME': BLOB_CONTAINER,
+        'APPINSIGHTS_INSTRUMENTATION_KEY': '',
+        'EAGER_SERVICES': 'false',
+        'BCRYPT_ROUNDS': str(args.bcrypt_rounds),
+        'LOGIC_APP_SPOOL_PATH': os.path.join(workdir, 'logic-app-spool.db'),
+        'MEDIA_CACHE_DIR': os.path.join(workdir, 'media-cache'),
+        'MEDIA_CACHE_MAX_BYTES': str(args.media_cache_bytes)
+    })
+    if args.telemetry not in ('off', 'inline'):
+        os.environ['TRACE_SAMPLING_MODE'] = args.telemetry
+        if args.trace_sample_rate is not None:
+            os.environ['TRACE_SAMPLE_RATE'] = str(args.trace_sample_rate)
+
+
+def serve(wsgi_app):
+    """Serve a WSGI app on an ephemeral local port in a background thread; returns (server, base_url)"""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, wsgi_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def logic_app_stub(latency: Latency):
+    """Minimal webhook that accepts every event after the configured latency"""
+    def app(environ, start_response):
+        environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+        latency.wait()
+        start_response('202 Accepted', [('Content-Length', '0')])
+        return [b'']
+    return app
+
+
+def seed(args, cosmos: FakeCosmosClient, blobs: FakeBlobServiceClient, password_hash: str) -> dict:
+    """Load users, questions, media and the stats document; returns what the request builders need"""
+    from services.stats_service import STATS_CONTAINER_NAME, STATS_DOCUMENT_ID
+    from services.auth_service import EMAIL_INDEX_MARKER_ID, AuthService
+
+    database = cosmos.get_database_client(DATABASE_NAME)
+    now = datetime.utcnow()
+
+    users = {}
+    user_docs = [{"id": EMAIL_INDEX_MARKER_ID, "backfilledAt": now.isoformat()}]
+    for role in ('student', 'teacher', 'admin'):
+        for i in range(args.users_per_role):
+            user_id = str(uuid.uuid4())
+            email = f"{role}{i}@bench.peerview"
+            users.setdefault(role, []).append(email)
+            user_docs.append({
+                "id": user_id,
+                "email": email,
+                "passwordHash": password_hash,
+                "fullName": f"Bench {role.title()} {i}",
+                "role": role,
+                "createdAt": now.isoformat(),
+                "isActive": True
+            })
+            user_docs.append({"id": AuthService._email_index_id(email), "indexedEmail": email, "userId": user_id})
+    database.get_container_client('Users').seed(user_docs)
+    author_ids = [doc["id"] for doc in user_docs if doc.get("role") == 'student']
+    teacher_ids = [doc["id"] for doc in user_docs if doc.get("role") == 'teacher']
+
+    media_names = [f"bench-{i}.jpg" for i in range(args.media_files)]
+    payload = os.urandom(args.media_bytes)
+    for name in media_names:
+        blobs.put(BLOB_CONTAINER, name, payload, 'image/jpeg')
+
+    questions = []
+    for i in range(args.questions):
+        question_id = str(uuid.uuid4())
+        timestamp = (now - timedelta(minutes=i)).isoformat()
+        answers = [
+            {
+                "answerId": f"{question_id}.{uuid.uuid4()}",
+                "userId": random.choice(teacher_ids),
+                "mediaUrl": None,
+                "textResponse": f"Benchmark answer {j} " + "lorem ipsum " * 20,
+                "timestamp": timestamp
+            }
+            for j in range(args.answers)
+        ]
+        questions.append({
+            "id": question_id,
+            "userId": random.choice(author_ids),
+            "title": f"Benchmark question {i}",
+            "mediaUrl": f"/api/media/{random.choice(media_names)}" if media_names else None,
+            "mediaType": "image",
+            "caption": "lorem ipsum " * 10,
+            "timestamp": timestamp,
+            "status": "answered" if answers else "pending",
+            "answers": answers
+        })
+    database.get_container_client(QUESTIONS_CONTAINER).seed(questions)
+
+    answered = sum(1 for question in questions if question["answers"])
+    database.get_container_client(STATS_CONTAINER_NAME).seed([{
+        "id": STATS_DOCUMENT_ID,
+        "totalUsers": 3 * args.users_per_role,
+        "totalQuestions": len(questions),
+        "totalAnswers": len(questions) * args.answers,
+        "answeredQuestions": answered,
+        "pendingQuestions": len(questions) - answered,
+        "storageBytes": len(media_names) * args.media_bytes,
+        "questionsByDay": {now.date().isoformat(): len(questions)},
+        "reconciledAt": now.isoformat()
+    }])
+
+    return {
+        "users": users,
+        "question_ids": [question["id"] for question in questions],
+        "media_names": media_names
+    }
+
+
+def login(base_url: str, email: str) -> str:
+    response = requests.post(f"{base_url}/v1/auth/login", json={"email": email, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+def request_builders(data: dict, tokens: dict) -> dict:
+    """Endpoint name -> function returning (method, path, kwargs) for one request"""
+    def bearer(role):
+        return {'Authorization': f"Bearer {tokens[role]}"}
+
+    question_ids = data["question_ids"]
+    return {
+        'feed': lambda: ('GET', '/api/feed', {}),
+        'questions': lambda: ('GET', f"/v1/questions?page={random.randint(1, 5)}&limit=20", {'headers': bearer('student')}),
+        'question': lambda: ('GET', f"/v1/questions/{random.choice(question_ids)}", {'headers': bearer('student')}),
+        'answer': lambda: ('POST', f"/v1/questions/{random.choice(question_ids)}/answers", {
+            'headers': bearer('teacher'),
+            'json': {'textResponse': 'Benchmark answer ' + 'lorem ipsum ' * 20}
+        }),
+        'media': lambda: ('GET', f"/api/media/{random.choice(data['media_names'])}", {}),
+        'stats': lambda: ('GET', '/v1/admin/stats', {'headers': bearer('admin')}),
+        'login': lambda: ('POST', '/v1/auth/login', {
+            'json': {'email': random.choice(data["users"]["student"]), 'password': PASSWORD}
+        })
+    }
+
+
+def drive(base_url: str, build, total: int, concurrency: int) -> dict:
+    """Issue total requests from concurrency threads and collect latencies and statuses"""
+    local = threading.local()
+    lock = threading.Lock()
+    latencies = []
+    statuses = Counter()
+    remaining = [total]
+
+    def worker():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            method, path, kwargs = build()
+            start = time.perf_counter()
+            try:
+                response = local.session.request(method, base_url + path, **kwargs)
+                response.content
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if not (isinstance(status, int) and 200 <= status < 300)),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50Ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95Ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99Ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "statuses": {str(status): count for status, count in statuses.items()}
+    }
+
+
+def print_table(results: dict) -> None:
+    print(f"{'endpoint':<10} {'requests':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RU/req':>8} {'peak RSS MB':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:<10} {result['requests']:>8} {result['errors']:>7} {result['throughput']:>9.1f} "
+            f"{result['p50Ms']:>8.1f} {result['p95Ms']:>8.1f} {result['p99Ms']:>8.1f} {result['ruPerRequest']:>8.2f} "
+            f"{result['peakRssBytes'] / (1024 * 1024):>12.1f}"
+        )
+
+
+def run(args) -> tuple:
+    configure_environment(args)
+
+    cosmos_latency = Latency(args.cosmos_latency_ms, args.jitter_ms)
+    blob_latency = Latency(args.blob_latency_ms, args.jitter_ms)
+    cosmos = FakeCosmosClient(cosmos_latency)
+    blobs = FakeBlobServiceClient(blob_latency)
+
+    from services.clients import override_clients
+    override_clients(cosmos_client=cosmos, blob_service_client=blobs)
+
+    _, logic_app_url = serve(logic_app_stub(Latency(args.logic_app_latency_ms, args.jitter_ms)))
+    os.environ['AZURE_LOGIC_APP_URL'] = logic_app_url
+
+    from services.auth_service import password_hasher
+    from services.cosmos_instrumentation import total_request_charge
+    data = seed(args, cosmos, blobs, password_hasher.hash(PASSWORD))
+
+    import logging
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    from app import app
+    trace_exporter = instrument_tracing(args, app)
+    server, base_url = serve(app)
+
+    tokens = {role: login(base_url, emails[0]) for role, emails in data["users"].items()}
+    builders = request_builders(data, tokens)
+
+    results = {}
+    for name in args.endpoint:
+        if args.warmup:
+            drive(base_url, builders[name], args.warmup, min(args.concurrency, args.warmup))
+        charge_before = total_request_charge()
+        with RssSampler() as rss:
+            result = drive(base_url, builders[name], args.requests, args.concurrency)
+        result["ruPerRequest"] = round((total_request_charge() - charge_before) / max(result["requests"], 1), 2)
+        result["peakRssBytes"] = rss.peak
+        results[name] = result
+
+    server.shutdown()
+    telemetry_stats = None
+    if trace_exporter:
+        telemetry_stats = app.extensions['telemetry'].stats() if 'telemetry' in app.extensions else {}
+        telemetry_stats.update(mode=args.telemetry, exportCalls=trace_exporter.batches, spansExported=trace_exporter.spans)
+    return results, telemetry_stats
+
+
+def instrument_tracing(args, app):
+    """Attach tracing with a stub exporter per --telemetry; returns the stub, or None when off"""
+    if args.telemetry == 'off':
+        return None
+    exporter = StubTraceExporter(Latency(args.telemetry_latency_ms, args.jitter_ms))
+    if args.telemetry == 'inline':
+        from opencensus.ext.flask.flask_middleware import FlaskMiddleware
+        from opencensus.trace.samplers import ProbabilitySampler
+        FlaskMiddleware(app, exporter=exporter, sampler=ProbabilitySampler(rate=1.0))
+    else:
+        from app import _request_route
+        from services import telemetry
+        telemetry.instrument_flask(app, exporter, route_fn=_request_route)
+    return exporter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--endpoint', action='append', choices=ENDPOINTS,
+                        help='Endpoint to benchmark; repeat for several (default: all)')
+    parser.add_argument('--requests', type=int, default=500, help='Measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per endpoint first')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--answers', type=int, default=3, help='Answers per seeded question')
+    parser.add_argument('--users-per-role', type=int, default=20)
+    parser.add_argument('--media-files', type=int, default=20)
+    parser.add_argument('--media-bytes', type=int, default=256 * 1024)
+    parser.add_argument('--media-cache-bytes', type=int, default=0,
+                        help='Size of the local media disk cache (0 disables it, so every read goes to Blob)')
+    parser.add_argument('--cosmos-latency-ms', type=float, default=5.0)
+    parser.add_argument('--blob-latency-ms', type=float, default=10.0)
+    parser.add_argument('--logic-app-latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=2.0, help='Uniform noise added to every simulated call')
+    parser.add_argument('--bcrypt-rounds', type=int, default=int(os.getenv('BCRYPT_ROUNDS', '12')))
+    parser.add_argument('--telemetry', choices=TELEMETRY_MODES, default='off',
+                        help='Trace requests: inline (export every request synchronously) or a TRACE_SAMPLING_MODE')
+    parser.add_argument('--trace-sample-rate', type=float, help='TRACE_SAMPLE_RATE for the sampling modes')
+    parser.add_argument('--telemetry-latency-ms', type=float, default=20.0, help='Cost of one export call')
+    parser.add_argument('--json', help='Also write the results to this file, e.g. to diff two branches')
+    args = parser.parse_args()
+    args.endpoint = args.endpoint or list(ENDPOINTS)
+
+    results, telemetry_stats = run(args)
+    print_table(results)
+    if telemetry_stats:
+        print(f"telemetry: {telemetry_stats}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"settings": vars(args), "results": results, "telemetry": telemetry_stats}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Load comparison of app.py under gunicorn and async_app.py under hypercorn
+
+Usage (from backend/):
+    python -m benchmarks.compare_servers --async-python venv-async/bin/python
+    python -m benchmarks.compare_servers --scenario question --concurrency 64 --cosmos-latency-ms 20 --json out.json
+
+Quart needs Flask 3 and the Application Insights extension needs Flask 2, so
+each app runs with its own interpreter (--sync-python / --async-python, both
+default to this one); this process only needs aiohttp for benchmarks.load.
+
+Each server runs as a single worker in its own process: app.py with the
+settings in gunicorn.conf.py (gthread, GUNICORN_THREADS threads), async_app.py
+on one hypercorn event loop. Both get the Azure clients replaced by the
+stand-ins in benchmarks.fakes over the same seeded data and simulated latency,
+and the question cache is disabled so every request reaches them. Each
+scenario is then driven with a fixed number of requests in flight per
+--concurrency level for --duration seconds.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import requests
+
+SERVERS = ('sync', 'async')
+SCENARIOS = ('question', 'page', 'media', 'stats', 'feed')
+
+
+def scenario_paths(data: dict) -> dict:
+    """Scenario name -> paths requested round robin"""
+    return {
+        'question': [f"/v1/questions/{question_id}" for question_id in data["question_ids"][:100]],
+        'page': [f"/v1/questions?page={page}&limit=20" for page in range(1, 6)],
+        'media': [f"/api/media/{name}" for name in data["media_names"]],
+        'stats': ['/v1/admin/stats'],
+        'feed': ['/api/feed']
+    }
+
+
+def serve(args) -> None:
+    """Run one server in this process over seeded stand-ins; writes what the driver needs to --ready-file"""
+    from benchmarks.bench_endpoints import PASSWORD, configure_environment, seed
+    from benchmarks.fakes import Latency, FakeCosmosClient, FakeBlobServiceClient
+
+    configure_environment(args)
+    os.environ['QUESTION_CACHE_SIZE'] = '0'
+    cosmos = FakeCosmosClient(Latency(args.cosmos_latency_ms, args.jitter_ms))
+    blobs = FakeBlobServiceClient(Latency(args.blob_latency_ms, args.jitter_ms))
+
+    # The async app still reconciles stats and fills the media cache with the synchronous clients
+    from services.clients import override_clients
+    override_clients(cosmos_client=cosmos, blob_service_client=blobs)
+
+    from models.user import User
+    from services.auth_service import TokenService, password_hasher
+    data = seed(args, cosmos, blobs, password_hasher.hash(PASSWORD))
+    admin = User(data["users"]["admin"][0], None, 'Bench Admin', 'admin')
+    data["token"] = TokenService().generate_jwt_token(admin)
+
+    with open(args.ready_file, 'w') as f:
+        json.dump(data, f)
+
+    if args.serve == 'sync':
+        serve_gunicorn(args)
+    else:
+        serve_hypercorn(args, cosmos, blobs)
+
+
+def serve_gunicorn(args) -> None:
+    from gunicorn.app.base import Application
+    from app import app
+
+    class BenchApplication(Application):
+        def init(self, parser, opts, args):
+            pass
+
+        def load_config(self):
+            self.load_config_from_file(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py'))
+            self.cfg.set('bind', f"127.0.0.1:{args.port}")
+            self.cfg.set('workers', 1)
+            self.cfg.set('max_requests', 0)
+            self.cfg.set('accesslog', None)
+            self.cfg.set('loglevel', 'warning')
+            if args.threads:
+                self.cfg.set('threads', args.threads)
+
+        def load(self):
+            return app
+
+    BenchApplication().run()
+
+
+def serve_hypercorn(args, cosmos, blobs) -> None:
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+    from benchmarks.fakes import FakeAsyncCosmosClient, FakeAsyncBlobServiceClient
+    from services import async_clients
+    async_clients.override_clients(FakeAsyncCosmosClient(cosmos), FakeAsyncBlobServiceClient(blobs))
+    from async_app import app
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{args.port}"]
+    config.accesslog = None
+    config.loglevel = 'WARNING'
+    asyncio.run(hypercorn_serve(app, config))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, args, workdir: str) -> tuple:
+    """Start one server process and wait until it answers /health; returns (process, base_url, data)"""
+    port = free_port()
+    ready_file = os.path.join(workdir, f"{kind}-{uuid.uuid4()}.json")
+    python = args.sync_python if kind == 'sync' else args.async_python
+    command = [
+        python, '-m', 'benchmarks.compare_servers', '--serve', kind, '--port', str(port), '--ready-file', ready_file,
+        '--questions', str(args.questions), '--answers', str(args.answers), '--users-per-role', str(args.users_per_role),
+        '--media-files', str(args.media_files), '--media-bytes', str(args.media_bytes),
+        '--media-cache-bytes', str(args.media_cache_bytes), '--cosmos-latency-ms', str(args.cosmos_latency_ms),
+        '--blob-latency-ms', str(args.blob_latency_ms), '--jitter-ms', str(args.jitter_ms),
+        '--bcrypt-rounds', str(args.bcrypt_rounds), '--threads', str(args.threads)
+    ]
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with status {process.returncode}")
+        if os.path.exists(ready_file):
+            try:
+                if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    with open(ready_file) as f:
+                        return process, base_url, json.load(f)
+            except requests.RequestException:
+                pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start within {args.startup_timeout}s")
+
+
+def stop_server(process) -> None:
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def compare(args) -> list:
+    from benchmarks.load import measure
+
+    workdir = tempfile.mkdtemp(prefix='peerview-compare-')
+    results = []
+    for kind in SERVERS:
+        process, base_url, data = start_server(kind, args, workdir)
+        try:
+            paths = scenario_paths(data)
+            for scenario in args.scenario:
+                if args.warmup:
+                    asyncio.run(measure(base_url, paths[scenario], min(args.concurrency), args.warmup, token=data["token"]))
+                for concurrency in args.concurrency:
+                    result = asyncio.run(measure(base_url, paths[scenario], concurrency, args.duration,
+                                                 timeout=args.timeout, token=data["token"]))
+                    result.update(server=kind, scenario=scenario, concurrency=concurrency)
+                    results.append(result)
+                    print_row(result)
+        finally:
+            stop_server(process)
+    return results
+
+
+def print_header() -> None:
+    print(f"{'scenario':<9} {'server':<6} {'in flight':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+
+def print_row(result: dict) -> None:
+    print(
+        f"{result['scenario']:<9} {result['server']:<6} {result['concurrency']:>9} {result['throughput']:>9.1f} "
+        f"{result['p50Ms']:>8.1f} {result['p95Ms']:>8.1f} {result['p99Ms']:>8.1f} {result['errors']:>7}",
+        flush=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='What to request; repeat for several (default: all but feed)')
+    parser.add_argument('--concurrency', type=int, action='append',
+                        help='Requests in flight; repeat for several levels (default: 16, 64, 256)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per scenario and level')
+    parser.add_argument('--warmup', type=float, default=2, help='Unmeasured seconds per scenario first')
+    parser.add_argument('--timeout', type=float, default=60, help='Client timeout per request')
+    parser.add_argument('--threads', type=int, default=0, help='gunicorn threads (default: gunicorn.conf.py)')
+    parser.add_argument('--sync-python', default=sys.executable, help='Interpreter with requirements.txt installed')
+    parser.add_argument('--async-python', default=sys.executable, help='Interpreter with requirements-async.txt installed')
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--answers', type=int, default=3, help='Answers per seeded question')
+    parser.add_argument('--users-per-role', type=int, default=5)
+    parser.add_argument('--media-files', type=int, default=20)
+    parser.add_argument('--media-bytes', type=int, default=64 * 1024)
+    parser.add_argument('--media-cache-bytes', type=int, default=0,
+                        help='Size of the local media disk cache (0 disables it, so every read goes to Blob)')
+    parser.add_argument('--cosmos-latency-ms', type=float, default=10.0)
+    parser.add_argument('--blob-latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=2.0, help='Uniform noise added to every simulated call')
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--json', help='Also write the results to this file')
+    # Internal: run one server (set by the driver for its child processes)
+    parser.add_argument('--serve', choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--ready-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        args.telemetry = 'off'
+        serve(args)
+        return
+
+    args.scenario = args.scenario or [scenario for scenario in SCENARIOS if scenario != 'feed']
+    args.concurrency = args.concurrency or [16, 64, 256]
+    print_header()
+    results = compare(args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,533 @@
+"""
+In-memory stand-ins for the Azure Cosmos and Blob clients
+
+They implement the slice of the SDK surface the services use, so the real
+CosmosService, StatsService, AuthService, AdminService and BlobService run
+unchanged on top of them (see services.clients.override_clients). The FakeAsync*
+clients serve the same data through the aio surface that AsyncCosmosService and
+AsyncBlobService use (see services.async_clients.override_clients). Every call
+that would be a network round trip sleeps for a configurable latency first and
+reports an approximate RU charge through the same hook as the real client.
+StubTraceExporter does the same for Application Insights trace export.
+
+Queries are matched against the handful of shapes the hot paths issue; anything
+else raises NotImplementedError so a benchmark never silently measures nothing.
+"""
+
+import re
+import copy
+import asyncio
+import json
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceModifiedError
+from azure.cosmos import exceptions
+from services.cosmos_instrumentation import record_response
+
+# Blob downloads are yielded in chunks of this size, like the SDK's default max_chunk_get_size
+BLOB_CHUNK_SIZE = 4 * 1024 * 1024
+
+_SUPPORTED_QUERY = re.compile(
+    r'^SELECT (TOP (?P<top>\d+) )?\* FROM c'
+    r'( WHERE (?P<where>.+?))?'
+    r'( ORDER BY c\.(?P<order>\w+) (?P<direction>ASC|DESC))?'
+    r'( OFFSET (?P<offset>\d+) LIMIT (?P<limit>\d+))?$'
+)
+# Conditions a WHERE clause may AND together, each mapped to a filter over (item, parameter values)
+_SUPPORTED_CONDITIONS = {
+    '(NOT IS_DEFINED(c.moderated) OR c.moderated = false)': lambda item, values: not item.get('moderated'),
+    'c.timestamp <= @timestamp': lambda item, values: item['timestamp'] <= values['@timestamp'],
+    'NOT ARRAY_CONTAINS(@seenIds, c.id)': lambda item, values: item['id'] not in values['@seenIds'],
+    'ARRAY_CONTAINS(@ids, c.id)': lambda item, values: item['id'] in values['@ids'],
+    'c.email = @email': lambda item, values: item.get('email') == values['@email'],
+    'LOWER(c.email) = @email': lambda item, values: isinstance(item.get('email'), str) and item['email'].lower() == values['@email']
+}
+
+# Rough RU costs: about 1 RU per KB read, writes around 5x that, queries a base plus per-item cost
+READ_RU_PER_KB = 1.0
+WRITE_RU_PER_KB = 5.5
+QUERY_BASE_RU = 2.3
+QUERY_RU_PER_ITEM = 0.1
+
+
+class Latency:
+    """Simulated round-trip time: base_ms plus up to jitter_ms of uniform noise"""
+
+    def __init__(self, base_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+
+    def _delay_ms(self) -> float:
+        return self.base_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+
+    def wait(self) -> None:
+        delay_ms = self._delay_ms()
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+    async def wait_async(self) -> None:
+        """wait() without blocking the event loop"""
+        delay_ms = self._delay_ms()
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000)
+
+
+def _size_kb(document: Any) -> float:
+    return max(1.0, len(json.dumps(document, default=str)) / 1024)
+
+
+def _charge(request_charge: float) -> None:
+    record_response({'x-ms-request-charge': f"{request_charge:.2f}", 'x-ms-activity-id': str(uuid.uuid4())})
+
+
+def _pages(items: List[dict], page_size: int):
+    # Even an empty result costs one round trip
+    for start in range(0, max(len(items), 1), page_size):
+        yield items[start:start + page_size]
+
+
+class FakeItemPaged:
+    """Query results that iterate like ItemPaged and support by_page(); each page is a round trip"""
+
+    def __init__(self, items: List[dict], latency: Latency, page_size: Optional[int] = None):
+        self._items = items
+        self._latency = latency
+        self._page_size = page_size or 100
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+    def by_page(self):
+        for page in _pages(self._items, self._page_size):
+            self._latency.wait()
+            _charge(QUERY_BASE_RU + QUERY_RU_PER_ITEM * len(page))
+            yield iter(page)
+
+
+class FakeAsyncItemPaged:
+    """Query results that iterate like AsyncItemPaged: async for, or by_page() over async pages"""
+
+    def __init__(self, items: List[dict], latency: Latency, page_size: Optional[int] = None):
+        self._items = items
+        self._latency = latency
+        self._page_size = page_size or 100
+
+    async def __aiter__(self):
+        async for page in self.by_page():
+            async for item in page:
+                yield item
+
+    async def by_page(self):
+        for page in _pages(self._items, self._page_size):
+            await self._latency.wait_async()
+            _charge(QUERY_BASE_RU + QUERY_RU_PER_ITEM * len(page))
+            yield _async_iter(page)
+
+
+async def _async_iter(items: List[dict]):
+    for item in items:
+        yield item
+
+
+class FakeContainer:
+    """A Cosmos container held in a dict, partitioned (like every container here) by /id"""
+
+    def __init__(self, container_id: str, latency: Latency):
+        self.id = container_id
+        self.latency = latency
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def seed(self, items: Iterable[dict]) -> None:
+        """Load documents without simulated latency"""
+        with self._lock:
+            for item in items:
+                self._items[item['id']] = self._stamp(copy.deepcopy(item))
+
+    @staticmethod
+    def _stamp(item: dict) -> dict:
+        item['_etag'] = f'"{uuid.uuid4()}"'
+        item['_ts'] = int(time.time())
+        return item
+
+    @staticmethod
+    def _not_found(item_id: str):
+        return exceptions.CosmosResourceNotFoundError(
+            status_code=404,
+            message=f"Entity with the specified id does not exist in the system. id={item_id}"
+        )
+
+    def read_item(self, item: str, partition_key: Any, **kwargs) -> dict:
+        self.latency.wait()
+        return self._read(item)
+
+    def _read(self, item: str) -> dict:
+        with self._lock:
+            if item not in self._items:
+                _charge(READ_RU_PER_KB)
+                raise self._not_found(item)
+            document = copy.deepcopy(self._items[item])
+        _charge(READ_RU_PER_KB * _size_kb(document))
+        return document
+
+    def create_item(self, body: dict, **kwargs) -> dict:
+        self.latency.wait()
+        with self._lock:
+            if body['id'] in self._items:
+                raise exceptions.CosmosResourceExistsError(
+                    status_code=409,
+                    message="Entity with the specified id already exists in the system."
+                )
+            self._items[body['id']] = self._stamp(copy.deepcopy(body))
+            document = copy.deepcopy(self._items[body['id']])
+        _charge(WRITE_RU_PER_KB * _size_kb(document))
+        return document
+
+    def upsert_item(self, body: dict, **kwargs) -> dict:
+        self.latency.wait()
+        with self._lock:
+            self._items[body['id']] = self._stamp(copy.deepcopy(body))
+            document = copy.deepcopy(self._items[body['id']])
+        _charge(WRITE_RU_PER_KB * _size_kb(document))
+        return document
+
+    def replace_item(self, item: str, body: dict, **kwargs) -> dict:
+        self.latency.wait()
+        with self._lock:
+            if item not in self._items:
+                raise self._not_found(item)
+            self._check_etag(self._items[item], kwargs.get('etag'), kwargs.get('match_condition'))
+            self._items[item] = self._stamp(copy.deepcopy(body))
+            document = copy.deepcopy(self._items[item])
+        _charge(WRITE_RU_PER_KB * _size_kb(document))
+        return document
+
+    def delete_item(self, item: str, partition_key: Any, **kwargs) -> None:
+        self.latency.wait()
+        with self._lock:
+            removed = self._items.pop(item, None)
+        _charge(WRITE_RU_PER_KB * (_size_kb(removed) if removed else 1))
+        if removed is None:
+            raise self._not_found(item)
+
+    def patch_item(self, item: str, partition_key: Any, patch_operations: List[dict],
+                   etag: Optional[str] = None, match_condition: Optional[MatchConditions] = None, **kwargs) -> dict:
+        self.latency.wait()
+        with self._lock:
+            if item not in self._items:
+                raise self._not_found(item)
+            self._check_etag(self._items[item], etag, match_condition)
+            document = copy.deepcopy(self._items[item])
+            for operation in patch_operations:
+                self._apply(document, operation)
+            self._items[item] = self._stamp(document)
+            document = copy.deepcopy(document)
+        _charge(WRITE_RU_PER_KB * _size_kb(document))
+        return document
+
+    @staticmethod
+    def _check_etag(document: dict, etag: Optional[str], match_condition: Optional[MatchConditions]) -> None:
+        if etag and match_condition == MatchConditions.IfNotModified and document['_etag'] != etag:
+            raise exceptions.CosmosAccessConditionFailedError(
+                status_code=412,
+                message="Operation cannot be performed because one of the specified precondition is not met."
+            )
+
+    @staticmethod
+    def _apply(document: dict, operation: dict) -> None:
+        """Apply one patch operation (add, set, replace, remove, incr) at a JSON pointer path"""
+        *parents, key = operation['path'].lstrip('/').split('/')
+        target = document
+        for part in parents:
+            target = target[int(part)] if isinstance(target, list) else target.setdefault(part, {})
+
+        op = operation['op']
+        value = operation.get('value')
+        if isinstance(target, list):
+            if key == '-':
+                target.append(value)
+            elif op == 'add':
+                target.insert(int(key), value)
+            elif op == 'remove':
+                del target[int(key)]
+            elif op == 'incr':
+                target[int(key)] += value
+            else:
+                target[int(key)] = value
+        elif op == 'remove':
+            del target[key]
+        elif op == 'incr':
+            target[key] = target.get(key, 0) + value
+        else:
+            target[key] = value
+
+    def query_items(self, query: str, parameters: Optional[List[dict]] = None,
+                    max_item_count: Optional[int] = None, **kwargs) -> FakeItemPaged:
+        return FakeItemPaged(self._select(query, parameters), self.latency, max_item_count)
+
+    def _select(self, query: str, parameters: Optional[List[dict]]) -> List[dict]:
+        """The documents a supported query returns, in order"""
+        match = _SUPPORTED_QUERY.match(query)
+        if not match:
+            raise NotImplementedError(f"Query not supported by the in-memory container: {query}")
+        conditions = []
+        for condition in _split_conjunction(match.group('where')):
+            if condition not in _SUPPORTED_CONDITIONS:
+                raise NotImplementedError(f"Condition not supported by the in-memory container: {condition}")
+            conditions.append(_SUPPORTED_CONDITIONS[condition])
+        values = {parameter['name']: parameter['value'] for parameter in parameters or []}
+
+        with self._lock:
+            items = [item for item in self._items.values() if all(condition(item, values) for condition in conditions)]
+
+        if match.group('order'):
+            field = match.group('order')
+            items.sort(key=lambda item: item.get(field, ''), reverse=match.group('direction') == 'DESC')
+        if match.group('offset'):
+            offset = int(match.group('offset'))
+            items = items[offset:offset + int(match.group('limit'))]
+        if match.group('top'):
+            items = items[:int(match.group('top'))]
+        return copy.deepcopy(items)
+
+
+def _split_conjunction(where: Optional[str]) -> List[str]:
+    """The conditions a WHERE clause ANDs together, leaving parenthesized groups whole"""
+    if not where:
+        return []
+    conditions, depth, start = [], 0, 0
+    for index, char in enumerate(where):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and where.startswith(' AND ', index):
+            conditions.append(where[start:index])
+            start = index + len(' AND ')
+    conditions.append(where[start:])
+    return conditions
+
+
+class FakeDatabase:
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self._containers = {}
+        self._lock = threading.Lock()
+
+    def get_container_client(self, container: str) -> FakeContainer:
+        with self._lock:
+            if container not in self._containers:
+                self._containers[container] = FakeContainer(container, self.latency)
+            return self._containers[container]
+
+    def create_container_if_not_exists(self, id: str, partition_key: Any = None, **kwargs) -> FakeContainer:
+        return self.get_container_client(id)
+
+    def create_container(self, id: str, partition_key: Any = None, **kwargs) -> FakeContainer:
+        return self.get_container_client(id)
+
+
+class FakeCosmosClient:
+    """Stands in for CosmosClient; every database name maps to its own in-memory database"""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def get_database_client(self, database: Optional[str]) -> FakeDatabase:
+        with self._lock:
+            if database not in self._databases:
+                self._databases[database] = FakeDatabase(self.latency)
+            return self._databases[database]
+
+
+class FakeDownloader:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def chunks(self):
+        for start in range(0, len(self._data), BLOB_CHUNK_SIZE):
+            yield self._data[start:start + BLOB_CHUNK_SIZE]
+
+    def readall(self) -> bytes:
+        return self._data
+
+
+class FakeBlobClient:
+    def __init__(self, store: 'FakeBlobServiceClient', container: str, blob: str):
+        self._store = store
+        self._key = (container, blob)
+        self.url = f"https://fake.blob.core.windows.net/{container}/{blob}"
+
+    def _blob(self) -> dict:
+        blob = self._store.blobs.get(self._key)
+        if blob is None:
+            raise ResourceNotFoundError(message=f"The specified blob does not exist: {self._key[1]}")
+        return blob
+
+    def get_blob_properties(self, **kwargs) -> SimpleNamespace:
+        self._store.latency.wait()
+        return self._properties()
+
+    def _properties(self) -> SimpleNamespace:
+        blob = self._blob()
+        return SimpleNamespace(
+            name=self._key[1],
+            size=len(blob['data']),
+            etag=blob['etag'],
+            last_modified=blob['last_modified'],
+            content_settings=SimpleNamespace(content_type=blob['content_type'])
+        )
+
+    def download_blob(self, offset: int = 0, length: Optional[int] = None, etag: Optional[str] = None,
+                      match_condition: Optional[MatchConditions] = None, **kwargs) -> FakeDownloader:
+        self._store.latency.wait()
+        return FakeDownloader(self._range(offset, length, etag, match_condition))
+
+    def _range(self, offset: int, length: Optional[int], etag: Optional[str],
+               match_condition: Optional[MatchConditions]) -> bytes:
+        blob = self._blob()
+        if etag and match_condition == MatchConditions.IfNotModified and blob['etag'] != etag:
+            raise ResourceModifiedError(message="The condition specified using HTTP conditional header(s) is not met.")
+        stop = len(blob['data']) if length is None else offset + length
+        return blob['data'][offset:stop]
+
+    def upload_blob(self, data: bytes, overwrite: bool = False, content_settings: Any = None, **kwargs) -> None:
+        self._store.latency.wait()
+        self._store.put(self._key[0], self._key[1], data, getattr(content_settings, 'content_type', None))
+
+
+class FakeContainerClient:
+    def __init__(self, store: 'FakeBlobServiceClient', container: str):
+        self._store = store
+        self._container = container
+
+    def list_blobs(self, name_starts_with: Optional[str] = None, **kwargs) -> List[SimpleNamespace]:
+        self._store.latency.wait()
+        return [
+            SimpleNamespace(name=blob, size=len(value['data']), last_modified=value['last_modified'])
+            for (container, blob), value in list(self._store.blobs.items())
+            if container == self._container and blob.startswith(name_starts_with or '')
+        ]
+
+
+class FakeBlobServiceClient:
+    """Stands in for BlobServiceClient with blobs held in memory"""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.blobs: Dict[tuple, dict] = {}
+
+    def put(self, container: str, blob: str, data: bytes, content_type: Optional[str] = None) -> None:
+        """Store a blob without simulated latency"""
+        self.blobs[(container, blob)] = {
+            'data': bytes(data),
+            'content_type': content_type or 'application/octet-stream',
+            'etag': f'"{uuid.uuid4()}"',
+            'last_modified': datetime.now(timezone.utc)
+        }
+
+    def get_blob_client(self, container: str, blob: str) -> FakeBlobClient:
+        return FakeBlobClient(self, container, blob)
+
+    def get_container_client(self, container: str) -> FakeContainerClient:
+        return FakeContainerClient(self, container)
+
+
+class FakeAsyncContainer:
+    """aio view of a FakeContainer: the read calls AsyncCosmosService makes, sleeping without blocking"""
+
+    def __init__(self, container: FakeContainer):
+        self._container = container
+
+    async def read_item(self, item: str, partition_key: Any, **kwargs) -> dict:
+        await self._container.latency.wait_async()
+        return self._container._read(item)
+
+    def query_items(self, query: str, parameters: Optional[List[dict]] = None,
+                    max_item_count: Optional[int] = None, **kwargs) -> FakeAsyncItemPaged:
+        items = self._container._select(query, parameters)
+        return FakeAsyncItemPaged(items, self._container.latency, max_item_count)
+
+
+class FakeAsyncDatabase:
+    def __init__(self, database: FakeDatabase):
+        self._database = database
+
+    def get_container_client(self, container: str) -> FakeAsyncContainer:
+        return FakeAsyncContainer(self._database.get_container_client(container))
+
+
+class FakeAsyncCosmosClient:
+    """Stands in for azure.cosmos.aio.CosmosClient over the same databases as a FakeCosmosClient"""
+
+    def __init__(self, client: FakeCosmosClient):
+        self._client = client
+
+    def get_database_client(self, database: Optional[str]) -> FakeAsyncDatabase:
+        return FakeAsyncDatabase(self._client.get_database_client(database))
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeAsyncDownloader:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    async def chunks(self):
+        for start in range(0, len(self._data), BLOB_CHUNK_SIZE):
+            yield self._data[start:start + BLOB_CHUNK_SIZE]
+
+
+class FakeAsyncBlobClient(FakeBlobClient):
+    async def get_blob_properties(self, **kwargs) -> SimpleNamespace:
+        await self._store.latency.wait_async()
+        return self._properties()
+
+    async def download_blob(self, offset: int = 0, length: Optional[int] = None, etag: Optional[str] = None,
+                            match_condition: Optional[MatchConditions] = None, **kwargs) -> FakeAsyncDownloader:
+        await self._store.latency.wait_async()
+        return FakeAsyncDownloader(self._range(offset, length, etag, match_condition))
+
+
+class FakeAsyncBlobServiceClient:
+    """Stands in for azure.storage.blob.aio.BlobServiceClient over a FakeBlobServiceClient's blobs"""
+
+    def __init__(self, store: FakeBlobServiceClient):
+        self._store = store
+
+    def get_blob_client(self, container: str, blob: str) -> FakeAsyncBlobClient:
+        return FakeAsyncBlobClient(self._store, container, blob)
+
+    async def close(self) -> None:
+        pass
+
+
+class StubTraceExporter:
+    """Trace exporter that spends the configured latency per batch instead of calling Application Insights"""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.batches = 0
+        self.spans = 0
+        self._lock = threading.Lock()
+
+    def emit(self, span_datas) -> None:
+        self.latency.wait()
+        with self._lock:
+            self.batches += 1
+            self.spans += len(span_datas)
+
+    def export(self, span_datas) -> None:
+        """Synchronous export, as the default exporter path behaves when called inline"""
+        self.emit(span_datas)
@@ -0,0 +1,103 @@
+"""
+Concurrent load generator for comparing the threaded and async servers
+
+Usage (from backend/, with requirements-async.txt installed for aiohttp):
+    python -m benchmarks.load http://localhost:8000 --path /api/feed --concurrency 500 --duration 30
+    python -m benchmarks.load http://localhost:8001 --path /api/feed --concurrency 500 --duration 30
+
+Keeps --concurrency requests in flight for --duration seconds against each
+--path (round robin) and reports throughput, latency percentiles and errors.
+Pass --token for endpoints behind token_required. Run it against app.py under
+gunicorn and async_app.py under hypercorn with the same worker count to compare.
+"""
+
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+import aiohttp
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+async def worker(session: aiohttp.ClientSession, urls: list, offset: int, deadline: float,
+                 latencies: list, statuses: Counter) -> None:
+    i = offset
+    while time.monotonic() < deadline:
+        url = urls[i % len(urls)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                statuses[response.status] += 1
+        except Exception as e:
+            statuses[type(e).__name__] += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def measure(base_url: str, paths: list, concurrency: int, duration: float,
+                  timeout: float = 60, token: str = None) -> dict:
+    """Hold concurrency requests in flight for duration seconds; returns throughput, percentiles and statuses"""
+    urls = [base_url.rstrip('/') + path for path in paths]
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    latencies = []
+    statuses = Counter()
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*(
+            worker(session, urls, i, deadline, latencies, statuses)
+            for i in range(concurrency)
+        ))
+        elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "completed": len(latencies),
+        "elapsed": elapsed,
+        "errors": sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400)),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50Ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95Ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99Ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "maxMs": round((latencies[-1] if latencies else 0.0) * 1000, 1),
+        "statuses": {str(status): count for status, count in statuses.items()}
+    }
+
+
+async def run(args) -> None:
+    result = await measure(args.base_url, args.path, args.concurrency, args.duration, args.timeout, args.token)
+    print(f"target       {args.base_url} {' '.join(args.path)}")
+    print(f"concurrency  {args.concurrency} for {result['elapsed']:.1f}s")
+    print(f"throughput   {result['throughput']:.1f} req/s ({result['completed']} completed)")
+    for label in ('p50', 'p95', 'p99', 'max'):
+        print(f"{label:<12} {result[label + 'Ms']:.1f} ms")
+    print(f"responses    {result['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('base_url')
+    parser.add_argument('--path', action='append', help='Path to request; repeat for several (default /api/feed)')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--token', help='Bearer token for authenticated endpoints')
+    args = parser.parse_args()
+    args.path = args.path or ['/api/feed']
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
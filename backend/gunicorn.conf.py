@@ -0,0 +1,81 @@
+"""
+Gunicorn settings for production serving
+Every value can be overridden from the environment; startup.py and run.py use
+this file. The app is preloaded in the master so module imports and client
+construction happen once, then each forked worker drops the inherited sockets
+and starts its own background threads (including Application Insights export).
+"""
+
+import os
+import tempfile
+import multiprocessing
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')  # gthread or sync
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+if preload_app:
+    # Services are lazy by default; build them once in the master instead of in every worker
+    os.environ.setdefault('EAGER_SERVICES', 'true')
+    # Exporter threads started in the master would not exist in the forked workers
+    os.environ['DEFER_TELEMETRY'] = 'true'
+
+# Workers write their metrics here so /metrics on any of them reports the whole
+# server; a fresh directory per master start so a restart begins from zero
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='peerview-metrics-'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+# On SIGTERM/SIGHUP workers stop accepting and get this long to finish in-flight requests
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle each worker after a bounded number of requests to cap memory growth;
+# jitter keeps the workers from all restarting at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def pre_fork(server, worker):
+    """Publish what the master recorded (e.g. Cosmos calls while preloading) once,
+    rather than once per worker that inherits it"""
+    from services import metrics
+    metrics.flush()
+
+
+def post_fork(server, worker):
+    """Drop pooled connections and metric series the worker inherited from the master"""
+    from services import metrics
+    from services.clients import reset_connection_pools
+    reset_connection_pools()
+    metrics.reset()
+
+
+def post_worker_init(worker):
+    """Start per-worker background work: Application Insights export, delivery
+    of events left in the spool without waiting for a new one to be queued, and
+    metric flushes to METRICS_DIR"""
+    if preload_app:
+        from app import configure_telemetry
+        configure_telemetry(worker.wsgi)
+
+    from services.logic_app_service import start_dispatcher
+    start_dispatcher()
+
+    from services import metrics
+    metrics.start_flusher()
+
+
+def worker_exit(server, worker):
+    """Let event delivery finish the batch in flight (the rest stays spooled) and
+    archive this worker's metrics so the server's counters keep them"""
+    from services.logic_app_service import stop_dispatcher
+    stop_dispatcher(timeout=min(10, graceful_timeout))
+
+    from services import metrics
+    metrics.mark_process_dead()
@@ -0,0 +1,49 @@
+from functools import wraps
+from quart import request, jsonify, g
+from services.auth_service import TokenService
+
+token_service = TokenService()
+
+def token_required(f):
+    """Decorator to require JWT token on async views"""
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        token = None
+        
+        # Get token from Authorization header
+        if 'Authorization' in request.headers:
+            auth_header = request.headers['Authorization']
+            try:
+                token = auth_header.split(" ")[1]  # Bearer <token>
+            except IndexError:
+                return jsonify({'error': 'Invalid token format'}), 401
+        
+        if not token:
+            return jsonify({'error': 'Token is missing'}), 401
+        
+        try:
+            # Verify token
+            payload = token_service.verify_jwt_token_cached(token)
+            g.current_user_id = payload['user_id']
+            g.current_user_email = payload['email']
+            g.current_user_role = payload['role']
+        except Exception as e:
+            return jsonify({'error': str(e)}), 401
+        
+        return await f(*args, **kwargs)
+    
+    return decorated
+
+def admin_required(f):
+    """Decorator to require admin role on async views"""
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        if not hasattr(g, 'current_user_role'):
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        if g.current_user_role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        return await f(*args, **kwargs)
+    
+    return decorated
@@ -1,8 +1,9 @@
 from functools import wraps
 from flask import request, jsonify, g
-from services.auth_service import AuthService
+from services.auth_service import TokenService
 
-auth_service = AuthService()
+# Verifying a token needs only the JWT settings, not a Cosmos connection
+token_service = TokenService()
 
 def token_required(f):
     """Decorator to require JWT token"""
@@ -23,7 +24,7 @@ def token_required(f):
         
         try:
             # Verify token
-            payload = auth_service.verify_jwt_token(token)
+            payload = token_service.verify_jwt_token_cached(token)
             g.current_user_id = payload['user_id']
             g.current_user_email = payload['email']
             g.current_user_role = payload['role']
@@ -0,0 +1,77 @@
+"""
+Negotiated response compression and ETag matching for JSON endpoints
+
+Bodies over COMPRESSION_MIN_BYTES are compressed with brotli (when the Brotli
+package is installed) or gzip, whichever the client prefers. Each content coding
+is a different representation, so a strong ETag gets a -br / -gzip suffix when
+the body is encoded, and If-None-Match accepts any of the variants.
+"""
+
+import os
+import gzip
+from functools import wraps
+from typing import Optional
+from flask import make_response, request
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+
+# Server preference when the client rates several codings equally
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def negotiate_encoding() -> Optional[str]:
+    """The content coding to use for this request, or None for identity"""
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output (and so its ETag) identical for identical input
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def matching_etag(etag: str) -> Optional[str]:
+    """The variant of etag named by If-None-Match (identity or any coding), or None"""
+    for candidate in (etag,) + tuple(f"{etag}-{encoding}" for encoding in ENCODINGS):
+        if request.if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+def compress_response(response):
+    """Compress a 200 JSON response in place if the client accepts it and it is large enough"""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding()
+    if not encoding:
+        return response
+
+    response.set_data(_compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
+
+
+def compressed(f):
+    """Decorator to compress a view's JSON response per Accept-Encoding"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        return compress_response(make_response(f(*args, **kwargs)))
+
+    return decorated
@@ -0,0 +1,49 @@
+"""
+Incremental JSON encoding for streamed feed responses
+
+The threaded app iterates documents synchronously and the async app with
+async for; both encode each document the same way through these helpers.
+"""
+
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator
+
+
+def ndjson_line(item: Any) -> bytes:
+    return (json.dumps(item) + '\n').encode('utf-8')
+
+
+def json_array_element(item: Any, first: bool) -> bytes:
+    return (('' if first else ',') + json.dumps(item)).encode('utf-8')
+
+
+def stream_ndjson(items: Iterable[Any]) -> Iterator[bytes]:
+    """Serialize items as newline-delimited JSON, one chunk per item"""
+    for item in items:
+        yield ndjson_line(item)
+
+
+def stream_json_array(items: Iterable[Any]) -> Iterator[bytes]:
+    """Serialize items as a JSON array without materializing the list"""
+    yield b'['
+    first = True
+    for item in items:
+        yield json_array_element(item, first)
+        first = False
+    yield b']'
+
+
+async def astream_ndjson(items: AsyncIterable[Any]) -> AsyncIterator[bytes]:
+    """stream_ndjson over an async iterable"""
+    async for item in items:
+        yield ndjson_line(item)
+
+
+async def astream_json_array(items: AsyncIterable[Any]) -> AsyncIterator[bytes]:
+    """stream_json_array over an async iterable"""
+    yield b'['
+    first = True
+    async for item in items:
+        yield json_array_element(item, first)
+        first = False
+    yield b']'
@@ -0,0 +1,67 @@
+"""
+HTTP caching and Range rules for the media proxy, shared by app.py and async_app.py
+
+Both frameworks hand us a werkzeug-style request (if_none_match, if_range,
+range), so the header set, conditional checks and byte range selection live
+here once and each app only decides where the bytes come from.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from werkzeug.http import http_date
+
+MEDIA_MAX_AGE = 31536000  # Blob names never change, so cache for 1 year
+MEDIA_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET',
+    'Access-Control-Allow-Headers': 'Content-Type, Range, If-None-Match',
+    'Access-Control-Expose-Headers': 'Accept-Ranges, Content-Length, Content-Range, ETag'
+}
+
+
+def media_headers(media: Dict[str, Any]) -> Dict[str, str]:
+    """Validators, caching and CORS headers for a blob's properties"""
+    return {
+        'Accept-Ranges': 'bytes',
+        'ETag': media['etag'],
+        'Last-Modified': http_date(media['last_modified']),
+        'Cache-Control': f'public, max-age={MEDIA_MAX_AGE}',
+        **MEDIA_CORS_HEADERS
+    }
+
+
+def not_modified(request, media: Dict[str, Any]) -> bool:
+    """Whether If-None-Match lets us answer 304"""
+    return request.if_none_match.contains_weak(media['etag'].strip('"'))
+
+
+def select_range(request, media: Dict[str, Any], headers: Dict[str, str]) -> Optional[Tuple[int, int, int]]:
+    """Pick the bytes to send as (start, stop, status), or None when the range is unsatisfiable (416)
+
+    Sets Content-Range (and Content-Length when satisfiable) on headers.
+    Multi-range requests are answered with the full body, which RFC 9110 allows.
+    """
+    size = media['content_length']
+    start, stop, status = 0, size, 200
+    byte_range = request.range
+    if byte_range and byte_range.units == 'bytes' and len(byte_range.ranges) == 1 and if_range_matches(request, media):
+        satisfiable = byte_range.range_for_length(size)
+        if satisfiable is None:
+            headers['Content-Range'] = f'bytes */{size}'
+            return None
+        start, stop = satisfiable
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+
+    headers['Content-Length'] = str(stop - start)
+    return start, stop, status
+
+
+def if_range_matches(request, media: Dict[str, Any]) -> bool:
+    """Whether a Range request may be served partially given its If-Range precondition"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        # If-Range requires a strong comparison
+        return if_range.etag == media['etag'].strip('"') and not request.headers.get('If-Range', '').startswith('W/')
+    if if_range.date is not None:
+        return media['last_modified'].replace(microsecond=0) <= if_range.date
+    return True
@@ -14,11 +14,16 @@ os.environ.setdefault('FLASK_ENV', 'production')
 os.environ.setdefault('FLASK_DEBUG', 'False')
 
 try:
-    from app import app
+    import gunicorn  # noqa: F401 - fail early with a clear message if it is missing
     
     if __name__ == "__main__":
-        port = int(os.environ.get('PORT', 8000))
-        app.run(host='0.0.0.0', port=port, debug=False)
+        # Replace this process with gunicorn; tuning lives in gunicorn.conf.py
+        os.chdir(current_dir)
+        os.execvp(sys.executable, [
+            sys.executable, '-m', 'gunicorn',
+            '--config', os.path.join(current_dir, 'gunicorn.conf.py'),
+            'app:app'
+        ])
         
 except ImportError as e:
     print(f"Import error: {e}")
@@ -2,75 +2,104 @@ from datetime import datetime
 from azure.cosmos import exceptions
 from services.cosmos_service import CosmosService
 from services.blob_service import BlobService
+from services.password_hasher import ServiceBusyError
+from services.stats_service import StatsService
 
 class AdminService:
     def __init__(self):
         self.cosmos_service = CosmosService()
-        self.blob_service = BlobService()
+        self.stats_service = StatsService()
+        self.blob_service = BlobService(stats_service=self.stats_service)
     
     def get_system_stats(self) -> dict:
-        """Get system statistics"""
+        """Get system statistics from the materialized counters, reconciling them when stale"""
         try:
-            # Get total users
-            users_query = "SELECT VALUE COUNT(1) FROM c WHERE c.email != null"
-            users_container = self.cosmos_service.database.get_container_client('Users')
-            total_users = list(users_container.query_items(
-                query=users_query,
-                enable_cross_partition_query=True
-            ))[0]
-            
-            # Get total questions
-            questions_query = "SELECT VALUE COUNT(1) FROM c WHERE c.title != null"
-            total_questions = list(self.cosmos_service.container.query_items(
-                query=questions_query,
-                enable_cross_partition_query=True
-            ))[0]
-            
-            # Get total answers
-            answers_query = "SELECT VALUE SUM(ARRAY_LENGTH(c.answers)) FROM c WHERE c.answers != null"
-            total_answers_result = list(self.cosmos_service.container.query_items(
-                query=answers_query,
-                enable_cross_partition_query=True
-            ))
-            total_answers = total_answers_result[0] if total_answers_result[0] else 0
-            
-            # Get questions by status
-            answered_query = "SELECT VALUE COUNT(1) FROM c WHERE c.status = 'answered'"
-            pending_query = "SELECT VALUE COUNT(1) FROM c WHERE c.status = 'pending'"
-            
-            answered_questions = list(self.cosmos_service.container.query_items(
-                query=answered_query,
-                enable_cross_partition_query=True
-            ))[0]
-            
-            pending_questions = list(self.cosmos_service.container.query_items(
-                query=pending_query,
-                enable_cross_partition_query=True
-            ))[0]
-            
-            # Get recent activity (last 7 days)
-            from datetime import datetime, timedelta
-            week_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
-            recent_query = f"SELECT VALUE COUNT(1) FROM c WHERE c.timestamp >= '{week_ago}'"
-            recent_questions = list(self.cosmos_service.container.query_items(
-                query=recent_query,
-                enable_cross_partition_query=True
-            ))[0]
+            stats = self.stats_service.get_stats()
+            if stats is None:
+                stats = self.reconcile_stats()
             
-            return {
-                "totalUsers": total_users,
-                "totalQuestions": total_questions,
-                "totalAnswers": total_answers,
-                "answeredQuestions": answered_questions,
-                "pendingQuestions": pending_questions,
-                "recentQuestions": recent_questions,
-                "storageUsage": "N/A",  # Would need Azure Storage API to get actual usage
-                "lastUpdated": datetime.utcnow().isoformat()
-            }
+            return self.format_system_stats(stats)
             
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to get system stats: {e.message}")
     
+    @classmethod
+    def format_system_stats(cls, stats: dict) -> dict:
+        """Shape a counters document for the admin dashboard"""
+        return {
+            "totalUsers": stats["totalUsers"],
+            "totalQuestions": stats["totalQuestions"],
+            "totalAnswers": stats["totalAnswers"],
+            "answeredQuestions": stats["answeredQuestions"],
+            "pendingQuestions": stats["pendingQuestions"],
+            "recentQuestions": StatsService.recent_questions(stats),
+            "storageUsage": cls._format_bytes(stats["storageBytes"]),
+            "storageBytes": stats["storageBytes"],
+            "lastReconciled": stats["reconciledAt"],
+            "lastUpdated": datetime.utcnow().isoformat()
+        }
+    
+    def reconcile_stats(self) -> dict:
+        """Recompute every counter from the source data and store the result"""
+        try:
+            stats = StatsService.build_stats(*self._count_stats())
+            return self.stats_service.save_stats(stats)
+            
+        except ServiceBusyError:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to reconcile system stats: {str(e)}")
+    
+    def _count_stats(self) -> tuple:
+        """Counters and per-day recent question counts computed from the source data"""
+        users_container = self.cosmos_service.database.get_container_client('Users')
+        since = StatsService.recent_since()
+        
+        results = self.cosmos_service.run_queries({
+            "totalUsers": {
+                "query": "SELECT VALUE COUNT(1) FROM c WHERE c.email != null",
+                "container": users_container
+            },
+            "totalQuestions": {
+                "query": "SELECT VALUE COUNT(1) FROM c WHERE c.title != null"
+            },
+            "totalAnswers": {
+                "query": "SELECT VALUE SUM(ARRAY_LENGTH(c.answers)) FROM c WHERE c.answers != null"
+            },
+            "answeredQuestions": {
+                "query": "SELECT VALUE COUNT(1) FROM c WHERE c.status = 'answered'"
+            },
+            "pendingQuestions": {
+                "query": "SELECT VALUE COUNT(1) FROM c WHERE c.status = 'pending'"
+            },
+            # Bucket recent questions by day so the window can slide without rescanning
+            "recentTimestamps": {
+                "query": "SELECT VALUE c.timestamp FROM c WHERE c.title != null AND c.timestamp >= @since",
+                "parameters": [{"name": "@since", "value": since}]
+            },
+            "storageBytes": self.blob_service.get_storage_usage
+        })
+        
+        questions_by_day = {}
+        for timestamp in results.pop("recentTimestamps"):
+            day = self.stats_service.day_key(timestamp)
+            questions_by_day[day] = questions_by_day.get(day, 0) + 1
+        
+        counters = {"storageBytes": results.pop("storageBytes")}
+        for name, rows in results.items():
+            # Aggregates return a single value; SUM over no documents returns nothing
+            counters[name] = rows[0] if rows and rows[0] else 0
+        return counters, questions_by_day
+    
+    @staticmethod
+    def _format_bytes(size: int) -> str:
+        """Human readable size, e.g. 1.5 GB"""
+        for unit in ("B", "KB", "MB", "GB"):
+            if size < 1024:
+                return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+            size /= 1024
+        return f"{size:.1f} TB"
+    
     def moderate_content(self, target_type: str, target_id: str, action: str, moderator_id: str) -> dict:
         """Moderate content (remove, flag, etc.)"""
         try:
@@ -87,55 +116,43 @@ class AdminService:
     def _moderate_question(self, question_id: str, action: str, moderator_id: str) -> dict:
         """Moderate a question"""
         try:
-            question = self.cosmos_service.get_question(question_id)
-            if not question:
-                raise Exception("Question not found")
+            previous = {}
             
             if action == "remove":
                 # Soft delete by adding moderation info
-                question["moderated"] = True
-                question["moderatedBy"] = moderator_id
-                question["moderatedAt"] = datetime.utcnow().isoformat()
-                question["moderationAction"] = "removed"
-                question["status"] = "removed"
-                
-                updated_question = self.cosmos_service.container.replace_item(
-                    item=question_id, 
-                    body=question
-                )
-                
-                return {
-                    "success": True,
-                    "message": "Question removed successfully",
-                    "questionId": question_id,
-                    "action": action
-                }
+                def build_operations(question):
+                    previous["status"] = question.get("status")
+                    return [
+                        {"op": "set", "path": "/moderated", "value": True},
+                        {"op": "set", "path": "/moderatedBy", "value": moderator_id},
+                        {"op": "set", "path": "/moderatedAt", "value": datetime.utcnow().isoformat()},
+                        {"op": "set", "path": "/moderationAction", "value": "removed"},
+                        {"op": "set", "path": "/status", "value": "removed"}
+                    ]
+                message = "Question removed successfully"
             
             elif action == "flag":
                 # Add flag without removing
-                if "flags" not in question:
-                    question["flags"] = []
-                
-                question["flags"].append({
-                    "flaggedBy": moderator_id,
-                    "flaggedAt": datetime.utcnow().isoformat(),
-                    "reason": "Admin review"
-                })
-                
-                updated_question = self.cosmos_service.container.replace_item(
-                    item=question_id, 
-                    body=question
-                )
-                
-                return {
-                    "success": True,
-                    "message": "Question flagged successfully",
-                    "questionId": question_id,
-                    "action": action
-                }
+                def build_operations(question):
+                    return [self._flag_operation(question, "/flags", moderator_id)]
+                message = "Question flagged successfully"
             
             else:
                 raise Exception("Invalid moderation action")
+            
+            updated_question = self.cosmos_service.patch_question(question_id, build_operations)
+            if not updated_question:
+                raise Exception("Question not found")
+            
+            if action == "remove":
+                self.stats_service.status_changed(previous["status"], "removed")
+            
+            return {
+                "success": True,
+                "message": message,
+                "questionId": question_id,
+                "action": action
+            }
                 
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to moderate question: {e.message}")
@@ -143,48 +160,32 @@ class AdminService:
     def _moderate_answer(self, answer_id: str, action: str, moderator_id: str) -> dict:
         """Moderate an answer"""
         try:
-            # Find the question containing this answer
-            query = "SELECT * FROM c WHERE ARRAY_CONTAINS(c.answers, {'answerId': @answerId}, true)"
-            parameters = [{"name": "@answerId", "value": answer_id}]
-            
-            questions = list(self.cosmos_service.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            if action not in ("remove", "flag"):
+                raise Exception("Invalid moderation action")
             
-            if not questions:
+            question = self.cosmos_service.find_question_for_answer(answer_id)
+            if not question:
                 raise Exception("Answer not found")
             
-            question = questions[0]
-            
-            # Find and moderate the specific answer
-            for i, answer in enumerate(question["answers"]):
-                if answer["answerId"] == answer_id:
-                    if action == "remove":
-                        answer["moderated"] = True
-                        answer["moderatedBy"] = moderator_id
-                        answer["moderatedAt"] = datetime.utcnow().isoformat()
-                        answer["moderationAction"] = "removed"
-                        answer["textResponse"] = "[This answer has been removed by moderation]"
-                        
-                    elif action == "flag":
-                        if "flags" not in answer:
-                            answer["flags"] = []
-                        
-                        answer["flags"].append({
-                            "flaggedBy": moderator_id,
-                            "flaggedAt": datetime.utcnow().isoformat(),
-                            "reason": "Admin review"
-                        })
-                    
-                    break
-            
-            # Update the question with moderated answer
-            updated_question = self.cosmos_service.container.replace_item(
-                item=question["id"], 
-                body=question
-            )
+            def build_operations(current):
+                index = self.cosmos_service.find_answer_index(current, answer_id)
+                if index is None:
+                    return None
+                
+                answer_path = f"/answers/{index}"
+                if action == "remove":
+                    return [
+                        {"op": "set", "path": f"{answer_path}/moderated", "value": True},
+                        {"op": "set", "path": f"{answer_path}/moderatedBy", "value": moderator_id},
+                        {"op": "set", "path": f"{answer_path}/moderatedAt", "value": datetime.utcnow().isoformat()},
+                        {"op": "set", "path": f"{answer_path}/moderationAction", "value": "removed"},
+                        {"op": "set", "path": f"{answer_path}/textResponse", "value": "[This answer has been removed by moderation]"}
+                    ]
+                return [self._flag_operation(current["answers"][index], f"{answer_path}/flags", moderator_id)]
+            
+            updated_question = self.cosmos_service.patch_question(question["id"], build_operations, question=question)
+            if not updated_question:
+                raise Exception("Answer not found")
             
             return {
                 "success": True,
@@ -196,22 +197,33 @@ class AdminService:
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to moderate answer: {e.message}")
     
+    @staticmethod
+    def _flag_operation(target: dict, flags_path: str, moderator_id: str) -> dict:
+        """Build the patch operation that appends an admin-review flag to target"""
+        flag = {
+            "flaggedBy": moderator_id,
+            "flaggedAt": datetime.utcnow().isoformat(),
+            "reason": "Admin review"
+        }
+        if "flags" in target:
+            return {"op": "add", "path": f"{flags_path}/-", "value": flag}
+        return {"op": "set", "path": flags_path, "value": [flag]}
+    
     def get_flagged_content(self) -> dict:
         """Get all flagged content for review"""
         try:
-            # Get flagged questions
-            flagged_questions_query = "SELECT * FROM c WHERE IS_DEFINED(c.flags) AND ARRAY_LENGTH(c.flags) > 0"
-            flagged_questions = list(self.cosmos_service.container.query_items(
-                query=flagged_questions_query,
-                enable_cross_partition_query=True
-            ))
-            
-            # Get questions with flagged answers
-            flagged_answers_query = "SELECT * FROM c WHERE EXISTS(SELECT VALUE a FROM a IN c.answers WHERE IS_DEFINED(a.flags))"
-            questions_with_flagged_answers = list(self.cosmos_service.container.query_items(
-                query=flagged_answers_query,
-                enable_cross_partition_query=True
-            ))
+            results = self.cosmos_service.run_queries({
+                # Get flagged questions
+                "flaggedQuestions": {
+                    "query": "SELECT * FROM c WHERE IS_DEFINED(c.flags) AND ARRAY_LENGTH(c.flags) > 0"
+                },
+                # Get questions with flagged answers
+                "questionsWithFlaggedAnswers": {
+                    "query": "SELECT * FROM c WHERE EXISTS(SELECT VALUE a FROM a IN c.answers WHERE IS_DEFINED(a.flags))"
+                }
+            })
+            flagged_questions = results["flaggedQuestions"]
+            questions_with_flagged_answers = results["questionsWithFlaggedAnswers"]
             
             return {
                 "flaggedQuestions": flagged_questions,
@@ -219,29 +231,29 @@ class AdminService:
                 "totalFlagged": len(flagged_questions) + len(questions_with_flagged_answers)
             }
             
-        except exceptions.CosmosHttpResponseError as e:
-            raise Exception(f"Failed to get flagged content: {e.message}")
+        except ServiceBusyError:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to get flagged content: {str(e)}")
     
     def get_user_activity(self, user_id: str) -> dict:
         """Get detailed user activity"""
         try:
-            # Get user's questions
-            user_questions_query = "SELECT * FROM c WHERE c.userId = @userId"
             parameters = [{"name": "@userId", "value": user_id}]
-            
-            user_questions = list(self.cosmos_service.container.query_items(
-                query=user_questions_query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-            
-            # Get user's answers
-            user_answers_query = "SELECT c.id, c.title, a FROM c JOIN a IN c.answers WHERE a.userId = @userId"
-            user_answers = list(self.cosmos_service.container.query_items(
-                query=user_answers_query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            results = self.cosmos_service.run_queries({
+                # Get user's questions
+                "questions": {
+                    "query": "SELECT * FROM c WHERE c.userId = @userId",
+                    "parameters": parameters
+                },
+                # Get user's answers
+                "answers": {
+                    "query": "SELECT c.id, c.title, a FROM c JOIN a IN c.answers WHERE a.userId = @userId",
+                    "parameters": parameters
+                }
+            })
+            user_questions = results["questions"]
+            user_answers = results["answers"]
             
             return {
                 "userId": user_id,
@@ -251,5 +263,7 @@ class AdminService:
                 "answers": user_answers
             }
             
-        except exceptions.CosmosHttpResponseError as e:
-            raise Exception(f"Failed to get user activity: {e.message}")
\ No newline at end of file
+        except ServiceBusyError:
+            raise
+        except Exception as e:
+            raise Exception(f"Failed to get user activity: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Async Blob Storage reads for the ASGI media proxy
+Properties and ranged downloads go through azure.storage.blob.aio. The local
+media cache lives on disk, so with the same MEDIA_CACHE_DIR it is shared with the
+threaded app's workers on this host; cache fills still run on the cache's own
+fill threads with the synchronous client.
+"""
+
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional
+from azure.core import MatchConditions
+from azure.storage.blob.aio import BlobServiceClient
+from dotenv import load_dotenv
+from services.async_clients import create_transport, get_override
+from services.blob_service import BlobService, get_media_cache
+from services.clients import BLOB_DOWNLOAD_CHUNK_BYTES, get_blob_service_client
+
+load_dotenv()
+
+
+class AsyncBlobService:
+    def __init__(self):
+        self.blob_service_client = None
+        self.container_name = os.getenv('AZURE_BLOB_CONTAINER_NAME')
+        self.media_cache = get_media_cache()
+
+    async def open(self) -> None:
+        """Create the client; must be called from the event loop that will use it"""
+        self.blob_service_client = get_override('blob') or BlobServiceClient.from_connection_string(
+            os.getenv('AZURE_BLOB_CONNECTION_STRING'),
+            transport=create_transport('BLOB'),
+            max_single_get_size=BLOB_DOWNLOAD_CHUNK_BYTES,
+            max_chunk_get_size=BLOB_DOWNLOAD_CHUNK_BYTES
+        )
+
+    async def close(self) -> None:
+        if self.blob_service_client is not None:
+            await self.blob_service_client.close()
+            self.blob_service_client = None
+
+    def _blob_client(self, blob_name: str):
+        return self.blob_service_client.get_blob_client(container=self.container_name, blob=blob_name)
+
+    async def get_media_properties(self, blob_name: str) -> Dict[str, Any]:
+        """Get what the media proxy needs to answer a request from a single properties call"""
+        try:
+            properties = await self._blob_client(blob_name).get_blob_properties()
+
+            content_type = properties.content_settings.content_type
+            if not content_type or content_type == 'application/octet-stream':
+                file_extension = blob_name.split('.')[-1] if '.' in blob_name else ''
+                content_type = BlobService._get_content_type(file_extension)
+
+            return {
+                'content_type': content_type,
+                'content_length': properties.size,
+                'etag': properties.etag,
+                'last_modified': properties.last_modified
+            }
+        except Exception as e:
+            raise Exception(f"Failed to get blob data: {str(e)}")
+
+    async def download_range(self, blob_name: str, offset: int = 0, length: Optional[int] = None,
+                             etag: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Start a (ranged) download and return an async iterator over its chunks"""
+        try:
+            conditions = {'etag': etag, 'match_condition': MatchConditions.IfNotModified} if etag else {}
+            downloader = await self._blob_client(blob_name).download_blob(offset=offset, length=length, **conditions)
+            return downloader.chunks()
+        except Exception as e:
+            raise Exception(f"Failed to get blob data: {str(e)}")
+
+    def get_cached_media(self, blob_name: str) -> Optional[Dict[str, Any]]:
+        """Get a locally cached copy of a blob, or None"""
+        if not self.media_cache:
+            return None
+        media = self.media_cache.get(blob_name)
+        if media:
+            media['last_modified'] = datetime.fromisoformat(media['last_modified'])
+        return media
+
+    def cache_media(self, blob_name: str, media: Dict[str, Any]) -> None:
+        """Fill the local media cache for a blob in the background"""
+        if not self.media_cache:
+            return
+        metadata = dict(media, last_modified=media['last_modified'].isoformat())
+        conditions = {'etag': media['etag'], 'match_condition': MatchConditions.IfNotModified}
+        self.media_cache.fill_async(
+            blob_name,
+            metadata,
+            lambda: get_blob_service_client().get_blob_client(
+                container=self.container_name,
+                blob=blob_name
+            ).download_blob(**conditions).chunks()
+        )
@@ -0,0 +1,51 @@
+"""
+Azure SDK transports for the async serving path
+
+The aio clients run on aiohttp, whose sessions are bound to the event loop that
+created them, so these are built when the ASGI app starts serving (not at
+import time) and closed when it stops.
+"""
+
+import os
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_sessions = []
+# Clients installed by override_clients, used instead of connecting to the configured accounts
+_overrides = {}
+
+
+def create_transport(prefix: str) -> AioHttpTransport:
+    """Build a transport sized by ASYNC_<prefix>_POOL_SIZE and <prefix>_KEEPALIVE_SECONDS
+
+    One socket serves one request at a time, so the pool size caps how many
+    calls to this service can be in flight from the event loop.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=int(os.getenv(f'ASYNC_{prefix}_POOL_SIZE', '200')),
+        keepalive_timeout=int(os.getenv(f'{prefix}_KEEPALIVE_SECONDS', '60'))
+    )
+    session = aiohttp.ClientSession(connector=connector)
+    _sessions.append(session)
+    return AioHttpTransport(session=session, session_owner=False)
+
+
+async def close_transports() -> None:
+    """Close every session opened by create_transport in this event loop"""
+    while _sessions:
+        await _sessions.pop().close()
+
+
+def override_clients(cosmos_client=None, blob_service_client=None) -> None:
+    """Hand these aio clients to the async services instead of connecting to Azure
+    (e.g. local stand-ins for benchmarks); must be called before the app starts serving"""
+    _overrides['cosmos'] = cosmos_client
+    _overrides['blob'] = blob_service_client
+
+
+def get_override(name: str):
+    """The client installed for 'cosmos' or 'blob' by override_clients, or None"""
+    return _overrides.get(name)
@@ -0,0 +1,112 @@
+"""
+Async Cosmos DB reads for the ASGI serving path
+Mirrors the read side of CosmosService on azure.cosmos.aio and shares its
+query builders, so the two apps return identical documents.
+
+The async app runs in its own process, where writes made through app.py cannot
+invalidate cached questions, so it keeps a separate question cache whose TTL
+(ASYNC_QUESTION_CACHE_TTL_SECONDS) bounds how stale a read can be.
+"""
+
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from azure.cosmos import exceptions
+from azure.cosmos.aio import CosmosClient
+from dotenv import load_dotenv
+from services.async_clients import create_transport, get_override
+from services.cache import TTLCache
+from services.cosmos_service import CosmosService
+from services.stats_service import STATS_CONTAINER_NAME, STATS_DOCUMENT_ID, StatsService
+
+load_dotenv()
+
+FEED_QUERY = "SELECT * FROM c ORDER BY c.timestamp DESC"
+
+question_cache = TTLCache(
+    max_size=int(os.getenv('QUESTION_CACHE_SIZE', '1000')),
+    ttl_seconds=float(os.getenv('ASYNC_QUESTION_CACHE_TTL_SECONDS', '5')),
+    copy_values=True
+)
+
+
+class AsyncCosmosService:
+    def __init__(self):
+        self.client = None
+        self.question_cache = question_cache
+
+    async def open(self) -> None:
+        """Create the client; must be called from the event loop that will use it"""
+        self.client = get_override('cosmos') or CosmosClient(
+            os.getenv('AZURE_COSMOS_URI'),
+            os.getenv('AZURE_COSMOS_KEY'),
+            transport=create_transport('COSMOS'),
+            connection_timeout=int(os.getenv('COSMOS_CONNECTION_TIMEOUT', '10'))
+        )
+        self.database = self.client.get_database_client(os.getenv('AZURE_COSMOS_DB_NAME'))
+        self.container = self.database.get_container_client(os.getenv('AZURE_COSMOS_CONTAINER_NAME'))
+        self.stats_container = self.database.get_container_client(STATS_CONTAINER_NAME)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def _query(self, query: str, parameters: Optional[list] = None) -> List[Dict[str, Any]]:
+        return [item async for item in self.container.query_items(query=query, parameters=parameters)]
+
+    async def get_questions(self) -> List[Dict[str, Any]]:
+        """Get all questions ordered by timestamp descending"""
+        try:
+            return await self._query(FEED_QUERY)
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to get questions: {e.message}")
+
+    async def iter_questions(self, page_size: int = 100) -> AsyncIterator[Dict[str, Any]]:
+        """Lazily yield all questions ordered by timestamp descending, one Cosmos page at a time"""
+        try:
+            pages = self.container.query_items(query=FEED_QUERY, max_item_count=page_size).by_page()
+            async for page in pages:
+                async for item in page:
+                    yield item
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to get questions: {e.message}")
+
+    async def get_questions_paginated(self, page: int = 1, limit: int = 20) -> List[Dict[str, Any]]:
+        """Get questions with pagination"""
+        try:
+            return await self._query(CosmosService._page_query(page, limit))
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to get questions: {e.message}")
+
+    async def get_questions_by_cursor(self, cursor: Optional[str] = None, limit: int = 20) -> Tuple[list, Optional[str]]:
+        """Get a page of questions after a keyset cursor and the cursor for the next page"""
+        try:
+            query, parameters = CosmosService._cursor_query(cursor, limit)
+            items = await self._query(query, parameters)
+            return items, CosmosService._next_cursor(cursor, items, limit)
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to get questions: {e.message}")
+
+    async def get_question(self, question_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """Get a specific question by ID, served from the question cache when possible"""
+        if use_cache:
+            cached = self.question_cache.get(question_id)
+            if cached is not None:
+                return cached
+        try:
+            question = await self.container.read_item(item=question_id, partition_key=question_id)
+            self.question_cache.put(question_id, question)
+            return question
+        except exceptions.CosmosResourceNotFoundError:
+            self.question_cache.invalidate(question_id)
+            return None
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to get question: {e.message}")
+
+    async def get_stats(self) -> Optional[Dict[str, Any]]:
+        """Return the counters document, or None if it is missing or due for reconciliation"""
+        try:
+            stats = await self.stats_container.read_item(item=STATS_DOCUMENT_ID, partition_key=STATS_DOCUMENT_ID)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+        return stats if StatsService.is_current(stats) else None
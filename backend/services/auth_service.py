@@ -1,37 +1,62 @@
 import os
 import jwt
-import bcrypt
+import time
 import uuid
+import hashlib
+import logging
 from datetime import datetime, timedelta
+from typing import Dict, Iterable
+from azure.core import MatchConditions
 from azure.cosmos import exceptions
+from services.cache import TTLCache
 from services.cosmos_service import CosmosService
+from services.password_hasher import PasswordHasher
 from models.user import User, UserRole
 
-class AuthService:
+logger = logging.getLogger(__name__)
+
+# Users are partitioned by /id, so each email also gets a small index document
+# keyed by a hash of the normalized address (ids may not contain / \ ? #);
+# looking a user up by email is then a point read
+EMAIL_INDEX_PREFIX = 'email:'
+EMAIL_INDEX_MARKER_ID = 'meta:email-index-sha256'
+
+# An index entry without its user may belong to a registration still in progress;
+# only entries older than this are treated as abandoned and reclaimed
+EMAIL_INDEX_RECLAIM_SECONDS = 60
+
+# Claims of tokens whose signature has already been checked, keyed by token digest
+token_cache = TTLCache(
+    max_size=int(os.getenv('JWT_CACHE_SIZE', '10000')),
+    ttl_seconds=float(os.getenv('JWT_CACHE_TTL_SECONDS', '300'))
+)
+
+# User profiles by id; writes through any AuthService in this process invalidate them
+user_cache = TTLCache(
+    max_size=int(os.getenv('USER_CACHE_SIZE', '5000')),
+    ttl_seconds=float(os.getenv('USER_CACHE_TTL_SECONDS', '60')),
+    copy_values=True
+)
+
+# Ids per lookup when read_items is unavailable and we fall back to a query
+USER_BATCH_SIZE = 100
+
+_bcrypt_workers = int(os.getenv('BCRYPT_WORKERS', str(min(4, os.cpu_count() or 1))))
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv('BCRYPT_ROUNDS', '12')),
+    workers=_bcrypt_workers,
+    max_pending=int(os.getenv('BCRYPT_MAX_PENDING', str(_bcrypt_workers * 4))),
+    retry_after=int(os.getenv('BCRYPT_RETRY_AFTER_SECONDS', '1'))
+)
+
+class TokenService:
+    """JWT issuing and verification, usable without any Cosmos connection"""
+
     def __init__(self):
-        self.cosmos_service = CosmosService()
         self.jwt_secret = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
         self.jwt_algorithm = 'HS256'
         self.jwt_expiration_hours = 24
-        
-        # Initialize users container
-        try:
-            self.users_container = self.cosmos_service.database.get_container_client('Users')
-        except exceptions.CosmosResourceNotFoundError:
-            # Create container if it doesn't exist
-            self.users_container = self.cosmos_service.database.create_container(
-                id='Users',
-                partition_key={'paths': ['/id'], 'kind': 'Hash'}
-            )
-    
-    def hash_password(self, password: str) -> str:
-        """Hash a password using bcrypt"""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
-    
-    def verify_password(self, password: str, password_hash: str) -> bool:
-        """Verify a password against its hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        self.token_cache = token_cache
     
     def generate_jwt_token(self, user: User) -> str:
         """Generate JWT token for user"""
@@ -53,18 +78,180 @@ class AuthService:
             raise Exception("Token has expired")
         except jwt.InvalidTokenError:
             raise Exception("Invalid token")
+
+    def verify_jwt_token_cached(self, token: str) -> dict:
+        """Verify a JWT, skipping the signature check for tokens verified recently
+
+        Entries never outlive the token's own exp claim. The returned claims are
+        shared between requests and must not be modified.
+        """
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        payload = self.token_cache.get(key)
+        if payload is not None:
+            return payload
+
+        payload = self.verify_jwt_token(token)
+        if 'exp' in payload:
+            self.token_cache.put(key, payload, ttl_seconds=payload['exp'] - time.time())
+        return payload
+
+
+class AuthService(TokenService):
+    def __init__(self):
+        super().__init__()
+        self.cosmos_service = CosmosService()
+        self.user_cache = user_cache
+        self.password_hasher = password_hasher
+        self._index_complete = False
+        self._index_checked_at = float('-inf')
+        
+        # Initialize users container
+        try:
+            self.users_container = self.cosmos_service.database.get_container_client('Users')
+        except exceptions.CosmosResourceNotFoundError:
+            # Create container if it doesn't exist
+            self.users_container = self.cosmos_service.database.create_container(
+                id='Users',
+                partition_key={'paths': ['/id'], 'kind': 'Hash'}
+            )
+    
+    def hash_password(self, password: str) -> str:
+        """Hash a password using bcrypt on the bounded hashing pool"""
+        return self.password_hasher.hash(password)
+    
+    def verify_password(self, password: str, password_hash: str) -> bool:
+        """Verify a password against its hash on the bounded hashing pool"""
+        return self.password_hasher.verify(password, password_hash)
+
+    def _rehash_if_needed(self, user_id: str, password: str, password_hash: str) -> None:
+        """Upgrade a stored hash to the configured cost after a successful login"""
+        if not self.password_hasher.needs_rehash(password_hash):
+            return
+        try:
+            self.users_container.patch_item(
+                item=user_id,
+                partition_key=user_id,
+                patch_operations=[{"op": "set", "path": "/passwordHash", "value": self.hash_password(password)}]
+            )
+            self.user_cache.invalidate(user_id)
+        except Exception as e:
+            # The old hash still works; try again on the next login
+            logger.warning(f"Failed to rehash password for user {user_id}: {str(e)}")
+    
+    @staticmethod
+    def _email_index_id(email: str) -> str:
+        return EMAIL_INDEX_PREFIX + hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()
+
+    def _email_index_entry(self, email: str, user_id: str) -> dict:
+        return {
+            "id": self._email_index_id(email),
+            "indexedEmail": email.strip().lower(),
+            "userId": user_id,
+            "createdAt": datetime.utcnow().isoformat()
+        }
+
+    def _read_email_index(self, email: str) -> dict:
+        """The index entry for an email, or None"""
+        index_id = self._email_index_id(email)
+        try:
+            return self.users_container.read_item(item=index_id, partition_key=index_id)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    def _create_email_index(self, email: str, user_id: str) -> None:
+        """Claim an email for a user; raises CosmosResourceExistsError if it is taken"""
+        self.users_container.create_item(body=self._email_index_entry(email, user_id))
+
+    def _email_index_complete(self) -> bool:
+        """Whether every pre-index user has been backfilled, so a missing index entry means no user"""
+        if self._index_complete:
+            return True
+        now = time.monotonic()
+        if now - self._index_checked_at < 60:
+            return False
+        self._index_checked_at = now
+        try:
+            self.users_container.read_item(item=EMAIL_INDEX_MARKER_ID, partition_key=EMAIL_INDEX_MARKER_ID)
+            self._index_complete = True
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+        return self._index_complete
+
+    def _query_user_by_email(self, email: str) -> dict:
+        """Cross-partition lookup for users registered before the email index existed
+
+        Case-insensitive, like the index, so a differently cased address still matches.
+        """
+        query = "SELECT * FROM c WHERE LOWER(c.email) = @email"
+        parameters = [{"name": "@email", "value": email.strip().lower()}]
+        
+        items = list(self.users_container.query_items(
+            query=query,
+            parameters=parameters,
+            enable_cross_partition_query=True
+        ))
+        return items[0] if items else None
+
+    def _read_user_by_email(self, email: str) -> dict:
+        """Raw user document for an email, or None"""
+        index_id = self._email_index_id(email)
+        try:
+            index = self.users_container.read_item(item=index_id, partition_key=index_id)
+            return self.users_container.read_item(item=index["userId"], partition_key=index["userId"])
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+        if self._email_index_complete():
+            return None
+
+        user_data = self._query_user_by_email(email)
+        if user_data:
+            # Backfill so the next lookup for this user is a point read
+            try:
+                self._create_email_index(user_data["email"], user_data["id"])
+            except exceptions.CosmosHttpResponseError:
+                pass
+        return user_data
+
+    def backfill_email_index(self) -> int:
+        """Index every existing user's email, then mark the index complete; returns users indexed"""
+        try:
+            indexed = 0
+            query = "SELECT c.id, c.email FROM c WHERE IS_DEFINED(c.email)"
+            for user in self.users_container.query_items(query=query, enable_cross_partition_query=True):
+                try:
+                    self._create_email_index(user["email"], user["id"])
+                    indexed += 1
+                except exceptions.CosmosResourceExistsError:
+                    pass
+
+            self.users_container.upsert_item(body={
+                "id": EMAIL_INDEX_MARKER_ID,
+                "backfilledAt": datetime.utcnow().isoformat()
+            })
+            self._index_complete = True
+            return indexed
+            
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to backfill email index: {e.message}")
     
     def register_user(self, email: str, password: str, full_name: str, role: str = "student") -> User:
         """Register a new user"""
         try:
-            # Check if user already exists
-            existing_user = self.get_user_by_email(email)
-            if existing_user:
+            # Users from before the index existed are only found by the fallback query
+            if not self._email_index_complete() and self._query_user_by_email(email):
                 raise Exception("User with this email already exists")
             
             # Create new user
             user_id = str(uuid.uuid4())
             password_hash = self.hash_password(password)
+
+            # Creating the index entry first makes the uniqueness check atomic
+            try:
+                self._create_email_index(email, user_id)
+            except exceptions.CosmosResourceExistsError:
+                if not self._reclaim_email_index(email, user_id):
+                    raise Exception("User with this email already exists")
             
             user_data = {
                 "id": user_id,
@@ -76,26 +263,84 @@ class AuthService:
                 "isActive": True
             }
             
-            created_user = self.users_container.create_item(body=user_data)
+            try:
+                created_user = self.users_container.create_item(body=user_data)
+            except exceptions.CosmosHttpResponseError:
+                self._delete_email_index(email, user_id)
+                raise
+
+            # A registration that judged our entry abandoned may have taken it over meanwhile
+            index = self._read_email_index(email)
+            if not index or index["userId"] != user_id:
+                self.users_container.delete_item(item=user_id, partition_key=user_id)
+                raise Exception("User with this email already exists")
+            self.cosmos_service.stats_service.increment(totalUsers=1)
             return User.from_dict(created_user)
             
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to register user: {e.message}")
+
+    def _reclaim_email_index(self, email: str, user_id: str) -> bool:
+        """Take over an index entry whose user does not exist and that is older than
+        EMAIL_INDEX_RECLAIM_SECONDS (left by a registration that failed part-way);
+        False if the email belongs to a user, may still be mid-registration, or
+        another registration claimed it first"""
+        index_id = self._email_index_id(email)
+        index = self._read_email_index(email)
+        if not index:
+            return False
+        created_at = index.get("createdAt")
+        if created_at and (datetime.utcnow() - datetime.fromisoformat(created_at)).total_seconds() < EMAIL_INDEX_RECLAIM_SECONDS:
+            return False
+        try:
+            self.users_container.read_item(item=index["userId"], partition_key=index["userId"])
+            return False
+        except exceptions.CosmosResourceNotFoundError:
+            pass
+
+        try:
+            self.users_container.replace_item(
+                item=index_id,
+                body=self._email_index_entry(email, user_id),
+                etag=index["_etag"],
+                match_condition=MatchConditions.IfNotModified
+            )
+            return True
+        except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceNotFoundError):
+            return False
+
+    def _delete_email_index(self, email: str, user_id: str) -> None:
+        """Release an email, but only while the index entry still belongs to user_id"""
+        index = self._read_email_index(email)
+        if not index or index["userId"] != user_id:
+            return
+        try:
+            self.users_container.delete_item(
+                item=index["id"],
+                partition_key=index["id"],
+                etag=index["_etag"],
+                match_condition=MatchConditions.IfNotModified
+            )
+        except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceNotFoundError):
+            pass
     
     def authenticate_user(self, email: str, password: str) -> tuple[User, str]:
         """Authenticate user and return user object with JWT token"""
-        user = self.get_user_by_email(email)
-        if not user:
+        try:
+            user_data = self._read_user_by_email(email)
+        except exceptions.CosmosHttpResponseError:
+            user_data = None
+        if not user_data:
             raise Exception("Invalid email or password")
         
+        user = User.from_dict(user_data)
         if not user.is_active:
             raise Exception("Account is deactivated")
         
-        # Get user data from Cosmos DB to verify password
-        user_data = self.users_container.read_item(item=user.id, partition_key=user.id)
-        
         if not self.verify_password(password, user_data['passwordHash']):
             raise Exception("Invalid email or password")
+
+        self._rehash_if_needed(user.id, password, user_data['passwordHash'])
         
         token = self.generate_jwt_token(user)
         return user, token
@@ -103,38 +348,90 @@ class AuthService:
     def get_user_by_email(self, email: str) -> User:
         """Get user by email"""
         try:
-            query = "SELECT * FROM c WHERE c.email = @email"
-            parameters = [{"name": "@email", "value": email}]
-            
-            items = list(self.users_container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-            
-            if items:
-                return User.from_dict(items[0])
+            user_data = self._read_user_by_email(email)
+            if user_data:
+                return User.from_dict(user_data)
             return None
             
         except exceptions.CosmosHttpResponseError:
             return None
     
-    def get_user_by_id(self, user_id: str) -> User:
+    def get_user_by_id(self, user_id: str, use_cache: bool = True) -> User:
         """Get user by ID"""
+        if use_cache:
+            user = self.user_cache.get(user_id)
+            if user is not None:
+                return user
         try:
             user_data = self.users_container.read_item(item=user_id, partition_key=user_id)
-            return User.from_dict(user_data)
+            user = User.from_dict(user_data)
+            self.user_cache.put(user_id, user)
+            return user
         except exceptions.CosmosResourceNotFoundError:
             return None
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to get user: {e.message}")
+
+    def get_users_by_ids(self, user_ids: Iterable[str]) -> Dict[str, User]:
+        """Batch-fetch users by id, serving what it can from the cache; unknown ids are omitted"""
+        users = {}
+        missing = []
+        for user_id in dict.fromkeys(user_id for user_id in user_ids if user_id):
+            user = self.user_cache.get(user_id)
+            if user is not None:
+                users[user_id] = user
+            else:
+                missing.append(user_id)
+
+        try:
+            for user_data in self._read_users(missing):
+                user = User.from_dict(user_data)
+                self.user_cache.put(user.id, user)
+                users[user.id] = user
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to get users: {e.message}")
+        return users
+
+    def _read_users(self, user_ids: list) -> list:
+        """Raw user documents for ids, in one read_items call where the SDK supports it"""
+        if not user_ids:
+            return []
+
+        read_items = getattr(self.users_container, 'read_items', None)
+        if read_items:
+            return list(read_items(items=[(user_id, user_id) for user_id in user_ids]))
+
+        results = []
+        for start in range(0, len(user_ids), USER_BATCH_SIZE):
+            results.extend(self.users_container.query_items(
+                query="SELECT * FROM c WHERE ARRAY_CONTAINS(@ids, c.id)",
+                parameters=[{"name": "@ids", "value": user_ids[start:start + USER_BATCH_SIZE]}],
+                enable_cross_partition_query=True
+            ))
+        return results
     
     def update_user(self, user_id: str, updates: dict) -> User:
         """Update user information"""
         try:
             user_data = self.users_container.read_item(item=user_id, partition_key=user_id)
+            old_email = user_data.get("email")
+            email_changed = "email" in updates and self._email_index_id(updates["email"]) != self._email_index_id(old_email)
+            if email_changed:
+                try:
+                    self._create_email_index(updates["email"], user_id)
+                except exceptions.CosmosResourceExistsError:
+                    raise Exception("User with this email already exists")
+
             user_data.update(updates)
-            updated_user = self.users_container.replace_item(item=user_id, body=user_data)
+            try:
+                updated_user = self.users_container.replace_item(item=user_id, body=user_data)
+            except exceptions.CosmosHttpResponseError:
+                if email_changed:
+                    self._delete_email_index(updates["email"], user_id)
+                raise
+            self.user_cache.invalidate(user_id)
+            if email_changed:
+                self._delete_email_index(old_email, user_id)
             return User.from_dict(updated_user)
         except exceptions.CosmosResourceNotFoundError:
             raise Exception("User not found")
@@ -152,7 +449,8 @@ class AuthService:
         """Get all users with pagination"""
         try:
             offset = (page - 1) * limit
-            query = f"SELECT * FROM c ORDER BY c.createdAt DESC OFFSET {offset} LIMIT {limit}"
+            # Skip email index entries, which share the container
+            query = f"SELECT * FROM c WHERE IS_DEFINED(c.email) ORDER BY c.createdAt DESC OFFSET {offset} LIMIT {limit}"
             
             items = list(self.users_container.query_items(
                 query=query,
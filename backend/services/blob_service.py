@@ -1,19 +1,53 @@
 import os
 import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions, ContentSettings
+from azure.core import MatchConditions
+from azure.storage.blob import generate_blob_sas, BlobBlock, BlobSasPermissions, ContentSettings
 from dotenv import load_dotenv
+from services.clients import get_blob_service_client
+from services.media_cache import MediaCache
 
 load_dotenv()
 
+# Uploads are split into blocks staged in parallel; each upload keeps at most
+# UPLOAD_CONCURRENCY blocks in flight so memory per upload stays constant
+UPLOAD_BLOCK_SIZE = int(os.getenv('UPLOAD_BLOCK_SIZE', str(4 * 1024 * 1024)))
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', '4'))
+_upload_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('UPLOAD_WORKERS', '16')),
+    thread_name_prefix='blob-upload'
+)
+
+_media_cache = None
+_media_cache_lock = threading.Lock()
+
+def get_media_cache():
+    """Return the process-wide media disk cache, or None when MEDIA_CACHE_MAX_BYTES is 0"""
+    global _media_cache
+    max_bytes = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+    if max_bytes <= 0:
+        return None
+    with _media_cache_lock:
+        if _media_cache is None:
+            _media_cache = MediaCache(
+                directory=os.getenv('MEDIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'peerview-media-cache')),
+                max_bytes=max_bytes,
+                max_object_bytes=int(os.getenv('MEDIA_CACHE_MAX_OBJECT_BYTES', str(200 * 1024 * 1024)))
+            )
+    return _media_cache
+
 class BlobService:
-    def __init__(self):
-        self.blob_service_client = BlobServiceClient.from_connection_string(
-            os.getenv('AZURE_BLOB_CONNECTION_STRING')
-        )
+    def __init__(self, stats_service=None):
+        self.blob_service_client = get_blob_service_client()
         self.container_name = os.getenv('AZURE_BLOB_CONTAINER_NAME')
         self.account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
         self.account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
+        # Told about uploaded bytes when given; without one this service never touches Cosmos
+        self.stats_service = stats_service
+        self.media_cache = get_media_cache()
     
     def upload_file(self, file):
         """Upload file to Azure Blob Storage and return proxy URL"""
@@ -31,19 +65,69 @@ class BlobService:
                 blob=blob_name
             )
             
-            # Upload file with proper content type
-            blob_client.upload_blob(
-                file.read(), 
-                overwrite=True,
-                content_settings=ContentSettings(content_type=content_type)
+            # Upload file with proper content type, streaming it in blocks
+            size = self.upload_stream(
+                blob_client,
+                file.stream,
+                ContentSettings(content_type=content_type)
             )
+            if self.stats_service is not None:
+                self.stats_service.increment(storageBytes=size)
             
             # Return proxy URL through our backend
             return f"/api/media/{blob_name}"
         except Exception as e:
             raise Exception(f"Failed to upload file: {str(e)}")
     
-    def _get_content_type(self, file_extension):
+    def upload_stream(self, blob_client, stream, content_settings: ContentSettings) -> int:
+        """Upload a readable stream as a block blob and return its size in bytes
+        
+        Small files go up in a single request. Larger ones are read in
+        UPLOAD_BLOCK_SIZE chunks that are staged concurrently, with at most
+        UPLOAD_CONCURRENCY blocks in flight, then committed as one block list.
+        """
+        first_chunk = stream.read(UPLOAD_BLOCK_SIZE)
+        if len(first_chunk) < UPLOAD_BLOCK_SIZE:
+            blob_client.upload_blob(first_chunk, overwrite=True, content_settings=content_settings)
+            return len(first_chunk)
+        
+        window = threading.BoundedSemaphore(UPLOAD_CONCURRENCY)
+        futures = []
+        block_list = []
+        size = 0
+        chunk = first_chunk
+        try:
+            while chunk:
+                window.acquire()
+                # Stop reading as soon as any block has failed
+                for future in futures:
+                    if future.done() and future.exception():
+                        window.release()
+                        raise future.exception()
+                
+                block_id = self.make_block_id(size)
+                future = _upload_executor.submit(blob_client.stage_block, block_id, chunk)
+                future.add_done_callback(lambda _: window.release())
+                futures.append(future)
+                block_list.append(BlobBlock(block_id=block_id))
+                size += len(chunk)
+                chunk = stream.read(UPLOAD_BLOCK_SIZE)
+        finally:
+            for future in futures:
+                future.exception()  # Wait for every in-flight block before returning
+        
+        for future in futures:
+            future.result()
+        blob_client.commit_block_list(block_list, content_settings=content_settings)
+        return size
+    
+    @staticmethod
+    def make_block_id(offset: int) -> str:
+        """Block id for the block starting at offset (the SDK base64-encodes it); ids must all be the same length"""
+        return f"{offset:020d}"
+    
+    @staticmethod
+    def _get_content_type(file_extension):
         """Get content type based on file extension"""
         extension_map = {
             'jpg': 'image/jpeg',
@@ -85,6 +169,75 @@ class BlobService:
         except Exception as e:
             raise Exception(f"Failed to get blob data: {str(e)}")
     
+    def get_media_properties(self, blob_name: str) -> dict:
+        """Get what the media proxy needs to answer a request from a single properties call"""
+        try:
+            blob_client = self.blob_service_client.get_blob_client(
+                container=self.container_name,
+                blob=blob_name
+            )
+            properties = blob_client.get_blob_properties()
+            
+            # Get content type from blob properties or determine from filename
+            content_type = properties.content_settings.content_type
+            if not content_type or content_type == 'application/octet-stream':
+                file_extension = blob_name.split('.')[-1] if '.' in blob_name else ''
+                content_type = self._get_content_type(file_extension)
+            
+            return {
+                'content_type': content_type,
+                'content_length': properties.size,
+                'etag': properties.etag,
+                'last_modified': properties.last_modified
+            }
+        except Exception as e:
+            raise Exception(f"Failed to get blob data: {str(e)}")
+    
+    def download_range(self, blob_name: str, offset: int = 0, length: int = None, etag: str = None):
+        """Start a (ranged) download and return an iterator over its chunks
+        
+        The download request is issued before this returns so storage errors surface
+        before the response starts; the body is then pulled chunk by chunk as the
+        caller iterates. Passing etag fails the download if the blob has changed.
+        """
+        try:
+            blob_client = self.blob_service_client.get_blob_client(
+                container=self.container_name,
+                blob=blob_name
+            )
+            conditions = {'etag': etag, 'match_condition': MatchConditions.IfNotModified} if etag else {}
+            downloader = blob_client.download_blob(offset=offset, length=length, **conditions)
+            return downloader.chunks()
+        except Exception as e:
+            raise Exception(f"Failed to get blob data: {str(e)}")
+    
+    def get_cached_media(self, blob_name: str):
+        """Get a locally cached copy of a blob as {path, content_type, content_length, etag, last_modified}, or None"""
+        if not self.media_cache:
+            return None
+        media = self.media_cache.get(blob_name)
+        if media:
+            media['last_modified'] = datetime.fromisoformat(media['last_modified'])
+        return media
+    
+    def cache_media(self, blob_name: str, media: dict) -> None:
+        """Fill the local media cache for a blob in the background"""
+        if not self.media_cache:
+            return
+        metadata = dict(media, last_modified=media['last_modified'].isoformat())
+        self.media_cache.fill_async(
+            blob_name,
+            metadata,
+            lambda: self.download_range(blob_name, etag=media['etag'])
+        )
+    
+    def tee_media(self, blob_name: str, media: dict, chunks):
+        """Wrap a download of the whole blob so it also fills the local media cache"""
+        if not self.media_cache:
+            return chunks
+        metadata = dict(media, last_modified=media['last_modified'].isoformat())
+        return self.media_cache.tee(blob_name, metadata, chunks)
+    
     def generate_upload_url(self, file_name: str, file_type: str) -> dict:
         """Generate SAS URL for direct upload from frontend"""
         try:
@@ -147,6 +300,14 @@ class BlobService:
         except Exception as e:
             raise Exception(f"Failed to get blob properties: {str(e)}")
     
+    def get_storage_usage(self) -> int:
+        """Total size in bytes of all blobs in the container"""
+        try:
+            container_client = self.blob_service_client.get_container_client(self.container_name)
+            return sum(blob.size for blob in container_client.list_blobs())
+        except Exception as e:
+            raise Exception(f"Failed to get storage usage: {str(e)}")
+    
     def list_blobs(self, prefix: str = None) -> list:
         """List all blobs in container"""
         try:
@@ -0,0 +1,138 @@
+"""
+Process-wide Azure SDK client registry
+
+Every service gets its CosmosClient and BlobServiceClient from here so the whole
+process shares one connection pool, metadata cache and warm-up cost per account.
+"""
+
+import os
+import socket
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from azure.core.pipeline.transport import RequestsTransport
+from azure.cosmos import CosmosClient
+from azure.storage.blob import BlobServiceClient
+from dotenv import load_dotenv
+from services import cosmos_instrumentation
+
+load_dotenv()
+
+_clients = {}
+_sessions = []
+_lock = threading.Lock()
+# Clients installed by override_clients, served instead of the configured accounts
+_overrides = {}
+
+# Largest piece a blob download fetches per request, and so buffers before the
+# first byte can be streamed on (the SDK default for the first piece is 32 MiB)
+BLOB_DOWNLOAD_CHUNK_BYTES = int(os.getenv('BLOB_DOWNLOAD_CHUNK_BYTES', str(4 * 1024 * 1024)))
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that enables TCP keep-alive on pooled sockets"""
+
+    def __init__(self, keepalive_seconds: int = 60, **kwargs):
+        self.keepalive_seconds = keepalive_seconds
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        socket_options = list(HTTPConnection.default_socket_options)
+        if self.keepalive_seconds > 0:
+            socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_seconds))
+            if hasattr(socket, 'TCP_KEEPINTVL'):
+                socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, self.keepalive_seconds // 4)))
+        kwargs['socket_options'] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def create_session(pool_size: int, keepalive_seconds: int) -> requests.Session:
+    """Build a requests session with a sized keep-alive connection pool"""
+    session = requests.Session()
+    adapter = KeepAliveHTTPAdapter(
+        keepalive_seconds=keepalive_seconds,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    with _lock:
+        _sessions.append(session)
+    return session
+
+
+def _create_transport(prefix: str) -> RequestsTransport:
+    """Build a shared transport sized by <prefix>_POOL_SIZE and <prefix>_KEEPALIVE_SECONDS"""
+    session = create_session(
+        pool_size=int(os.getenv(f'{prefix}_POOL_SIZE', '20')),
+        keepalive_seconds=int(os.getenv(f'{prefix}_KEEPALIVE_SECONDS', '60'))
+    )
+    return RequestsTransport(session=session, session_owner=False)
+
+
+def _get_or_create(key, factory):
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory()
+            _clients[key] = client
+    return client
+
+
+def get_cosmos_client() -> CosmosClient:
+    """Return the process-wide CosmosClient for the configured account, instrumented for RU and latency"""
+    if _overrides.get('cosmos') is not None:
+        return _overrides['cosmos']
+    uri = os.getenv('AZURE_COSMOS_URI')
+    key = os.getenv('AZURE_COSMOS_KEY')
+    return _get_or_create(
+        ('cosmos', uri, key),
+        lambda: cosmos_instrumentation.instrument(CosmosClient(
+            uri,
+            key,
+            transport=_create_transport('COSMOS'),
+            connection_timeout=int(os.getenv('COSMOS_CONNECTION_TIMEOUT', '10')),
+            raw_response_hook=cosmos_instrumentation.raw_response_hook
+        ))
+    )
+
+
+def get_blob_service_client() -> BlobServiceClient:
+    """Return the process-wide BlobServiceClient for the configured storage account"""
+    if _overrides.get('blob') is not None:
+        return _overrides['blob']
+    connection_string = os.getenv('AZURE_BLOB_CONNECTION_STRING')
+    return _get_or_create(
+        ('blob', connection_string),
+        lambda: BlobServiceClient.from_connection_string(
+            connection_string,
+            transport=_create_transport('BLOB'),
+            max_single_get_size=BLOB_DOWNLOAD_CHUNK_BYTES,
+            max_chunk_get_size=BLOB_DOWNLOAD_CHUNK_BYTES
+        )
+    )
+
+
+def override_clients(cosmos_client=None, blob_service_client=None) -> None:
+    """Hand out these clients instead of connecting to Azure (e.g. local stand-ins for benchmarks)
+
+    Must be called before any service is built; pass None to restore the configured client.
+    """
+    with _lock:
+        _overrides['cosmos'] = cosmos_instrumentation.instrument(cosmos_client)
+        _overrides['blob'] = blob_service_client
+
+
+def reset_connection_pools() -> None:
+    """Drop pooled sockets (e.g. after fork) while keeping the clients themselves"""
+    with _lock:
+        sessions = list(_sessions)
+    for session in sessions:
+        for adapter in session.adapters.values():
+            adapter.close()
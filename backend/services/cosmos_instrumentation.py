@@ -0,0 +1,251 @@
+"""
+Request-unit and latency accounting for every Cosmos call
+
+get_cosmos_client() hands out an InstrumentedCosmosClient, so every container a
+service opens is wrapped: each operation records its RU charge, latency, page
+count and (for queries) normalized query text, labelled with the route being
+served. Charges come from the x-ms-request-charge header of every HTTP response,
+which the client's raw_response_hook passes to record_response(). Operations
+slower than COSMOS_SLOW_QUERY_MS are logged with their activity id.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from azure.cosmos import exceptions
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv('COSMOS_SLOW_QUERY_MS', '500'))
+_slow_operations = deque(maxlen=int(os.getenv('COSMOS_SLOW_QUERY_LOG_SIZE', '100')))
+
+# Calls that return ItemPaged: the work happens while the caller iterates
+_PAGED_OPERATIONS = {'query_items', 'read_all_items', 'query_items_change_feed'}
+_POINT_OPERATIONS = {'read_item', 'read_items', 'create_item', 'upsert_item', 'replace_item', 'delete_item', 'patch_item'}
+
+# Inlined page sizes and offsets would make every page of a feed its own series
+_QUERY_NUMBERS = re.compile(r'\b(TOP|OFFSET|LIMIT)\s+\d+', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+QUERY_LABEL_LENGTH = 200
+
+_LABELS = ('route', 'container', 'operation', 'query')
+_duration = metrics.histogram(
+    'peerview_cosmos_duration_seconds', 'Time spent in Cosmos per operation', _LABELS,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+_charge = metrics.histogram(
+    'peerview_cosmos_request_charge', 'Request units charged per Cosmos operation', _LABELS,
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+_pages = metrics.histogram(
+    'peerview_cosmos_pages', 'HTTP responses (pages) per Cosmos operation', _LABELS,
+    buckets=(1, 2, 3, 5, 10, 25, 50, 100)
+)
+_errors = metrics.counter(
+    'peerview_cosmos_errors_total', 'Cosmos operations that failed, by status code',
+    ('route', 'container', 'operation', 'status')
+)
+_unattributed = metrics.counter(
+    'peerview_cosmos_unattributed_request_charge_total',
+    'Request units charged outside any container operation (e.g. container creation)', ('route',)
+)
+
+_active = threading.local()
+
+
+class _Operation:
+    __slots__ = ('container', 'operation', 'query', 'route', 'charge', 'pages', 'seconds', 'activity_id', 'finished')
+
+    def __init__(self, container: str, operation: str, query: str = ''):
+        self.container = container
+        self.operation = operation
+        self.query = query
+        self.route = metrics.current_route()
+        self.charge = 0.0
+        self.pages = 0
+        self.seconds = 0.0
+        self.activity_id = None
+        self.finished = False
+
+
+def record_response(headers) -> None:
+    """Add one HTTP response's charge to the operation running on this thread"""
+    charge = float(headers.get('x-ms-request-charge') or 0)
+    operation = getattr(_active, 'operation', None)
+    if operation is None:
+        _unattributed.inc(metrics.current_route(), amount=charge)
+        return
+    operation.charge += charge
+    operation.pages += 1
+    operation.activity_id = headers.get('x-ms-activity-id') or operation.activity_id
+
+
+def raw_response_hook(response) -> None:
+    """azure-core raw_response_hook for the CosmosClient; called for every HTTP response"""
+    record_response(response.http_response.headers)
+
+
+def normalize_query(query: Any) -> str:
+    """Query text as a metric label: one line, literal page sizes replaced by ?"""
+    text = query.get('query', '') if isinstance(query, dict) else str(query or '')
+    text = _QUERY_NUMBERS.sub(lambda match: f"{match.group(1).upper()} ?", _WHITESPACE.sub(' ', text).strip())
+    return text[:QUERY_LABEL_LENGTH]
+
+
+def _run(operation: _Operation, fn, *args, **kwargs):
+    """Call fn with operation active on this thread, adding its elapsed time"""
+    previous = getattr(_active, 'operation', None)
+    _active.operation = operation
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    except exceptions.CosmosHttpResponseError as e:
+        _errors.inc(operation.route, operation.container, operation.operation, str(e.status_code))
+        raise
+    finally:
+        operation.seconds += time.perf_counter() - started
+        _active.operation = previous
+
+
+def _finish(operation: _Operation) -> None:
+    if operation.finished:
+        return
+    operation.finished = True
+    labels = (operation.route, operation.container, operation.operation, operation.query)
+    _duration.observe(operation.seconds, *labels)
+    _charge.observe(operation.charge, *labels)
+    _pages.observe(operation.pages, *labels)
+
+    elapsed_ms = operation.seconds * 1000
+    if elapsed_ms >= SLOW_QUERY_MS:
+        entry = {
+            "route": operation.route,
+            "container": operation.container,
+            "operation": operation.operation,
+            "query": operation.query,
+            "durationMs": round(elapsed_ms, 2),
+            "requestCharge": round(operation.charge, 2),
+            "pages": operation.pages,
+            "activityId": operation.activity_id,
+            "at": time.time()
+        }
+        _slow_operations.append(entry)
+        logger.warning(
+            f"Slow Cosmos {operation.operation} on {operation.container} ({elapsed_ms:.0f} ms, "
+            f"{operation.charge:.2f} RU, {operation.pages} pages, activity {operation.activity_id}) "
+            f"for {operation.route}: {operation.query}"
+        )
+
+
+def total_request_charge() -> float:
+    """Request units charged so far in this process, attributed or not"""
+    return _charge.total() + _unattributed.total()
+
+
+def slow_operations() -> List[Dict[str, Any]]:
+    """Most recent operations over COSMOS_SLOW_QUERY_MS, oldest first"""
+    return list(_slow_operations)
+
+
+class _MeasuredIterator:
+    """Iterates a query's results or pages, charging each fetch to the query's operation"""
+
+    def __init__(self, iterator, operation: _Operation):
+        self._iterator = iterator
+        self._operation = operation
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return _run(self._operation, next, self._iterator)
+        except Exception:  # Including StopIteration at the end of the results
+            _finish(self._operation)
+            raise
+
+    def __del__(self):
+        # Abandoned part-way (e.g. a client disconnected from a streamed feed)
+        _finish(self._operation)
+
+
+class InstrumentedItemPaged:
+    def __init__(self, paged, operation: _Operation):
+        self._paged = paged
+        self._operation = operation
+
+    def __iter__(self):
+        return _MeasuredIterator(iter(self._paged), self._operation)
+
+    def by_page(self, *args, **kwargs):
+        return _MeasuredIterator(self._paged.by_page(*args, **kwargs), self._operation)
+
+    def __getattr__(self, name: str):
+        return getattr(self._paged, name)
+
+
+class InstrumentedContainer:
+    """ContainerProxy wrapper that measures every point operation and query"""
+
+    def __init__(self, container):
+        self._container = container
+        self._name = getattr(container, 'id', None) or 'unknown'
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._container, name)
+        if name in _POINT_OPERATIONS:
+            def measured(*args, **kwargs):
+                operation = _Operation(self._name, name)
+                try:
+                    return _run(operation, attr, *args, **kwargs)
+                finally:
+                    _finish(operation)
+            return measured
+        if name in _PAGED_OPERATIONS:
+            def measured_paged(*args, **kwargs):
+                query = kwargs.get('query', args[0] if args else '')
+                operation = _Operation(self._name, name, normalize_query(query) if name == 'query_items' else '')
+                return InstrumentedItemPaged(_run(operation, attr, *args, **kwargs), operation)
+            return measured_paged
+        return attr
+
+
+class InstrumentedDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def get_container_client(self, *args, **kwargs) -> InstrumentedContainer:
+        return InstrumentedContainer(self._database.get_container_client(*args, **kwargs))
+
+    def create_container(self, *args, **kwargs) -> InstrumentedContainer:
+        return InstrumentedContainer(self._database.create_container(*args, **kwargs))
+
+    def create_container_if_not_exists(self, *args, **kwargs) -> InstrumentedContainer:
+        return InstrumentedContainer(self._database.create_container_if_not_exists(*args, **kwargs))
+
+    def __getattr__(self, name: str):
+        return getattr(self._database, name)
+
+
+class InstrumentedCosmosClient:
+    """CosmosClient wrapper whose databases hand out instrumented containers"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def get_database_client(self, *args, **kwargs) -> InstrumentedDatabase:
+        return InstrumentedDatabase(self._client.get_database_client(*args, **kwargs))
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+def instrument(client: Optional[Any]) -> Optional[InstrumentedCosmosClient]:
+    """Wrap a CosmosClient (or a stand-in with the same surface); None passes through"""
+    return InstrumentedCosmosClient(client) if client is not None else None
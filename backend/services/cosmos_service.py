@@ -1,19 +1,53 @@
 import os
+import json
+import time
 import uuid
+import base64
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from azure.cosmos import CosmosClient, exceptions
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
 from dotenv import load_dotenv
+from services.cache import TTLCache
+from services.clients import get_cosmos_client
+from services.password_hasher import ServiceBusyError
+from services.stats_service import StatsService
 
 load_dotenv()
 
+# Shared by every CosmosService instance so writes made through one service
+# (e.g. AdminService moderation) invalidate reads made through another
+question_cache = TTLCache(
+    max_size=int(os.getenv('QUESTION_CACHE_SIZE', '1000')),
+    ttl_seconds=float(os.getenv('QUESTION_CACHE_TTL_SECONDS', '30')),
+    copy_values=True
+)
+
+# Answer ids are "<questionId>.<uuid>"; question ids are UUIDs and never contain a dot
+ANSWER_ID_SEPARATOR = '.'
+
+# How many times a patch is rebuilt and retried after losing an ETag race
+PATCH_MAX_ATTEMPTS = int(os.getenv('COSMOS_PATCH_MAX_ATTEMPTS', '5'))
+
+# Bounded pool shared by every CosmosService for running independent queries side by side
+QUERY_TIMEOUT_SECONDS = float(os.getenv('COSMOS_QUERY_TIMEOUT_SECONDS', '15'))
+_query_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('COSMOS_QUERY_WORKERS', '8')),
+    thread_name_prefix='cosmos-query'
+)
+# Queries queued or running across every caller; a call that would go past it is
+# shed with ServiceBusyError rather than queueing behind everyone else's work
+_query_slots = threading.BoundedSemaphore(int(os.getenv('COSMOS_QUERY_MAX_PENDING', '32')))
+
 class CosmosService:
     def __init__(self):
-        self.client = CosmosClient(
-            os.getenv('AZURE_COSMOS_URI'),
-            os.getenv('AZURE_COSMOS_KEY')
-        )
+        self.client = get_cosmos_client()
         self.database = self.client.get_database_client(os.getenv('AZURE_COSMOS_DB_NAME'))
         self.container = self.database.get_container_client(os.getenv('AZURE_COSMOS_CONTAINER_NAME'))
+        self.question_cache = question_cache
+        self.stats_service = StatsService()
     
     def get_questions(self):
         """Get all questions ordered by timestamp descending"""
@@ -27,15 +61,124 @@ class CosmosService:
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to get questions: {e.message}")
     
-    def get_question(self, question_id):
-        """Get a specific question by ID"""
+    def iter_questions(self, page_size=100):
+        """Lazily yield all questions ordered by timestamp descending, one Cosmos page at a time"""
+        try:
+            query = "SELECT * FROM c ORDER BY c.timestamp DESC"
+            pages = self.container.query_items(
+                query=query,
+                enable_cross_partition_query=True,
+                max_item_count=page_size
+            ).by_page()
+            for page in pages:
+                for item in page:
+                    yield item
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to get questions: {e.message}")
+    
+    def run_queries(self, queries, timeout=None):
+        """Run independent queries concurrently and return their results by name
+        
+        Each value in queries is either a callable, or a dict with "query" and
+        optional "parameters", "container" (defaults to the questions container)
+        and "timeout" in seconds. Latency is bounded by the slowest query rather
+        than the sum; any failure or timeout raises once every query has settled.
+        
+        A query's timeout also stops the query itself (see _query_all), and work
+        that has not started by then is skipped, so a timed-out call does not keep
+        holding pool threads. Raises ServiceBusyError, before running anything, if
+        the pool already has COSMOS_QUERY_MAX_PENDING queries queued or running.
+        """
+        default_timeout = QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+        reserved = 0
+        while reserved < len(queries) and _query_slots.acquire(blocking=False):
+            reserved += 1
+        if reserved < len(queries):
+            for _ in range(reserved):
+                _query_slots.release()
+            raise ServiceBusyError("Too many queries in progress, please retry shortly")
+        
+        started = time.monotonic()
+        futures = {}
+        for name, spec in queries.items():
+            query_timeout = default_timeout if callable(spec) else spec.get("timeout", default_timeout)
+            # Run in a copy of this context so the queries' RU charges are attributed to the calling route
+            context = contextvars.copy_context()
+            future = _query_executor.submit(context.run, self._run_query, spec, started + query_timeout)
+            future.add_done_callback(lambda _: _query_slots.release())
+            futures[name] = (future, query_timeout)
+        
+        results = {}
+        errors = []
+        for name, (future, query_timeout) in futures.items():
+            remaining = max(0.0, started + query_timeout - time.monotonic())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except (FutureTimeoutError, exceptions.CosmosClientTimeoutError):
+                future.cancel()
+                errors.append(f"{name} timed out after {query_timeout}s")
+            except exceptions.CosmosHttpResponseError as e:
+                errors.append(f"{name}: {e.message}")
+            except Exception as e:
+                errors.append(f"{name}: {str(e)}")
+        
+        if errors:
+            raise Exception(f"Failed to run queries: {'; '.join(errors)}")
+        return results
+    
+    def _run_query(self, spec, deadline):
+        """Run one run_queries entry on the pool, unless its caller has already given up"""
+        if time.monotonic() >= deadline:
+            raise exceptions.CosmosClientTimeoutError()
+        if callable(spec):
+            return spec()
+        return self._query_all(spec, deadline)
+    
+    def _query_all(self, spec, deadline):
+        """Execute one query spec from run_queries and materialize its results
+        
+        Each page request carries the time left as the SDK's client-side timeout,
+        and no page is fetched after the deadline.
+        """
+        container = spec.get("container", self.container)
+        pages = container.query_items(
+            query=spec["query"],
+            parameters=spec.get("parameters"),
+            enable_cross_partition_query=True,
+            timeout=max(0.001, deadline - time.monotonic())
+        ).by_page()
+        items = []
+        for page in pages:
+            items.extend(page)
+            if time.monotonic() >= deadline:
+                raise exceptions.CosmosClientTimeoutError()
+        return items
+    
+    def get_question(self, question_id, use_cache=True):
+        """Get a specific question by ID, served from the question cache when possible"""
+        if use_cache:
+            cached = self.question_cache.get(question_id)
+            if cached is not None:
+                return cached
         try:
-            return self.container.read_item(item=question_id, partition_key=question_id)
+            question = self.container.read_item(item=question_id, partition_key=question_id)
+            self.question_cache.put(question_id, question)
+            return question
         except exceptions.CosmosResourceNotFoundError:
+            self.question_cache.invalidate(question_id)
             return None
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to get question: {e.message}")
     
+    def cache_question(self, question):
+        """Refresh the cached copy of a question with a document just written to Cosmos"""
+        if question and question.get("id"):
+            self.question_cache.put(question["id"], question)
+    
+    def invalidate_question(self, question_id):
+        """Drop a question from the cache so the next read goes to Cosmos"""
+        self.question_cache.invalidate(question_id)
+    
     def create_question(self, user_id, title, caption, media_url, media_type="image"):
         """Create a new question"""
         try:
@@ -53,51 +196,175 @@ class CosmosService:
             }
             
             created_item = self.container.create_item(body=question)
+            self.cache_question(created_item)
+            self.stats_service.question_created(created_item)
             return created_item
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to create question: {e.message}")
     
-    def update_question(self, question_id, title, caption, media_url=None, media_type=None):
-        """Update an existing question"""
+    def update_question(self, question_id, title, caption, media_url=None, media_type=None, question=None):
+        """Update an existing question
+        
+        Pass the question document if the caller already fetched it to skip the read.
+        """
         try:
-            # Get the existing question
-            question = self.get_question(question_id)
-            if not question:
+            def build_operations(current):
+                operations = [
+                    {"op": "set", "path": "/title", "value": title},
+                    {"op": "set", "path": "/caption", "value": caption}
+                ]
+                if media_url is not None:
+                    operations.append({"op": "set", "path": "/mediaUrl", "value": media_url})
+                if media_type is not None:
+                    operations.append({"op": "set", "path": "/mediaType", "value": media_type})
+                return operations
+            
+            return self.patch_question(question_id, build_operations, question=question)
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to update question: {e.message}")
+    
+    def patch_question(self, question_id, build_operations, question=None):
+        """Apply patch operations to a question, guarded by its ETag and retried on conflict
+        
+        build_operations receives the current document and returns the operations to
+        apply, or None to abort. When the ETag no longer matches, the document is read
+        again from Cosmos and the operations rebuilt. Returns the updated document, or
+        None if the question does not exist or build_operations aborted.
+        """
+        use_cache = True
+        for _ in range(PATCH_MAX_ATTEMPTS):
+            if question is None:
+                question = self.get_question(question_id, use_cache=use_cache)
+                if not question:
+                    return None
+            
+            operations = build_operations(question)
+            if not operations:
                 return None
             
-            # Update the fields
-            question["title"] = title
-            question["caption"] = caption
-            if media_url is not None:
-                question["mediaUrl"] = media_url
-            if media_type is not None:
-                question["mediaType"] = media_type
+            try:
+                updated_item = self.container.patch_item(
+                    item=question_id,
+                    partition_key=question_id,
+                    patch_operations=operations,
+                    etag=question.get("_etag"),
+                    match_condition=MatchConditions.IfNotModified
+                )
+            except exceptions.CosmosAccessConditionFailedError:
+                # Someone else wrote first; rebuild from the latest version
+                question = None
+                use_cache = False
+                continue
+            except exceptions.CosmosResourceNotFoundError:
+                self.invalidate_question(question_id)
+                return None
             
-            # Update the question in Cosmos DB
-            updated_item = self.container.replace_item(item=question_id, body=question)
+            self.cache_question(updated_item)
             return updated_item
-        except exceptions.CosmosHttpResponseError as e:
-            raise Exception(f"Failed to update question: {e.message}")
+        
+        self.invalidate_question(question_id)
+        raise Exception("Question is being modified concurrently, please retry")
     
     def get_questions_paginated(self, page=1, limit=20):
         """Get questions with pagination"""
         try:
-            offset = (page - 1) * limit
-            query = f"SELECT * FROM c WHERE (NOT IS_DEFINED(c.moderated) OR c.moderated = false) ORDER BY c.timestamp DESC OFFSET {offset} LIMIT {limit}"
             items = list(self.container.query_items(
-                query=query,
+                query=self._page_query(page, limit),
                 enable_cross_partition_query=True
             ))
             return items
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to get questions: {e.message}")
     
-    def delete_question(self, question_id):
-        """Delete a question"""
+    @staticmethod
+    def _page_query(page, limit):
+        """Offset query for a page of unmoderated questions"""
+        offset = (page - 1) * limit
+        return f"SELECT * FROM c WHERE (NOT IS_DEFINED(c.moderated) OR c.moderated = false) ORDER BY c.timestamp DESC OFFSET {offset} LIMIT {limit}"
+    
+    def get_questions_by_cursor(self, cursor=None, limit=20):
+        """Get a page of questions after a keyset cursor and the cursor for the next page
+        
+        The cursor records the timestamp of the last question returned and the ids
+        already seen at that timestamp, so every page is a bounded range read no
+        matter how deep the client has paged.
+        """
+        try:
+            query, parameters = self._cursor_query(cursor, limit)
+            items = list(self.container.query_items(
+                query=query,
+                parameters=parameters,
+                enable_cross_partition_query=True
+            ))
+            return items, self._next_cursor(cursor, items, limit)
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to get questions: {e.message}")
+    
+    @classmethod
+    def _cursor_query(cls, cursor, limit):
+        """Query and parameters for the page of questions after cursor"""
+        before_timestamp, seen_ids = cls._decode_cursor(cursor) if cursor else (None, [])
+        
+        query = f"SELECT TOP {limit} * FROM c WHERE (NOT IS_DEFINED(c.moderated) OR c.moderated = false)"
+        parameters = []
+        if before_timestamp is not None:
+            query += " AND c.timestamp <= @timestamp AND NOT ARRAY_CONTAINS(@seenIds, c.id)"
+            parameters = [
+                {"name": "@timestamp", "value": before_timestamp},
+                {"name": "@seenIds", "value": seen_ids}
+            ]
+        query += " ORDER BY c.timestamp DESC"
+        return query, parameters
+    
+    @classmethod
+    def _next_cursor(cls, cursor, items, limit):
+        """Cursor for the page after items, or None when items was the last page"""
+        if len(items) < limit:
+            return None
+        before_timestamp, seen_ids = cls._decode_cursor(cursor) if cursor else (None, [])
+        last_timestamp = items[-1]["timestamp"]
+        # Carry over ids from the previous page when the whole page shares one timestamp
+        boundary_ids = seen_ids if last_timestamp == before_timestamp else []
+        boundary_ids = boundary_ids + [item["id"] for item in items if item["timestamp"] == last_timestamp]
+        return cls._encode_cursor(last_timestamp, boundary_ids)
+    
+    @staticmethod
+    def _encode_cursor(timestamp, seen_ids):
+        """Encode a keyset position as an opaque URL-safe token"""
+        payload = json.dumps({"t": timestamp, "ids": seen_ids}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def _decode_cursor(cursor):
+        """Decode a token produced by _encode_cursor, raising ValueError if it is malformed"""
         try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            timestamp = payload["t"]
+            seen_ids = payload["ids"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError("Invalid cursor") from e
+        if not isinstance(timestamp, str) or not isinstance(seen_ids, list):
+            raise ValueError("Invalid cursor")
+        return timestamp, seen_ids
+    
+    def delete_question(self, question_id, question=None):
+        """Delete a question
+        
+        Pass the question document if the caller already fetched it to skip the read.
+        """
+        try:
+            if question is None:
+                question = self.get_question(question_id)
+                if not question:
+                    return False
+            
             self.container.delete_item(item=question_id, partition_key=question_id)
+            self.invalidate_question(question_id)
+            self.stats_service.question_deleted(question)
             return True
         except exceptions.CosmosResourceNotFoundError:
+            self.invalidate_question(question_id)
             return False
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to delete question: {e.message}")
@@ -105,34 +372,51 @@ class CosmosService:
     def add_answer(self, question_id, user_id, text_response, media_url=None):
         """Add an answer to a question"""
         try:
-            # Get the existing question
-            question = self.get_question(question_id)
-            if not question:
-                return None
-            
-            # Create new answer
             answer = {
-                "answerId": str(uuid.uuid4()),
+                "answerId": self.make_answer_id(question_id),
                 "userId": user_id,
                 "mediaUrl": media_url,
                 "textResponse": text_response,
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            # Add answer to the question
-            question["answers"].append(answer)
-            question["status"] = "answered"
+            previous = {}
+            
+            def build_operations(question):
+                previous["status"] = question.get("status")
+                return [
+                    {"op": "add", "path": "/answers/-", "value": answer},
+                    {"op": "set", "path": "/status", "value": "answered"}
+                ]
             
-            # Update the question in Cosmos DB
-            updated_item = self.container.replace_item(item=question_id, body=question)
+            updated_item = self.patch_question(question_id, build_operations)
+            if not updated_item:
+                return None
+            
+            self.stats_service.status_changed(previous["status"], "answered", answers_delta=1)
             return answer
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to add answer: {e.message}")
     
-    def update_answer(self, answer_id, user_id, text_response, media_url, user_role):
-        """Update an existing answer"""
+    @staticmethod
+    def make_answer_id(question_id):
+        """Build an answer id that embeds its question id so the answer can be located with a point read"""
+        return f"{question_id}{ANSWER_ID_SEPARATOR}{uuid.uuid4()}"
+    
+    def find_question_for_answer(self, answer_id, use_cache=True):
+        """Get the question document that contains an answer"""
         try:
-            # Find the question containing this answer
+            question_id, separator, _ = answer_id.rpartition(ANSWER_ID_SEPARATOR)
+            if separator and question_id:
+                question = self.get_question(question_id, use_cache=use_cache)
+                if use_cache and question and self.find_answer_index(question, answer_id) is None:
+                    # The cached copy may predate the answer
+                    question = self.get_question(question_id, use_cache=False)
+                if question and self.find_answer_index(question, answer_id) is not None:
+                    return question
+                return None
+            
+            # Answers created before ids embedded the question id need a cross-partition lookup
             query = "SELECT * FROM c WHERE ARRAY_CONTAINS(c.answers, {'answerId': @answerId}, true)"
             parameters = [{"name": "@answerId", "value": answer_id}]
             
@@ -141,31 +425,49 @@ class CosmosService:
                 parameters=parameters,
                 enable_cross_partition_query=True
             ))
-            
-            if not questions:
+            return questions[0] if questions else None
+        except exceptions.CosmosHttpResponseError as e:
+            raise Exception(f"Failed to find answer: {e.message}")
+    
+    @staticmethod
+    def find_answer_index(question, answer_id):
+        """Return the position of an answer inside a question document, or None"""
+        for i, answer in enumerate(question.get("answers", [])):
+            if answer.get("answerId") == answer_id:
+                return i
+        return None
+    
+    def update_answer(self, answer_id, user_id, text_response, media_url, user_role):
+        """Update an existing answer"""
+        try:
+            question = self.find_question_for_answer(answer_id)
+            if not question:
                 return None
             
-            question = questions[0]
-            
-            # Find and update the specific answer
-            for i, answer in enumerate(question["answers"]):
-                if answer["answerId"] == answer_id:
-                    # Check permissions
-                    if user_role != 'admin' and answer["userId"] != user_id:
-                        return None
-                    
-                    # Update answer
-                    answer["textResponse"] = text_response
-                    if media_url is not None:
-                        answer["mediaUrl"] = media_url
-                    answer["updatedAt"] = datetime.utcnow().isoformat()
-                    answer["updatedBy"] = user_id
-                    
-                    # Update the question
-                    updated_question = self.container.replace_item(item=question["id"], body=question)
-                    return answer
+            def build_operations(current):
+                index = self.find_answer_index(current, answer_id)
+                if index is None:
+                    return None
+                
+                # Check permissions
+                if user_role != 'admin' and current["answers"][index]["userId"] != user_id:
+                    return None
+                
+                operations = [
+                    {"op": "set", "path": f"/answers/{index}/textResponse", "value": text_response},
+                    {"op": "set", "path": f"/answers/{index}/updatedAt", "value": datetime.utcnow().isoformat()},
+                    {"op": "set", "path": f"/answers/{index}/updatedBy", "value": user_id}
+                ]
+                if media_url is not None:
+                    operations.append({"op": "set", "path": f"/answers/{index}/mediaUrl", "value": media_url})
+                return operations
             
-            return None
+            updated_question = self.patch_question(question["id"], build_operations, question=question)
+            if not updated_question:
+                return None
+            
+            index = self.find_answer_index(updated_question, answer_id)
+            return updated_question["answers"][index] if index is not None else None
             
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to update answer: {e.message}")
@@ -173,40 +475,35 @@ class CosmosService:
     def delete_answer(self, answer_id, user_id, user_role):
         """Delete an answer"""
         try:
-            # Find the question containing this answer
-            query = "SELECT * FROM c WHERE ARRAY_CONTAINS(c.answers, {'answerId': @answerId}, true)"
-            parameters = [{"name": "@answerId", "value": answer_id}]
+            question = self.find_question_for_answer(answer_id)
+            if not question:
+                return False
             
-            questions = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            previous = {}
             
-            if not questions:
-                return False
+            def build_operations(current):
+                index = self.find_answer_index(current, answer_id)
+                if index is None:
+                    return None
+                
+                # Check permissions
+                if user_role != 'admin' and current["answers"][index]["userId"] != user_id:
+                    return None
+                
+                previous["status"] = current.get("status")
+                operations = [{"op": "remove", "path": f"/answers/{index}"}]
+                
+                # Update question status if no answers left
+                if len(current["answers"]) == 1:
+                    operations.append({"op": "set", "path": "/status", "value": "pending"})
+                return operations
             
-            question = questions[0]
-            
-            # Find and remove the specific answer
-            for i, answer in enumerate(question["answers"]):
-                if answer["answerId"] == answer_id:
-                    # Check permissions
-                    if user_role != 'admin' and answer["userId"] != user_id:
-                        return False
-                    
-                    # Remove answer
-                    question["answers"].pop(i)
-                    
-                    # Update question status if no answers left
-                    if len(question["answers"]) == 0:
-                        question["status"] = "pending"
-                    
-                    # Update the question
-                    self.container.replace_item(item=question["id"], body=question)
-                    return True
+            updated_question = self.patch_question(question["id"], build_operations, question=question)
+            if not updated_question:
+                return False
             
-            return False
+            self.stats_service.status_changed(previous["status"], updated_question.get("status"), answers_delta=-1)
+            return True
             
         except exceptions.CosmosHttpResponseError as e:
             raise Exception(f"Failed to delete answer: {e.message}")
\ No newline at end of file
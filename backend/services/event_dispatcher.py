@@ -0,0 +1,240 @@
+"""
+Durable background event dispatcher
+Events are appended to a local SQLite spool on the request path and delivered in
+batches by background workers, with exponential backoff and jitter on failure.
+Worker processes on the same host share the spool file and can deliver events
+left behind by another (e.g. one that restarted), since rows are claimed with a
+short lease. The spool uses WAL, which needs a local filesystem: never place it
+on a network share or share it between hosts.
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS events_due ON events (dead, next_attempt_at);
+"""
+
+
+class EventDispatcher:
+    def __init__(self, spool_path: str, send_batch: Callable[[List[Dict[str, Any]]], None],
+                 batch_size: int = 10, workers: int = 1, max_attempts: int = 8,
+                 base_delay: float = 1.0, max_delay: float = 300.0, lease_seconds: float = 60.0):
+        """send_batch must raise to signal that the whole batch should be retried
+
+        Exceptions carrying a retry_after attribute (seconds) postpone the batch
+        without counting towards max_attempts.
+        """
+        self.spool_path = spool_path
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._started_pid = None
+        self.sent = 0
+        self.failed_attempts = 0
+        self.dead_lettered = 0
+        self.deferred = 0
+        self.last_error = None
+        self.last_sent_at = None
+
+        spool_dir = os.path.dirname(self.spool_path)
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.spool_path, timeout=10, isolation_level=None)
+
+    def start(self) -> None:
+        """Start the worker threads in this process (idempotent, fork-aware)"""
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            # Threads do not survive fork, so a child starts its own
+            self._started_pid = os.getpid()
+            self._stopping = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'event-dispatcher-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the worker threads once their current batch is sent, waiting up to timeout
+
+        Events still in the spool stay there for the next process to deliver.
+        """
+        with self._lock:
+            if self._started_pid != os.getpid():
+                return
+            self._started_pid = None
+            threads = self._threads
+            self._threads = []
+        self._stopping.set()
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def enqueue(self, payload: Dict[str, Any]) -> None:
+        """Durably record an event for delivery; returns once it is on disk"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO events (payload, enqueued_at, next_attempt_at) VALUES (?, ?, ?)",
+                (json.dumps(payload), now, now)
+            )
+        self.start()
+        self._wakeup.set()
+
+    def _claim_batch(self) -> List[tuple]:
+        """Lease up to batch_size due events so no other worker sends them concurrently"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, payload, attempts FROM events "
+                "WHERE dead = 0 AND next_attempt_at <= ? AND lease_until <= ? "
+                "ORDER BY id LIMIT ?",
+                (now, now, self.batch_size)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE events SET lease_until = ? WHERE id = ?",
+                    [(now + self.lease_seconds, row[0]) for row in rows]
+                )
+            conn.execute("COMMIT")
+            return rows
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _backoff(self, attempts: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempts)))
+
+    def _run(self) -> None:
+        stopping = self._stopping
+        while not stopping.is_set():
+            try:
+                rows = self._claim_batch()
+            except Exception as e:
+                logger.warning(f"Event spool unavailable: {str(e)}")
+                rows = []
+
+            if not rows:
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self.send_batch([json.loads(payload) for _, payload, _ in rows])
+            except Exception as e:
+                try:
+                    if getattr(e, 'retry_after', None) is not None:
+                        self._defer(rows, e.retry_after)
+                    else:
+                        self._record_failure(rows, str(e))
+                except Exception as spool_error:
+                    logger.warning(f"Failed to record event delivery failure: {str(spool_error)}")
+                continue
+
+            try:
+                with closing(self._connect()) as conn:
+                    conn.executemany("DELETE FROM events WHERE id = ?", [(row[0],) for row in rows])
+            except Exception as e:
+                # Delivery is at-least-once: the lease expires and the batch is sent again
+                logger.warning(f"Failed to remove delivered events from spool: {str(e)}")
+            with self._lock:
+                self.sent += len(rows)
+                self.last_sent_at = time.time()
+
+    def _defer(self, rows: List[tuple], delay: float) -> None:
+        """Push a batch back without spending a delivery attempt (e.g. while a circuit is open)"""
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                "UPDATE events SET next_attempt_at = ?, lease_until = 0 WHERE id = ?",
+                [(time.time() + delay + random.uniform(0, self.base_delay), row[0]) for row in rows]
+            )
+        with self._lock:
+            self.deferred += len(rows)
+
+    def _record_failure(self, rows: List[tuple], error: str) -> None:
+        now = time.time()
+        updates = []
+        dead = 0
+        for event_id, _, attempts in rows:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                dead += 1
+                updates.append((attempts, now, 1, error, event_id))
+            else:
+                updates.append((attempts, now + self._backoff(attempts), 0, error, event_id))
+
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                "UPDATE events SET attempts = ?, next_attempt_at = ?, lease_until = 0, dead = ?, last_error = ? WHERE id = ?",
+                updates
+            )
+        with self._lock:
+            self.failed_attempts += len(rows)
+            self.dead_lettered += dead
+            self.last_error = error
+        logger.warning(f"Event delivery failed for {len(rows)} event(s): {error}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, delivery lag and failure counters"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            depth, oldest = conn.execute(
+                "SELECT COUNT(1), MIN(enqueued_at) FROM events WHERE dead = 0"
+            ).fetchone()
+            dead = conn.execute("SELECT COUNT(1) FROM events WHERE dead = 1").fetchone()[0]
+
+        with self._lock:
+            return {
+                "queueDepth": depth,
+                "deadLetters": dead,
+                "lagSeconds": round(now - oldest, 3) if oldest else 0.0,
+                "sent": self.sent,
+                "failedAttempts": self.failed_attempts,
+                "deadLettered": self.dead_lettered,
+                "deferred": self.deferred,
+                "lastError": self.last_error,
+                "lastSentAt": self.last_sent_at,
+                "workersRunning": self._started_pid == os.getpid()
+            }
@@ -5,155 +5,181 @@ Handles integration with Azure Logic Apps for automated workflows
 
 import os
 import json
-import requests
+import socket
+import tempfile
+import threading
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from services.circuit_breaker import CircuitBreaker
+from services.clients import create_session
+from services.event_dispatcher import EventDispatcher
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+# One keep-alive session and breaker per process, shared by every LogicAppService
+_session = create_session(
+    pool_size=int(os.getenv('LOGIC_APP_POOL_SIZE', '4')),
+    keepalive_seconds=int(os.getenv('LOGIC_APP_KEEPALIVE_SECONDS', '60'))
+)
+_breaker = CircuitBreaker(
+    'logic_app',
+    failure_threshold=int(os.getenv('LOGIC_APP_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.getenv('LOGIC_APP_BREAKER_RESET_SECONDS', '30'))
+)
+
+def get_dispatcher(send_batch) -> EventDispatcher:
+    """Return the process-wide Logic App event dispatcher, creating it on first use"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            # SQLite WAL needs local disk, so each instance keeps its own spool rather
+            # than sharing one on the /home network share
+            instance = os.getenv('WEBSITE_INSTANCE_ID') or socket.gethostname()
+            default_spool = os.path.join(tempfile.gettempdir(), f'peerview-logic-app-spool-{instance}.db')
+            _dispatcher = EventDispatcher(
+                spool_path=os.getenv('LOGIC_APP_SPOOL_PATH', default_spool),
+                send_batch=send_batch,
+                batch_size=int(os.getenv('LOGIC_APP_BATCH_SIZE', '1')),
+                workers=int(os.getenv('LOGIC_APP_DISPATCH_WORKERS', '2')),
+                max_attempts=int(os.getenv('LOGIC_APP_MAX_ATTEMPTS', '8')),
+                base_delay=float(os.getenv('LOGIC_APP_RETRY_BASE_SECONDS', '1')),
+                max_delay=float(os.getenv('LOGIC_APP_RETRY_MAX_SECONDS', '300'))
+            )
+    return _dispatcher
+
+def start_dispatcher() -> None:
+    """Start delivery threads in this process if a dispatcher has been created (e.g. after fork)"""
+    if _dispatcher is not None:
+        _dispatcher.start()
+
+def stop_dispatcher(timeout: float = 10.0) -> None:
+    """Let delivery threads finish their current batch before the process exits"""
+    if _dispatcher is not None:
+        _dispatcher.stop(timeout)
 
 class LogicAppService:
     def __init__(self):
         self.logic_app_url = os.getenv('AZURE_LOGIC_APP_URL')
         self.logic_app_key = os.getenv('AZURE_LOGIC_APP_KEY')
-    
+        self.timeout = float(os.getenv('LOGIC_APP_TIMEOUT_SECONDS', '30'))
+        self.session = _session
+        self.breaker = _breaker
+        self.dispatcher = get_dispatcher(self._send_batch)
+
     def trigger_question_workflow(self, question_data: Dict[str, Any]) -> bool:
         """
-        Trigger Logic App workflow when a new question is created
+        Queue the Logic App workflow for a newly created question
         """
-        try:
-            if not self.logic_app_url:
-                print("Logic App URL not configured")
-                return False
-            
-            # Prepare payload for Logic App
-            payload = {
-                "questionId": question_data.get("id"),
-                "userId": question_data.get("userId"),
-                "title": question_data.get("title"),
-                "mediaUrl": question_data.get("mediaUrl"),
-                "mediaType": question_data.get("mediaType"),
-                "timestamp": question_data.get("timestamp"),
-                "triggerType": "new_question"
-            }
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            # Add authentication if key is provided
-            if self.logic_app_key:
-                headers["Authorization"] = f"Bearer {self.logic_app_key}"
-            
-            # Send request to Logic App
-            response = requests.post(
-                self.logic_app_url,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                print(f"Logic App triggered successfully for question {question_data.get('id')}")
-                return True
-            else:
-                print(f"Logic App trigger failed: {response.status_code} - {response.text}")
-                return False
-                
-        except Exception as e:
-            print(f"Error triggering Logic App: {str(e)}")
-            return False
-    
+        # Prepare payload for Logic App
+        return self._enqueue({
+            "questionId": question_data.get("id"),
+            "userId": question_data.get("userId"),
+            "title": question_data.get("title"),
+            "mediaUrl": question_data.get("mediaUrl"),
+            "mediaType": question_data.get("mediaType"),
+            "timestamp": question_data.get("timestamp"),
+            "triggerType": "new_question"
+        })
+
     def trigger_answer_workflow(self, question_id: str, answer_data: Dict[str, Any]) -> bool:
         """
-        Trigger Logic App workflow when a new answer is added
+        Queue the Logic App workflow for a newly added answer
         """
-        try:
-            if not self.logic_app_url:
-                print("Logic App URL not configured")
-                return False
-            
-            # Prepare payload for Logic App
-            payload = {
-                "questionId": question_id,
-                "answerId": answer_data.get("answerId"),
-                "userId": answer_data.get("userId"),
-                "textResponse": answer_data.get("textResponse"),
-                "mediaUrl": answer_data.get("mediaUrl"),
-                "timestamp": answer_data.get("timestamp"),
-                "triggerType": "new_answer"
-            }
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            # Add authentication if key is provided
-            if self.logic_app_key:
-                headers["Authorization"] = f"Bearer {self.logic_app_key}"
-            
-            # Send request to Logic App
-            response = requests.post(
-                self.logic_app_url,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                print(f"Logic App triggered successfully for answer {answer_data.get('answerId')}")
-                return True
-            else:
-                print(f"Logic App trigger failed: {response.status_code} - {response.text}")
-                return False
-                
-        except Exception as e:
-            print(f"Error triggering Logic App: {str(e)}")
-            return False
-    
+        # Prepare payload for Logic App
+        return self._enqueue({
+            "questionId": question_id,
+            "answerId": answer_data.get("answerId"),
+            "userId": answer_data.get("userId"),
+            "textResponse": answer_data.get("textResponse"),
+            "mediaUrl": answer_data.get("mediaUrl"),
+            "timestamp": answer_data.get("timestamp"),
+            "triggerType": "new_answer"
+        })
+
     def trigger_moderation_workflow(self, content_data: Dict[str, Any]) -> bool:
         """
-        Trigger Logic App workflow for content moderation
+        Queue the Logic App workflow for content moderation
+        """
+        # Prepare payload for Logic App
+        return self._enqueue({
+            "targetType": content_data.get("targetType"),
+            "targetId": content_data.get("targetId"),
+            "action": content_data.get("action"),
+            "moderatorId": content_data.get("moderatorId"),
+            "timestamp": datetime.utcnow().isoformat(),
+            "triggerType": "content_moderation"
+        })
+
+    def _enqueue(self, payload: Dict[str, Any]) -> bool:
+        """
+        Spool an event for background delivery so the request never waits on the webhook
         """
         try:
             if not self.logic_app_url:
                 print("Logic App URL not configured")
                 return False
-            
-            # Prepare payload for Logic App
-            payload = {
-                "targetType": content_data.get("targetType"),
-                "targetId": content_data.get("targetId"),
-                "action": content_data.get("action"),
-                "moderatorId": content_data.get("moderatorId"),
-                "timestamp": datetime.utcnow().isoformat(),
-                "triggerType": "content_moderation"
-            }
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            # Add authentication if key is provided
-            if self.logic_app_key:
-                headers["Authorization"] = f"Bearer {self.logic_app_key}"
-            
-            # Send request to Logic App
-            response = requests.post(
-                self.logic_app_url,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                print(f"Logic App triggered successfully for moderation action")
-                return True
-            else:
-                print(f"Logic App trigger failed: {response.status_code} - {response.text}")
-                return False
-                
+
+            self.dispatcher.enqueue(payload)
+            return True
+
         except Exception as e:
-            print(f"Error triggering Logic App: {str(e)}")
+            print(f"Error queueing Logic App event: {str(e)}")
             return False
-    
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {
+            "Content-Type": "application/json"
+        }
+
+        # Add authentication if key is provided
+        if self.logic_app_key:
+            headers["Authorization"] = f"Bearer {self.logic_app_key}"
+        return headers
+
+    def _send_batch(self, payloads: List[Dict[str, Any]]) -> None:
+        """
+        Deliver queued events; raises so the dispatcher retries the batch on failure
+        """
+        # A batch of one keeps the original single-event payload the workflow expects.
+        # LOGIC_APP_BATCH_SIZE > 1 requires a workflow whose HTTP trigger schema also
+        # accepts {"triggerType": "batch", "events": [...]} and loops over events
+        if len(payloads) == 1:
+            body = payloads[0]
+        else:
+            body = {"triggerType": "batch", "events": payloads}
+
+        response = self._call('post', self.logic_app_url, data=json.dumps(body), headers=self._headers())
+
+        if response.status_code not in (200, 202):
+            raise Exception(f"Logic App trigger failed: {response.status_code} - {response.text[:200]}")
+
+    def _call(self, method: str, url: str, **kwargs):
+        """
+        Send a request over the pooled session through the circuit breaker
+
+        Timeouts, connection errors and 5xx/429 responses count as failures;
+        while the breaker is open this raises CircuitOpenError without any I/O.
+        """
+        self.breaker.before_call()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get_dispatcher_stats(self) -> Dict[str, Any]:
+        """
+        Queue depth, lag and failure metrics for the event dispatcher, plus breaker state
+        """
+        return dict(self.dispatcher.stats(), circuitBreaker=self.breaker.stats())
+
     def get_workflow_status(self, run_id: str) -> Optional[Dict[str, Any]]:
         """
         Get the status of a Logic App workflow run
@@ -161,22 +187,22 @@ class LogicAppService:
         try:
             if not self.logic_app_url or not run_id:
                 return None
-            
+
             # Construct status URL (this would need to be configured based on your Logic App setup)
             status_url = f"{self.logic_app_url}/runs/{run_id}"
-            
+
             headers = {}
             if self.logic_app_key:
                 headers["Authorization"] = f"Bearer {self.logic_app_key}"
-            
-            response = requests.get(status_url, headers=headers, timeout=30)
-            
+
+            response = self._call('get', status_url, headers=headers)
+
             if response.status_code == 200:
                 return response.json()
             else:
                 print(f"Failed to get workflow status: {response.status_code}")
                 return None
-                
+
         except Exception as e:
             print(f"Error getting workflow status: {str(e)}")
-            return None
\ No newline at end of file
+            return None
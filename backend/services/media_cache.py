@@ -0,0 +1,302 @@
+"""
+On-disk cache for proxied media
+Blob names are immutable UUIDs, so a cached copy never needs revalidating against
+storage. Entries are evicted least-recently-used once the byte budget is exceeded.
+A miss that streams the whole blob is teed into the cache, so filling costs no
+extra download; a lock file per blob keeps workers sharing the directory from
+filling the same blob twice, and each worker picks up the others' fills from disk.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+METADATA_SUFFIX = '.meta.json'
+
+# A fill rewrites its temp file continuously, so one untouched this long was abandoned
+STALE_FILL_SECONDS = 3600
+
+# Blob names we are willing to turn into file names (no separators, no leading dot)
+CACHEABLE_NAME = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9._-]{0,254}$')
+
+
+class MediaCache:
+    """LRU disk cache of blob contents plus a small JSON metadata sidecar per blob
+
+    The byte budget is tracked per process; workers sharing a directory each see
+    the files that were present when they started plus the ones they filled, so
+    the directory can grow to workers x max_bytes before evictions catch up.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_object_bytes: int, fill_workers: int = 2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self._entries = OrderedDict()  # blob name -> size in bytes, oldest first
+        self._total_bytes = 0
+        self._filling = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=fill_workers, thread_name_prefix='media-cache-fill')
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.fill_errors = 0
+        self.evictions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from files left by a previous process, oldest access first"""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if name.startswith('.fill-'):
+                # Sibling workers may be mid-fill; only remove downloads abandoned by a dead process
+                path = os.path.join(self.directory, name)
+                try:
+                    if now - os.path.getmtime(path) > STALE_FILL_SECONDS:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not name.endswith(METADATA_SUFFIX):
+                continue
+            blob_name = name[:-len(METADATA_SUFFIX)]
+            data_path = self._data_path(blob_name)
+            try:
+                stat = os.stat(data_path)
+            except FileNotFoundError:
+                self._remove_files(blob_name)
+                continue
+            entries.append((stat.st_atime, blob_name, stat.st_size))
+
+        for _, blob_name, size in sorted(entries):
+            self._entries[blob_name] = size
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def is_cacheable(blob_name: str) -> bool:
+        return bool(CACHEABLE_NAME.match(blob_name)) and not blob_name.endswith(METADATA_SUFFIX)
+
+    def _data_path(self, blob_name: str) -> str:
+        return os.path.join(self.directory, blob_name)
+
+    def _metadata_path(self, blob_name: str) -> str:
+        return os.path.join(self.directory, blob_name + METADATA_SUFFIX)
+
+    def _lock_path(self, blob_name: str) -> str:
+        # .fill- prefix: swept by _load_index like any other abandoned fill file
+        return os.path.join(self.directory, '.fill-' + blob_name + '.lock')
+
+    def get(self, blob_name: str) -> Optional[Dict[str, Any]]:
+        """Return {path, content_type, content_length, etag, last_modified} for a cached blob, or None"""
+        if not self.is_cacheable(blob_name):
+            return None
+        with self._lock:
+            known = blob_name in self._entries
+            if known:
+                self._entries.move_to_end(blob_name)
+        if not known and not self._adopt(blob_name):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            with open(self._metadata_path(blob_name)) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            # Another process evicted it or the sidecar is damaged; treat as a miss
+            self._forget(blob_name)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        metadata['path'] = self._data_path(blob_name)
+        return metadata
+
+    def _adopt(self, blob_name: str) -> bool:
+        """Index a copy another worker cached after this one loaded its index"""
+        try:
+            os.stat(self._metadata_path(blob_name))
+            size = os.stat(self._data_path(blob_name)).st_size
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            if blob_name not in self._entries:
+                self._entries[blob_name] = size
+                self._total_bytes += size
+                self._evict()
+            return blob_name in self._entries
+
+    def _claim(self, blob_name: str, size: int) -> bool:
+        """Become the one writer for blob_name across every process sharing the directory
+
+        A lock file created with O_EXCL marks the fill; False if the blob is too
+        large, already cached, or being filled by this or another process.
+        """
+        if size > self.max_object_bytes or not self.is_cacheable(blob_name):
+            return False
+        with self._lock:
+            if blob_name in self._entries or blob_name in self._filling:
+                return False
+            self._filling.add(blob_name)
+
+        lock_path = self._lock_path(blob_name)
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > STALE_FILL_SECONDS:
+                        # Left by a process that died mid-fill
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                break
+            if self._adopt(blob_name):
+                # Finished by another process before we got the lock
+                self._release(blob_name)
+                return False
+            return True
+
+        with self._lock:
+            self._filling.discard(blob_name)
+        return False
+
+    def _release(self, blob_name: str) -> None:
+        try:
+            os.remove(self._lock_path(blob_name))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._filling.discard(blob_name)
+
+    def tee(self, blob_name: str, metadata: Dict[str, Any], chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield chunks of the whole blob, writing them into the cache on the way through
+
+        Only one process fills a given blob; everyone else just streams. If the
+        caller stops early (e.g. the client disconnects) nothing is cached.
+        """
+        if not self._claim(blob_name, metadata.get('content_length') or 0):
+            return iter(chunks)
+        return self._write_through(blob_name, metadata, chunks)
+
+    def fill_async(self, blob_name: str, metadata: Dict[str, Any], open_chunks: Callable[[], Iterable[bytes]]) -> None:
+        """Download a blob into the cache in the background unless it is cached or being filled
+
+        For misses that cannot be teed (a partial range); the lock file makes
+        concurrent misses in any worker trigger a single download.
+        """
+        if self._claim(blob_name, metadata.get('content_length') or 0):
+            self._executor.submit(self._fill, blob_name, metadata, open_chunks)
+
+    def _fill(self, blob_name: str, metadata: Dict[str, Any], open_chunks: Callable[[], Iterable[bytes]]) -> None:
+        try:
+            for _ in self._write_through(blob_name, metadata, open_chunks()):
+                pass
+        except Exception:
+            pass  # Counted and logged by _write_through
+
+    def _write_through(self, blob_name: str, metadata: Dict[str, Any], chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Copy a claimed fill to a temp file as it is yielded, then rename it into place
+
+        Readers never see a partial copy; the lock is released however this ends,
+        including when the consumer stops early (e.g. the client disconnects).
+        """
+        temp_path = temp_metadata_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.fill-')
+            lock_path = self._lock_path(blob_name)
+            written = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written += len(chunk)
+                    # Keep the lock fresh so a long fill is never mistaken for an abandoned one
+                    os.utime(lock_path)
+                    yield chunk
+
+            if written != metadata.get('content_length', written):
+                raise ValueError(f"received {written} of {metadata['content_length']} bytes")
+
+            fd, temp_metadata_path = tempfile.mkstemp(dir=self.directory, prefix='.fill-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    'content_type': metadata['content_type'],
+                    'content_length': written,
+                    'etag': metadata['etag'],
+                    'last_modified': metadata['last_modified']
+                }, f)
+            # Data first: the sidecar is what marks an entry as present
+            os.replace(temp_path, self._data_path(blob_name))
+            os.replace(temp_metadata_path, self._metadata_path(blob_name))
+            temp_path = temp_metadata_path = None
+
+            with self._lock:
+                self._entries[blob_name] = written
+                self._total_bytes += written
+                self.fills += 1
+                self._evict()
+        except Exception as e:
+            with self._lock:
+                self.fill_errors += 1
+            logger.warning(f"Failed to cache media {blob_name}: {str(e)}")
+            raise
+        finally:
+            for path in (temp_path, temp_metadata_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            self._release(blob_name)
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until under budget; caller holds the lock"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            blob_name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            self._remove_files(blob_name)
+
+    def _forget(self, blob_name: str) -> None:
+        with self._lock:
+            size = self._entries.pop(blob_name, None)
+            if size is not None:
+                self._total_bytes -= size
+        self._remove_files(blob_name)
+
+    def _remove_files(self, blob_name: str) -> None:
+        for path in (self._metadata_path(blob_name), self._data_path(blob_name)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "fills": self.fills,
+                "fillErrors": self.fill_errors,
+                "evictions": self.evictions,
+                "inFlightFills": len(self._filling),
+                "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
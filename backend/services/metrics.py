@@ -0,0 +1,316 @@
+"""
+In-process metrics with Prometheus text exposition
+
+Histograms and counters are keyed by label values and rendered by
+render_prometheus() for the /metrics endpoint. The route being served is held in
+a context variable so code deep inside a request (e.g. a Cosmos call) can
+attribute its cost to the endpoint that caused it.
+
+With METRICS_DIR set (gunicorn.conf.py sets it for every master), each process
+also writes its series to <pid>.json there every METRICS_FLUSH_SECONDS, and a
+scrape renders the sum over every file, so whichever worker answers reports the
+whole server. A worker that exits folds its final numbers into archive.json,
+so counters never go backwards when workers are recycled.
+"""
+
+import os
+import json
+import glob
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Label sets per metric before new ones are folded into a single "other" series
+MAX_SERIES = int(os.getenv('METRICS_MAX_SERIES', '2000'))
+
+# Seconds between writes of this process's series to METRICS_DIR
+FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+ARCHIVE_FILE = 'archive.json'
+
+_route = contextvars.ContextVar('metrics_route', default=None)
+
+
+def set_route(route: Optional[str]) -> None:
+    """Attribute metrics recorded in this context to route (None clears it)"""
+    _route.set(route)
+
+
+def current_route() -> str:
+    return _route.get() or 'background'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, values: Tuple[str, ...]) -> Tuple[str, ...]:
+        if values in self._series or len(self._series) < MAX_SERIES:
+            return values
+        return tuple('other' for _ in self.labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """This metric's definition and series, as JSON-serializable data"""
+        with self._lock:
+            series = [[list(key), value] for key, value in self._copy_series().items()]
+        return {"kind": self.kind, "help": self.help_text, "labels": list(self.labels), "series": series}
+
+    def _copy_series(self) -> dict:
+        return dict(self._series)
+
+    def _format_labels(self, values: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *values: str, amount: float = 1) -> None:
+        with self._lock:
+            key = self._key(values)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def merge(self, key: Tuple[str, ...], value: float) -> None:
+        """Add another process's value for a label set"""
+        self._series[key] = self._series.get(key, 0) + value
+
+    def total(self) -> float:
+        """Sum across every label set"""
+        with self._lock:
+            return sum(self._series.values())
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = dict(self._series)
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in sorted(series.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str], buckets: Iterable[float]):
+        super().__init__(name, help_text, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value: float, *values: str) -> None:
+        with self._lock:
+            key = self._key(values)
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def merge(self, key: Tuple[str, ...], data: list) -> None:
+        """Add another process's bucket counts, sum and count for a label set"""
+        counts, total, count = data
+        series = self._series.get(key)
+        if series is None:
+            self._series[key] = [list(counts), total, count]
+            return
+        series[0] = [mine + theirs for mine, theirs in zip(series[0], counts)]
+        series[1] += total
+        series[2] += count
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(super().snapshot(), buckets=self.buckets)
+
+    def _copy_series(self) -> dict:
+        return {key: [list(counts), total, count] for key, (counts, total, count) in self._series.items()}
+
+    def total(self) -> float:
+        """Sum of every observation across every label set"""
+        with self._lock:
+            return sum(total for _, total, _ in self._series.values())
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + [float('inf')], counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                bucket_labels = self._format_labels(key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+_metrics: Dict[str, _Metric] = {}
+_metrics_lock = threading.Lock()
+
+
+def counter(name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+    """Return the process-wide counter called name, creating it on first use"""
+    return _register(name, lambda: Counter(name, help_text, labels))
+
+
+def histogram(name: str, help_text: str, labels: Iterable[str] = (), buckets: Iterable[float] = ()) -> Histogram:
+    """Return the process-wide histogram called name, creating it on first use"""
+    return _register(name, lambda: Histogram(name, help_text, labels, buckets))
+
+
+def _register(name, factory):
+    with _metrics_lock:
+        if name not in _metrics:
+            _metrics[name] = factory()
+        return _metrics[name]
+
+
+def snapshot() -> Dict[str, Any]:
+    """Every metric recorded in this process, keyed by name"""
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def reset() -> None:
+    """Drop every series recorded so far, e.g. in a worker forked after the master recorded some"""
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    for metric in metrics:
+        with metric._lock:
+            metric._series.clear()
+
+
+def _metrics_dir() -> Optional[str]:
+    return os.getenv('METRICS_DIR') or None
+
+
+@contextmanager
+def _dir_lock(exclusive: bool):
+    """Serialize archiving (exclusive) against scrapes (shared) across processes"""
+    import fcntl
+    with open(os.path.join(_metrics_dir(), '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _process_file() -> str:
+    return os.path.join(_metrics_dir(), f"{os.getpid()}.json")
+
+
+def flush() -> None:
+    """Write this process's series to METRICS_DIR (no-op when it is unset)"""
+    if _metrics_dir():
+        _write_json(_process_file(), snapshot())
+
+
+_flusher_stop = threading.Event()
+_flusher = None
+
+
+def start_flusher() -> None:
+    """Flush every FLUSH_SECONDS on a daemon thread; call in each worker after fork"""
+    global _flusher
+    if not _metrics_dir() or (_flusher is not None and _flusher.is_alive()):
+        return
+    _flusher_stop.clear()
+
+    def run():
+        while not _flusher_stop.wait(FLUSH_SECONDS):
+            try:
+                flush()
+            except OSError:
+                pass
+
+    _flusher = threading.Thread(target=run, name='metrics-flush', daemon=True)
+    _flusher.start()
+
+
+def mark_process_dead() -> None:
+    """Fold this process's final series into the archive and remove its own file"""
+    if not _metrics_dir():
+        return
+    _flusher_stop.set()
+    if _flusher is not None:
+        _flusher.join()
+    archive_path = os.path.join(_metrics_dir(), ARCHIVE_FILE)
+    with _dir_lock(exclusive=True):
+        merged = _merge([_read_json(archive_path), snapshot()])
+        _write_json(archive_path, {name: metric.snapshot() for name, metric in merged.items()})
+        try:
+            os.remove(_process_file())
+        except FileNotFoundError:
+            pass
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _merge(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, _Metric]:
+    """Sum snapshots from several processes into fresh metric objects"""
+    merged = {}
+    for data in snapshots:
+        for name, metric in data.items():
+            target = merged.get(name)
+            if target is None:
+                if metric["kind"] == 'histogram':
+                    target = Histogram(name, metric["help"], metric["labels"], metric["buckets"])
+                else:
+                    target = Counter(name, metric["help"], metric["labels"])
+                merged[name] = target
+            for key, value in metric["series"]:
+                target.merge(tuple(key), value)
+    return merged
+
+
+def render_prometheus() -> str:
+    """Every metric in the Prometheus text exposition format (version 0.0.4)
+
+    With METRICS_DIR set this is the sum over every process writing there;
+    other workers' numbers are at most METRICS_FLUSH_SECONDS old.
+    """
+    if _metrics_dir():
+        flush()
+        with _dir_lock(exclusive=False):
+            paths = glob.glob(os.path.join(_metrics_dir(), '*.json'))
+            metrics = list(_merge(_read_json(path) for path in paths).values())
+    else:
+        with _metrics_lock:
+            metrics = list(_metrics.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
@@ -0,0 +1,108 @@
+"""
+Bounded bcrypt worker pool
+Password hashing runs on a small dedicated pool instead of the request thread,
+so a burst of logins queues here rather than starving every other request.
+Once too many hashes are pending, new ones are shed with ServiceBusyError.
+"""
+
+import time
+import bcrypt
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+
+class ServiceBusyError(Exception):
+    """Raised when work is shed because a bounded pool is saturated"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 8, retry_after: int = 1):
+        if not 4 <= rounds <= 31:
+            raise ValueError("bcrypt rounds must be between 4 and 31")
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        # Counts queued plus running hashes; bcrypt releases the GIL, so workers run in parallel
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.total_queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.total_work_seconds = 0.0
+
+    def hash(self, password: str) -> str:
+        """Hash a password at the configured cost"""
+        return self._submit(self._hash, password)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        """Check a password against a stored hash of any cost"""
+        return self._submit(self._verify, password, password_hash)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True when a stored hash was made at a cost other than the configured one"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def _hash(self, password: str) -> str:
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    @staticmethod
+    def _verify(password: str, password_hash: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceBusyError("Authentication is busy, please retry shortly", self.retry_after)
+
+        with self._lock:
+            self.in_flight += 1
+        queued_at = time.monotonic()
+        try:
+            return self._executor.submit(self._timed, fn, queued_at, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _timed(self, fn, queued_at: float, *args):
+        started_at = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            finished_at = time.monotonic()
+            queue_seconds = started_at - queued_at
+            with self._lock:
+                self.completed += 1
+                self.total_queue_seconds += queue_seconds
+                self.max_queue_seconds = max(self.max_queue_seconds, queue_seconds)
+                self.total_work_seconds += finished_at - started_at
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool size, saturation and queue-time metrics"""
+        with self._lock:
+            completed = self.completed
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "maxPending": self.max_pending,
+                "inFlight": self.in_flight,
+                "completed": completed,
+                "rejected": self.rejected,
+                "avgQueueMs": round(self.total_queue_seconds / completed * 1000, 2) if completed else 0.0,
+                "maxQueueMs": round(self.max_queue_seconds * 1000, 2),
+                "avgHashMs": round(self.total_work_seconds / completed * 1000, 2) if completed else 0.0
+            }
@@ -0,0 +1,76 @@
+"""
+Lazily constructed, process-wide service instances
+
+Building a service opens Azure clients and may create containers, so nothing is
+built at import time. Each service is constructed on first use, shared by every
+caller in the process, and timed so startup cost can be reported.
+"""
+
+import time
+import threading
+from typing import Any, Callable, Dict
+
+_instances = {}
+_build_ms = {}
+_factories = {}
+# Reentrant so a factory may itself ask for another service
+_lock = threading.RLock()
+_startup = {}
+
+
+class LazyService:
+    """Stands in for a service and builds the real one on first attribute access"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._name = name
+        _factories.setdefault(name, factory)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(get_service(self._name), attr)
+
+    def __repr__(self) -> str:
+        state = 'built' if self._name in _instances else 'not built'
+        return f"<LazyService {self._name} ({state})>"
+
+
+def lazy(name: str, factory: Callable[[], Any]) -> LazyService:
+    """Register a service factory and return a proxy for it"""
+    return LazyService(name, factory)
+
+
+def get_service(name: str) -> Any:
+    """Return the shared instance of a registered service, building it if needed"""
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _lock:
+        instance = _instances.get(name)
+        if instance is None:
+            started = time.perf_counter()
+            instance = _factories[name]()
+            _build_ms[name] = round((time.perf_counter() - started) * 1000, 2)
+            _instances[name] = instance
+    return instance
+
+
+def warm_up() -> None:
+    """Build every registered service now (e.g. in a preloading master before fork)"""
+    for name in list(_factories):
+        get_service(name)
+
+
+def record_startup(phase: str, started: float) -> float:
+    """Record how long a startup phase took since started (a perf_counter value); returns ms"""
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    _startup[phase] = elapsed_ms
+    return elapsed_ms
+
+
+def startup_report() -> Dict[str, Any]:
+    """Startup phase timings and the build time of every service constructed so far"""
+    with _lock:
+        return {
+            "phasesMs": dict(_startup),
+            "servicesBuiltMs": dict(_build_ms),
+            "servicesPending": [name for name in _factories if name not in _instances]
+        }
@@ -0,0 +1,216 @@
+"""
+Materialized system statistics
+Keeps a single counters document up to date as content changes so the admin
+dashboard reads one document instead of scanning the questions container.
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from azure.cosmos import PartitionKey, exceptions
+from dotenv import load_dotenv
+from services.clients import get_cosmos_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STATS_CONTAINER_NAME = os.getenv('AZURE_COSMOS_STATS_CONTAINER_NAME', 'Stats')
+STATS_DOCUMENT_ID = 'system'
+
+# How long a reconciled counters document is trusted before it is recomputed
+RECONCILE_SECONDS = int(os.getenv('STATS_RECONCILE_SECONDS', '3600'))
+
+# Per-day question buckets summed for "recent questions": today and the days before it (UTC)
+RECENT_DAYS = 7
+
+COUNTER_FIELDS = (
+    "totalUsers",
+    "totalQuestions",
+    "totalAnswers",
+    "answeredQuestions",
+    "pendingQuestions",
+    "storageBytes"
+)
+
+# Question status -> counter tracking it
+STATUS_COUNTERS = {
+    "answered": "answeredQuestions",
+    "pending": "pendingQuestions"
+}
+
+
+class StatsService:
+    def __init__(self):
+        self.database = get_cosmos_client().get_database_client(os.getenv('AZURE_COSMOS_DB_NAME'))
+        self.reconcile_interval = RECONCILE_SECONDS
+        self._container = None
+
+    @property
+    def container(self):
+        """Stats container, created on first use"""
+        if self._container is None:
+            self._container = self.database.create_container_if_not_exists(
+                id=STATS_CONTAINER_NAME,
+                partition_key=PartitionKey(path='/id')
+            )
+        return self._container
+
+    @staticmethod
+    def day_key(timestamp: str) -> str:
+        """Day bucket (YYYY-MM-DD) for an ISO timestamp"""
+        return timestamp[:10]
+
+    @staticmethod
+    def recent_since() -> str:
+        """First day bucket of the recent window, so it spans exactly RECENT_DAYS buckets"""
+        return (datetime.utcnow() - timedelta(days=RECENT_DAYS - 1)).date().isoformat()
+
+    @staticmethod
+    def _increment_operations(day_deltas: Optional[Dict[str, int]], deltas: Dict[str, int]) -> list:
+        operations = [
+            {"op": "incr", "path": f"/{field}", "value": delta}
+            for field, delta in deltas.items() if delta
+        ]
+        operations += [
+            {"op": "incr", "path": f"/questionsByDay/{day}", "value": delta}
+            for day, delta in (day_deltas or {}).items() if delta
+        ]
+        return operations
+
+    def _patch(self, operations: list) -> Optional[Dict[str, Any]]:
+        """Apply operations to the counters document; returns the document after the last patch"""
+        document = None
+        # Cosmos allows at most 10 operations per patch
+        for start in range(0, len(operations), 10):
+            document = self.container.patch_item(
+                item=STATS_DOCUMENT_ID,
+                partition_key=STATS_DOCUMENT_ID,
+                patch_operations=operations[start:start + 10]
+            )
+        return document
+
+    def increment(self, day_deltas: Optional[Dict[str, int]] = None, **deltas: int) -> None:
+        """Atomically add deltas to the counters document
+
+        Failures are logged rather than raised: a missed update only skews the
+        counters until the next reconciliation and must never fail the user's write.
+        """
+        operations = self._increment_operations(day_deltas, deltas)
+        if not operations:
+            return
+
+        try:
+            self._patch(operations)
+        except exceptions.CosmosResourceNotFoundError:
+            # Nothing to increment yet; the first dashboard read reconciles from scratch
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to update stats counters: {str(e)}")
+
+    def question_created(self, question: Dict[str, Any]) -> None:
+        """Record a new question"""
+        deltas = {"totalQuestions": 1}
+        status_counter = STATUS_COUNTERS.get(question.get("status"))
+        if status_counter:
+            deltas[status_counter] = 1
+        self.increment(day_deltas={self.day_key(question["timestamp"]): 1}, **deltas)
+
+    def question_deleted(self, question: Dict[str, Any]) -> None:
+        """Record a deleted question and the answers that went with it"""
+        deltas = {
+            "totalQuestions": -1,
+            "totalAnswers": -len(question.get("answers", []))
+        }
+        status_counter = STATUS_COUNTERS.get(question.get("status"))
+        if status_counter:
+            deltas[status_counter] = -1
+
+        day_deltas = {}
+        if question.get("timestamp"):
+            day_deltas[self.day_key(question["timestamp"])] = -1
+
+        self.increment(day_deltas=day_deltas, **deltas)
+
+    def status_changed(self, old_status: Optional[str], new_status: Optional[str], answers_delta: int = 0) -> None:
+        """Record a question moving between statuses and/or gaining or losing answers"""
+        deltas = {"totalAnswers": answers_delta}
+        if old_status != new_status:
+            if old_status in STATUS_COUNTERS:
+                deltas[STATUS_COUNTERS[old_status]] = -1
+            if new_status in STATUS_COUNTERS:
+                deltas[STATUS_COUNTERS[new_status]] = deltas.get(STATUS_COUNTERS[new_status], 0) + 1
+        self.increment(**deltas)
+
+    def read_stats(self) -> Optional[Dict[str, Any]]:
+        """Return the counters document however old it is, or None if it is missing"""
+        try:
+            return self.container.read_item(item=STATS_DOCUMENT_ID, partition_key=STATS_DOCUMENT_ID)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    def get_stats(self) -> Optional[Dict[str, Any]]:
+        """Return the counters document, or None if it is missing or due for reconciliation"""
+        stats = self.read_stats()
+        return stats if stats and self.is_current(stats, self.reconcile_interval) else None
+
+    @staticmethod
+    def is_current(stats: Dict[str, Any], reconcile_interval: int = RECONCILE_SECONDS) -> bool:
+        """Whether a counters document was reconciled recently enough to be trusted"""
+        reconciled_at = stats.get("reconciledAt")
+        if not reconciled_at:
+            return False
+        age = datetime.utcnow() - datetime.fromisoformat(reconciled_at)
+        return age.total_seconds() <= reconcile_interval
+
+    @staticmethod
+    def build_stats(counters: Dict[str, Any], questions_by_day: Dict[str, int]) -> Dict[str, Any]:
+        """A counters document holding freshly computed values"""
+        stats = {field: counters.get(field, 0) for field in COUNTER_FIELDS}
+        stats.update({
+            "id": STATS_DOCUMENT_ID,
+            "questionsByDay": questions_by_day,
+            "reconciledAt": datetime.utcnow().isoformat()
+        })
+        return stats
+
+    def save_stats(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Bring the counters document to freshly computed values (from build_stats)
+
+        The difference from the stored document is applied as incr patches, with
+        reconciledAt set by the last one, so it needs no etag and cannot lose a
+        race with steady increments. Increments landing between the count and
+        this read are cancelled out and come back at the next reconciliation.
+        """
+        current = self.read_stats()
+        if current is None:
+            try:
+                return self.container.create_item(body=stats)
+            except exceptions.CosmosResourceExistsError:
+                # Another reconcile created it first; correct that one instead
+                current = self.read_stats()
+
+        counted_days = stats["questionsByDay"]
+        stored_days = current.get("questionsByDay", {})
+        since = self.recent_since()
+        day_deltas = {
+            day: counted_days.get(day, 0) - stored_days.get(day, 0)
+            for day in set(counted_days) | set(stored_days) if day >= since
+        }
+        deltas = {field: stats[field] - current.get(field, 0) for field in COUNTER_FIELDS}
+
+        operations = self._increment_operations(day_deltas, deltas)
+        # Buckets that slid out of the window are no longer counted, so drop them
+        operations += [
+            {"op": "remove", "path": f"/questionsByDay/{day}"}
+            for day in stored_days if day < since
+        ]
+        operations.append({"op": "set", "path": "/reconciledAt", "value": stats["reconciledAt"]})
+        return self._patch(operations)
+
+    @classmethod
+    def recent_questions(cls, stats: Dict[str, Any]) -> int:
+        """Questions created today and on the previous RECENT_DAYS - 1 days (UTC), from the per-day buckets"""
+        since = cls.recent_since()
+        return sum(count for day, count in stats.get("questionsByDay", {}).items() if day >= since)
@@ -0,0 +1,261 @@
+"""
+Trace sampling and non-blocking export for Application Insights
+
+TRACE_SAMPLING_MODE picks how requests are sampled:
+  probability   keep TRACE_SAMPLE_RATE of requests, decided when the request starts
+  rate_limited  as probability, but never more than TRACE_MAX_PER_SECOND traces a second
+  tail          trace every request, then export only errors, requests slower than
+                TRACE_SLOW_MS and TRACE_SAMPLE_RATE of the rest
+TRACE_ROUTE_RATES overrides the sample rate per route, e.g. "GET /health=0,GET /api/feed=0.05".
+
+Finished spans go through a bounded in-memory queue drained by a background thread
+in batches, so a request never waits on the exporter; when the queue is full spans
+are dropped and counted instead.
+"""
+
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from opencensus.ext.flask.flask_middleware import FlaskMiddleware
+from opencensus.trace import base_exporter
+from opencensus.trace.samplers import AlwaysOnSampler, Sampler
+from opencensus.trace.span import SpanKind
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_MODES = ('probability', 'rate_limited', 'tail')
+
+_spans = metrics.counter(
+    'peerview_trace_spans_total',
+    'Finished trace spans by outcome (sampled_out, queued, dropped, exported, export_failed)',
+    ('outcome',)
+)
+
+
+def parse_route_rates(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "METHOD /rule=rate,..." into {route: rate}"""
+    rates = {}
+    for entry in (spec or '').split(','):
+        if '=' not in entry:
+            continue
+        route, rate = entry.rsplit('=', 1)
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+class TokenBucket:
+    """Allows rate events per second on average, with bursts up to one second's worth"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class HeadSampler(Sampler):
+    """Decides at request start, by per-route rate and an optional traces-per-second cap"""
+
+    def __init__(self, rate: float = 1.0, route_rates: Optional[Dict[str, float]] = None,
+                 max_per_second: Optional[float] = None, route_fn: Optional[Callable[[], str]] = None):
+        self.rate = rate
+        self.route_rates = route_rates or {}
+        self.limiter = TokenBucket(max_per_second) if max_per_second else None
+        self.route_fn = route_fn
+
+    def should_sample(self, span_context=None) -> bool:
+        rate = self.route_rates.get(self.route_fn(), self.rate) if self.route_rates and self.route_fn else self.rate
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return False
+        return self.limiter.acquire() if self.limiter else True
+
+
+class TailPolicy:
+    """Keeps whole traces that failed or were slow, plus a sample of the rest
+
+    Child spans end before the request's server span, so they wait in a bounded
+    buffer until it arrives and the decision for the trace is made.
+    """
+
+    def __init__(self, slow_ms: float, rate: float = 0.0, route_rates: Optional[Dict[str, float]] = None,
+                 max_pending_traces: int = 1000):
+        self.slow_ms = slow_ms
+        self.rate = rate
+        self.route_rates = route_rates or {}
+        self.max_pending_traces = max_pending_traces
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, span_datas: List[Any]) -> List[Any]:
+        """The spans to export now; the rest are buffered or sampled out"""
+        kept = []
+        for span_data in span_datas:
+            with self._lock:
+                if span_data.span_kind != SpanKind.SERVER:
+                    self._pending.setdefault(span_data.context.trace_id, []).append(span_data)
+                    if len(self._pending) > self.max_pending_traces:
+                        _, evicted = self._pending.popitem(last=False)
+                        _spans.inc('sampled_out', amount=len(evicted))
+                    continue
+                trace = self._pending.pop(span_data.context.trace_id, []) + [span_data]
+
+            if self.keep(span_data):
+                kept.extend(trace)
+            else:
+                _spans.inc('sampled_out', amount=len(trace))
+        return kept
+
+    def keep(self, root) -> bool:
+        attributes = root.attributes or {}
+        status_code = attributes.get('http.status_code')
+        if root.status is not None and root.status.code not in (None, 0):
+            return True
+        if status_code is not None and int(status_code) >= 500:
+            return True
+        if _duration_ms(root) >= self.slow_ms:
+            return True
+        route = f"{attributes.get('http.method', '')} {attributes.get('http.route') or attributes.get('http.path', '')}"
+        rate = self.route_rates.get(route, self.rate)
+        return rate > 0 and random.random() < rate
+
+
+def _duration_ms(span_data) -> float:
+    try:
+        start = datetime.strptime(span_data.start_time, '%Y-%m-%dT%H:%M:%S.%fZ')
+        end = datetime.strptime(span_data.end_time, '%Y-%m-%dT%H:%M:%S.%fZ')
+    except (TypeError, ValueError):
+        return 0.0
+    return (end - start).total_seconds() * 1000
+
+
+class BatchExporter(base_exporter.Exporter):
+    """Queues spans for a background thread that hands them to exporter.emit in batches"""
+
+    def __init__(self, exporter, max_queue: int = 2048, batch_size: int = 100,
+                 flush_interval: float = 5.0, tail_policy: Optional[TailPolicy] = None):
+        self.exporter = exporter
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.tail_policy = tail_policy
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self._started_pid = None
+        self.queued = 0
+        self.dropped = 0
+        self.exported = 0
+        self.failed = 0
+
+    def export(self, span_datas) -> None:
+        """Called on the request thread when spans end; never blocks"""
+        if self.tail_policy:
+            span_datas = self.tail_policy.filter(span_datas)
+        if not span_datas:
+            return
+        self._start()
+        for span_data in span_datas:
+            try:
+                self._queue.put_nowait(span_data)
+                outcome = 'queued'
+            except queue.Full:
+                outcome = 'dropped'
+            with self._counts_lock:
+                setattr(self, outcome, getattr(self, outcome) + 1)
+            _spans.inc(outcome)
+
+    def emit(self, span_datas) -> None:
+        self.exporter.emit(span_datas)
+
+    def _start(self) -> None:
+        """Start the export thread in this process (fork-aware, like the event dispatcher)"""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            # Threads and queue locks do not survive fork, so a child starts afresh
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._started_pid = os.getpid()
+            threading.Thread(target=self._run, name='trace-exporter', daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.exporter.emit(batch)
+                with self._counts_lock:
+                    self.exported += len(batch)
+                _spans.inc('exported', amount=len(batch))
+            except Exception as e:
+                with self._counts_lock:
+                    self.failed += len(batch)
+                _spans.inc('export_failed', amount=len(batch))
+                logger.warning(f"Failed to export {len(batch)} spans: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queueDepth": self._queue.qsize(),
+            "maxQueue": self.max_queue,
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "exported": self.exported,
+            "failed": self.failed,
+            "exporterRunning": self._started_pid == os.getpid()
+        }
+
+
+def instrument_flask(app, exporter, route_fn: Callable[[], str]) -> BatchExporter:
+    """Trace app's requests per the TRACE_* settings, exporting through a BatchExporter around exporter"""
+    mode = os.getenv('TRACE_SAMPLING_MODE', 'probability')
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f"TRACE_SAMPLING_MODE must be one of {', '.join(SAMPLING_MODES)}")
+    rate = float(os.getenv('TRACE_SAMPLE_RATE', '1.0' if mode == 'probability' else '0.1'))
+    route_rates = parse_route_rates(os.getenv('TRACE_ROUTE_RATES'))
+
+    tail_policy = None
+    if mode == 'tail':
+        sampler = AlwaysOnSampler()
+        tail_policy = TailPolicy(slow_ms=float(os.getenv('TRACE_SLOW_MS', '1000')), rate=rate, route_rates=route_rates)
+    else:
+        max_per_second = float(os.getenv('TRACE_MAX_PER_SECOND', '10')) if mode == 'rate_limited' else None
+        sampler = HeadSampler(rate=rate, route_rates=route_rates, max_per_second=max_per_second, route_fn=route_fn)
+
+    batch_exporter = BatchExporter(
+        exporter,
+        max_queue=int(os.getenv('TRACE_EXPORT_QUEUE_SIZE', '2048')),
+        batch_size=int(os.getenv('TRACE_EXPORT_BATCH_SIZE', '100')),
+        flush_interval=float(os.getenv('TRACE_EXPORT_INTERVAL_SECONDS', '5')),
+        tail_policy=tail_policy
+    )
+    FlaskMiddleware(app, exporter=batch_exporter, sampler=sampler)
+    app.extensions['telemetry'] = batch_exporter
+    logger.info(f"Tracing with {mode} sampling (rate {rate}, route overrides {route_rates})")
+    return batch_exporter
@@ -0,0 +1,224 @@
+"""
+Resumable uploads for large media
+A session records the target blob and expected size; each chunk is staged as a
+block whose id encodes its byte offset, so the committed offset can always be
+recovered from the blob's uncommitted block list after a dropped connection.
+Expired sessions are discarded, staged blocks included, when next accessed or
+by sweep_expired().
+"""
+
+import os
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobBlock, ContentSettings
+from services.blob_service import BlobService
+
+SESSION_PREFIX = 'upload-sessions/'
+
+
+class UploadSessionError(Exception):
+    """Upload session failure carrying the HTTP status the API should return"""
+
+    def __init__(self, message: str, status_code: int = 400, offset: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class UploadSessionService:
+    def __init__(self, stats_service=None):
+        self.blob_service = BlobService(stats_service=stats_service)
+        self.session_ttl = timedelta(hours=float(os.getenv('UPLOAD_SESSION_TTL_HOURS', '24')))
+        self.max_chunk_size = int(os.getenv('UPLOAD_SESSION_MAX_CHUNK_BYTES', str(16 * 1024 * 1024)))
+        self.max_file_size = int(os.getenv('UPLOAD_SESSION_MAX_FILE_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+    def _blob_client(self, blob_name: str):
+        return self.blob_service.blob_service_client.get_blob_client(
+            container=self.blob_service.container_name,
+            blob=blob_name
+        )
+
+    def create_session(self, user_id: str, file_name: str, size: int) -> Dict[str, Any]:
+        """Start a resumable upload and return the session with its current offset"""
+        if size <= 0 or size > self.max_file_size:
+            raise UploadSessionError(f"size must be between 1 and {self.max_file_size} bytes")
+
+        file_extension = file_name.split('.')[-1] if '.' in file_name else ''
+        # Media is served same-origin, so never trust a client-supplied type (e.g. text/html)
+        content_type = self.blob_service._get_content_type(file_extension)
+        upload_id = str(uuid.uuid4())
+        session = {
+            "uploadId": upload_id,
+            "userId": user_id,
+            "blobName": f"{uuid.uuid4()}.{file_extension}",
+            "fileName": file_name,
+            "contentType": content_type,
+            "size": size,
+            "createdAt": datetime.utcnow().isoformat(),
+            "expiresAt": (datetime.utcnow() + self.session_ttl).isoformat()
+        }
+
+        try:
+            self._blob_client(SESSION_PREFIX + upload_id + '.json').upload_blob(
+                json.dumps(session),
+                overwrite=False,
+                content_settings=ContentSettings(content_type='application/json')
+            )
+        except Exception as e:
+            raise Exception(f"Failed to create upload session: {str(e)}")
+
+        return self._describe(session, 0)
+
+    def _load_session(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        """Read a session, enforcing ownership and expiry"""
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise UploadSessionError("Upload session not found", 404)
+        try:
+            raw = self._blob_client(SESSION_PREFIX + upload_id + '.json').download_blob().readall()
+        except ResourceNotFoundError:
+            raise UploadSessionError("Upload session not found", 404)
+        session = json.loads(raw)
+
+        if session["userId"] != user_id:
+            raise UploadSessionError("Upload session not found", 404)
+        if datetime.fromisoformat(session["expiresAt"]) <= datetime.utcnow():
+            self._discard(session)
+            raise UploadSessionError("Upload session has expired", 410)
+        return session
+
+    def _delete_session(self, upload_id: str) -> None:
+        try:
+            self._blob_client(SESSION_PREFIX + upload_id + '.json').delete_blob()
+        except ResourceNotFoundError:
+            pass
+
+    def _discard(self, session: Dict[str, Any]) -> None:
+        """Delete an abandoned session and the chunks staged for it"""
+        blob_client = self._blob_client(session["blobName"])
+        try:
+            # Already committed (the session outlived complete()); keep the media
+            blob_client.get_blob_properties()
+        except ResourceNotFoundError:
+            try:
+                _, uncommitted = blob_client.get_block_list('uncommitted')
+            except ResourceNotFoundError:
+                uncommitted = []
+            if uncommitted:
+                # Uncommitted blocks cannot be deleted directly; committing an empty
+                # block list discards them, leaving an empty blob to delete
+                blob_client.commit_block_list([])
+                blob_client.delete_blob()
+        self._delete_session(session["uploadId"])
+
+    def sweep_expired(self) -> int:
+        """Discard every expired session; returns how many were removed"""
+        try:
+            container_client = self.blob_service.blob_service_client.get_container_client(self.blob_service.container_name)
+            removed = 0
+            for blob in container_client.list_blobs(name_starts_with=SESSION_PREFIX):
+                try:
+                    session = json.loads(self._blob_client(blob.name).download_blob().readall())
+                except ResourceNotFoundError:
+                    continue
+                if datetime.fromisoformat(session["expiresAt"]) <= datetime.utcnow():
+                    self._discard(session)
+                    removed += 1
+            return removed
+        except Exception as e:
+            raise Exception(f"Failed to sweep upload sessions: {str(e)}")
+
+    def _staged_blocks(self, session: Dict[str, Any]) -> list:
+        """Contiguous staged blocks from offset 0, as (offset, size, block id)"""
+        try:
+            _, uncommitted = self._blob_client(session["blobName"]).get_block_list('uncommitted')
+        except ResourceNotFoundError:
+            return []
+
+        by_offset = {}
+        for block in uncommitted:
+            try:
+                offset = int(block.id)
+            except ValueError:
+                continue
+            by_offset[offset] = block
+
+        blocks = []
+        offset = 0
+        while offset in by_offset:
+            block = by_offset[offset]
+            blocks.append((offset, block.size, block.id))
+            offset += block.size
+        return blocks
+
+    def _committed_offset(self, session: Dict[str, Any]) -> int:
+        blocks = self._staged_blocks(session)
+        return blocks[-1][0] + blocks[-1][1] if blocks else 0
+
+    def get_session(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        """Return the session and the offset the client should resume from"""
+        session = self._load_session(upload_id, user_id)
+        return self._describe(session, self._committed_offset(session))
+
+    def put_chunk(self, upload_id: str, user_id: str, offset: int, data: bytes) -> Dict[str, Any]:
+        """Stage the chunk that starts at offset; offset must equal the committed offset"""
+        session = self._load_session(upload_id, user_id)
+        committed = self._committed_offset(session)
+
+        if offset != committed:
+            raise UploadSessionError(f"Expected chunk at offset {committed}", 409, offset=committed)
+        if not data:
+            raise UploadSessionError("Chunk is empty")
+        if len(data) > self.max_chunk_size:
+            raise UploadSessionError(f"Chunk exceeds {self.max_chunk_size} bytes", 413)
+        if offset + len(data) > session["size"]:
+            raise UploadSessionError("Chunk extends past the declared file size")
+
+        try:
+            self._blob_client(session["blobName"]).stage_block(
+                self.blob_service.make_block_id(offset),
+                data
+            )
+        except Exception as e:
+            raise Exception(f"Failed to store chunk: {str(e)}")
+
+        return self._describe(session, offset + len(data))
+
+    def complete(self, upload_id: str, user_id: str) -> Dict[str, Any]:
+        """Commit every staged chunk as the final blob and close the session"""
+        session = self._load_session(upload_id, user_id)
+        blocks = self._staged_blocks(session)
+        committed = blocks[-1][0] + blocks[-1][1] if blocks else 0
+        if committed != session["size"]:
+            raise UploadSessionError(f"Upload incomplete: {committed} of {session['size']} bytes received", 409, offset=committed)
+
+        try:
+            self._blob_client(session["blobName"]).commit_block_list(
+                [BlobBlock(block_id=block_id) for _, _, block_id in blocks],
+                content_settings=ContentSettings(content_type=session["contentType"])
+            )
+        except Exception as e:
+            raise Exception(f"Failed to complete upload: {str(e)}")
+
+        self._delete_session(upload_id)
+        if self.blob_service.stats_service is not None:
+            self.blob_service.stats_service.increment(storageBytes=session["size"])
+        return {
+            "url": f"/api/media/{session['blobName']}",
+            "blobName": session["blobName"],
+            "size": session["size"]
+        }
+
+    def _describe(self, session: Dict[str, Any], offset: int) -> Dict[str, Any]:
+        return {
+            "uploadId": session["uploadId"],
+            "blobName": session["blobName"],
+            "size": session["size"],
+            "offset": offset,
+            "maxChunkSize": self.max_chunk_size,
+            "expiresAt": session["expiresAt"]
+        }
@@ -9,15 +9,16 @@ import sys
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(__file__))
 
-try:
-    from app import app
-    print("Flask app imported successfully")
-except Exception as e:
-    print(f"Error importing app: {e}")
-    sys.exit(1)
+backend_dir = os.path.dirname(os.path.abspath(__file__))
 
 if __name__ == "__main__":
     # Azure App Service will set the PORT environment variable
     port = int(os.environ.get('PORT', 8000))
-    print(f"Starting Flask app on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    print(f"Starting Flask app with gunicorn on port {port}")
+    # Workers, preloading, graceful shutdown and request limits are set in gunicorn.conf.py
+    os.chdir(backend_dir)
+    os.execvp(sys.executable, [
+        sys.executable, '-m', 'gunicorn',
+        '--config', os.path.join(backend_dir, 'gunicorn.conf.py'),
+        'app:app'
+    ])
\ No newline at end of file